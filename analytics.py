@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Submission totals, grouped by country, nameserver or input source.
+
+count_submissions() splits a time window into shards and pages through the
+listed submissions of each from its own thread, with query cursors so that
+submissions sharing a timestamp are neither skipped nor counted twice. Only
+the newest submission of each class C network is counted, whichever shard it
+is found in. Input sources come from a second, key range sharded walk over
+the SubmissionConfig children of the counted submissions.
+
+It runs against the datastore of the app, or through remote_api from a tool
+such as tools/get_country_totals.py; jobs.count_submissions does the same
+grouping as a mapreduce job, without the class C deduplication.
+
+Nameservers are grouped by key name (the IP); nameserver_names() turns them
+into names with one batch get.
+"""
+import datetime
+import threading
+
+from google.appengine.ext import db
+
+import models
+
+GROUP_BYS = ('country', 'best_nameserver', 'primary_nameserver', 'input_source')
+BATCH_SIZE = 200
+# Most keys a single get takes.
+MAX_GET_KEYS = 1000
+
+
+def _KeyName(key):
+  if not key:
+    return None
+  return key.name() or str(key.id())
+
+
+def group_values(submission, group_bys):
+  """Return the value of each of group_bys for a submission, as a dict.
+
+  input_source is left out; it is stored on the SubmissionConfig.
+  """
+  values = {}
+  for group_by in group_bys:
+    if group_by == 'country':
+      values[group_by] = submission.country
+    elif group_by == 'best_nameserver':
+      values[group_by] = _KeyName(
+          models.Submission.best_nameserver.get_value_for_datastore(submission))
+    elif group_by == 'primary_nameserver':
+      values[group_by] = _KeyName(
+          models.Submission.primary_nameserver.get_value_for_datastore(submission))
+  return values
+
+
+class Totals(object):
+  """Counts per group value, for each group_by."""
+
+  def __init__(self, group_bys):
+    self.total = 0
+    self.counts = dict([(x, {}) for x in group_bys])
+
+  def add(self, values):
+    self.total += 1
+    for (group_by, value) in values.items():
+      self.counts[group_by][value] = self.counts[group_by].get(value, 0) + 1
+
+  def top(self, group_by, count=None):
+    """Return [(value, count)] for group_by, largest first."""
+    return sorted(self.counts[group_by].items(), key=lambda x: x[1], reverse=True)[:count]
+
+
+def _TimeShards(since, until, shards):
+  step = (until - since) / shards
+  bounds = [since + step * i for i in range(shards)] + [until]
+  return zip(bounds[:-1], bounds[1:])
+
+
+def _Pages(query, batch_size):
+  """Yield the results of a query a page at a time, following its cursor."""
+  page = query.fetch(batch_size)
+  while page:
+    yield page
+    if len(page) < batch_size:
+      return
+    page = query.with_cursor(query.cursor()).fetch(batch_size)
+
+
+def _RunShards(function, shards):
+  """Call function(*shard) for each shard from its own thread; re-raise the first error."""
+  errors = []
+
+  def Run(shard):
+    try:
+      function(*shard)
+    except Exception, e:
+      errors.append(e)
+
+  threads = [threading.Thread(target=Run, args=(x,)) for x in shards]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  if errors:
+    raise errors[0]
+
+
+class _Walk(object):
+  """State shared by the shards of one count_submissions() call."""
+
+  def __init__(self, group_bys, dedup, batch_size, progress):
+    self.group_bys = group_bys
+    self.dedup = dedup
+    self.batch_size = batch_size
+    self.progress = progress
+    self.lock = threading.Lock()
+    # dedup key -> (timestamp, submission id, group values)
+    self.latest = {}
+    # submission id -> input_source
+    self.sources = {}
+
+  def _Record(self, page):
+    self.lock.acquire()
+    try:
+      for submission in page:
+        if self.dedup:
+          key = submission.class_c
+        else:
+          key = submission.key().id()
+        previous = self.latest.get(key)
+        if previous and previous[0] >= submission.timestamp:
+          continue
+        self.latest[key] = (submission.timestamp, submission.key().id(),
+                            group_values(submission, self.group_bys))
+      if self.progress:
+        self.progress('submissions', len(page))
+    finally:
+      self.lock.release()
+
+  def WalkSubmissions(self, start, end):
+    query = models.Submission.all().filter('listed =', True).filter('timestamp >=', start)
+    query.filter('timestamp <', end).order('-timestamp')
+    for page in _Pages(query, self.batch_size):
+      self._Record(page)
+
+  def WalkConfigs(self, first_id, last_id, wanted):
+    query = models.SubmissionConfig.all()
+    query.filter('__key__ >=', db.Key.from_path('Submission', first_id))
+    query.filter('__key__ <', db.Key.from_path('Submission', last_id + 1))
+    for page in _Pages(query, self.batch_size):
+      self.lock.acquire()
+      try:
+        for config in page:
+          submission_id = config.key().parent().id()
+          if submission_id in wanted:
+            self.sources[submission_id] = config.input_source
+        if self.progress:
+          self.progress('configs', len(page))
+      finally:
+        self.lock.release()
+
+
+def _IdShards(ids, shards):
+  """Split sorted ids into up to shards (first id, last id) ranges of similar size."""
+  size = max(1, (len(ids) + shards - 1) // shards)
+  return [(ids[i], ids[min(i + size, len(ids)) - 1]) for i in range(0, len(ids), size)]
+
+
+def count_submissions(since, until=None, group_bys=GROUP_BYS, shards=8, dedup=True,
+                      batch_size=BATCH_SIZE, progress=None):
+  """Count the listed submissions from since up to until, grouped by group_bys.
+
+  Args:
+    dedup: only count the newest submission of each class C network.
+    progress: called as progress(kind, count) after each page read.
+
+  Returns:
+    A Totals.
+  """
+  until = until or datetime.datetime.now()
+  walk = _Walk(group_bys, dedup, batch_size, progress)
+  _RunShards(walk.WalkSubmissions, _TimeShards(since, until, shards))
+
+  if 'input_source' in group_bys and walk.latest:
+    ids = sorted([x[1] for x in walk.latest.values()])
+    wanted = set(ids)
+    _RunShards(lambda first, last: walk.WalkConfigs(first, last, wanted), _IdShards(ids, shards))
+
+  totals = Totals(group_bys)
+  for (timestamp, submission_id, values) in walk.latest.values():
+    if 'input_source' in group_bys:
+      values['input_source'] = walk.sources.get(submission_id)
+    totals.add(values)
+  return totals
+
+
+def nameserver_names(key_names):
+  """Return {key name: name or IP} for NameServer key names, fetched in one batch."""
+  key_names = [x for x in set(key_names) if x]
+  names = {}
+  for i in range(0, len(key_names), MAX_GET_KEYS):
+    chunk = key_names[i:i + MAX_GET_KEYS]
+    keys = [db.Key.from_path('NameServer', _KeyNameOrId(x)) for x in chunk]
+    for key_name, ns in zip(chunk, db.get(keys)):
+      if ns:
+        names[key_name] = ns.name or ns.ip
+  return names
+
+
+def _KeyNameOrId(key_name):
+  if key_name.isdigit():
+    return int(key_name)
+  return key_name
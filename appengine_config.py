@@ -1,25 +0,0 @@
-#!/usr/bin/env python
-#
-# Copyright 2010 Google Inc.
-#
-# Licensed under the Apache License, Version 2.0 (the "License");
-# you may not use this file except in compliance with the License.
-# You may obtain a copy of the License at
-#
-#     http://www.apache.org/licenses/LICENSE-2.0
-#
-# Unless required by applicable law or agreed to in writing, software
-# distributed under the License is distributed on an "AS IS" BASIS,
-# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
-# See the License for the specific language governing permissions and
-# limitations under the License.
-#
-
-# Code taken from:
-# http://code.google.com/appengine/docs/python/tools/appstats.html
-
-
-def webapp_add_wsgi_middleware(app):
-  from google.appengine.ext.appstats import recording
-  app = recording.appstats_wsgi_middleware(app)
-  return app
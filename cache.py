@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Caching of computed values in memcache, with a small in-process tier.
+
+Keys are built from a namespace, a per-namespace schema version and a key, so
+changing what a namespace stores only needs a version bump.
+
+Values are stored with a soft expiration time. Once that has passed, the
+first request to notice takes a short memcache lock and recomputes the value,
+while every other request keeps serving the stale copy until the new one is
+in place. This keeps popular keys from stampeding the datastore when they
+expire.
+
+Values are encoded by the cache rather than left to memcache's pickling:
+db.Model entities (alone or in a list) are stored as encoded protocol buffers,
+anything else is pickled, large encodings are zlib compressed, and whatever
+still exceeds the memcache item limit is split across chunk keys that are
+read back with a single get_multi.
+
+The in-process tier hands the same object to every request on an instance,
+so cached values must be treated as read-only.
+"""
+import hashlib
+import logging
+import pickle
+import threading
+import time
+import zlib
+
+from google.appengine.api import memcache
+from google.appengine.datastore import entity_pb
+from google.appengine.ext import db
+
+# Bump to abandon every cached value at once.
+CACHE_SCHEMA = 2
+# Stale values are kept around for this many times their TTL.
+STALE_FACTOR = 2
+# Seconds a recomputation may hold its lock.
+LOCK_TIMEOUT = 30
+# Seconds an invalidated value may still be served while it is recomputed.
+INVALIDATED_TTL = 3600
+LOCAL_SIZE = 256
+LOCAL_TTL = 60
+MAX_KEY_LENGTH = 200
+# Encodings larger than this are compressed.
+COMPRESS_THRESHOLD = 4096
+# Largest value stored in a single memcache item; the limit is 1MB, and the
+# key and memcache's own overhead count against it.
+MAX_ITEM_SIZE = 950000
+
+_MISSING = object()
+
+
+class LRUCache(object):
+  """A small, thread-safe, least-recently-used cache with expiration times."""
+
+  def __init__(self, size):
+    self.size = size
+    self.lock = threading.Lock()
+    self.clear()
+
+  def clear(self):
+    self.lock.acquire()
+    try:
+      # key -> [expiration time, value, last use]
+      self.entries = {}
+      self.tick = 0
+    finally:
+      self.lock.release()
+
+  def get(self, key, now):
+    """Return the value for key, or _MISSING."""
+    self.lock.acquire()
+    try:
+      entry = self.entries.get(key)
+      if not entry:
+        return _MISSING
+      if entry[0] < now:
+        del self.entries[key]
+        return _MISSING
+      self.tick += 1
+      entry[2] = self.tick
+      return entry[1]
+    finally:
+      self.lock.release()
+
+  def set(self, key, value, expires):
+    self.lock.acquire()
+    try:
+      if key not in self.entries and len(self.entries) >= self.size:
+        oldest = min(self.entries.items(), key=lambda x: x[1][2])[0]
+        del self.entries[oldest]
+      self.tick += 1
+      self.entries[key] = [expires, value, self.tick]
+    finally:
+      self.lock.release()
+
+  def delete(self, key):
+    self.lock.acquire()
+    try:
+      self.entries.pop(key, None)
+    finally:
+      self.lock.release()
+
+
+_LOCAL = LRUCache(LOCAL_SIZE)
+
+
+def make_key(namespace, key, version=1):
+  """Return the memcache key for a key in a namespace."""
+  cache_key = 'c%s:%s:v%s:%s' % (CACHE_SCHEMA, namespace, version, key)
+  if len(cache_key) > MAX_KEY_LENGTH:
+    cache_key = 'c%s:%s:v%s:#%s' % (CACHE_SCHEMA, namespace, version,
+                                    hashlib.md5(str(key)).hexdigest())
+  return cache_key
+
+
+def _Serialize(value):
+  """Encode a value, using protocol buffers for datastore entities."""
+  if isinstance(value, db.Model):
+    data = ('entity', db.model_to_protobuf(value).Encode())
+  elif (isinstance(value, list) and value and
+        not [x for x in value if not isinstance(x, db.Model)]):
+    data = ('entities', [db.model_to_protobuf(x).Encode() for x in value])
+  else:
+    data = ('pickle', value)
+  return pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+
+def _Deserialize(body):
+  kind, data = pickle.loads(body)
+  if kind == 'entity':
+    return db.model_from_protobuf(entity_pb.EntityProto(data))
+  elif kind == 'entities':
+    return [db.model_from_protobuf(entity_pb.EntityProto(x)) for x in data]
+  return data
+
+
+def _Encode(cache_key, fresh_until, value):
+  """Return a dict of memcache key -> string holding a value.
+
+  The item under cache_key is a pickled (fresh_until, compressed, chunk keys,
+  body) header. Bodies too large for one item are stored under chunk keys
+  instead, named after a digest of the body so that a reader never combines
+  chunks from two different writes.
+  """
+  body = _Serialize(value)
+  compressed = False
+  if len(body) > COMPRESS_THRESHOLD:
+    packed = zlib.compress(body)
+    if len(packed) < len(body):
+      body = packed
+      compressed = True
+
+  if len(body) <= MAX_ITEM_SIZE:
+    return {cache_key: pickle.dumps((fresh_until, compressed, None, body),
+                                    pickle.HIGHEST_PROTOCOL)}
+
+  items = {}
+  chunk_keys = []
+  digest = hashlib.md5(body).hexdigest()[:8]
+  for offset in range(0, len(body), MAX_ITEM_SIZE):
+    chunk_key = '%s:%s:%d' % (cache_key, digest, len(chunk_keys))
+    items[chunk_key] = body[offset:offset + MAX_ITEM_SIZE]
+    chunk_keys.append(chunk_key)
+  items[cache_key] = pickle.dumps((fresh_until, compressed, chunk_keys, None),
+                                  pickle.HIGHEST_PROTOCOL)
+  return items
+
+
+def _ReadHeader(data):
+  """Return the header of a memcache item written by _Encode, or None."""
+  if not isinstance(data, str):
+    return None
+  try:
+    header = pickle.loads(data)
+  except Exception, e:
+    logging.warning("Unreadable cache item: %s" % e)
+    return None
+  if not isinstance(header, tuple) or len(header) != 4:
+    return None
+  return header
+
+
+def _Decode(header, chunks):
+  """Return the value for a header, or _MISSING if one of its chunks is gone."""
+  fresh_until, compressed, chunk_keys, body = header
+  if chunk_keys:
+    parts = [chunks.get(x) for x in chunk_keys]
+    if None in parts:
+      return _MISSING
+    body = ''.join(parts)
+  if compressed:
+    body = zlib.decompress(body)
+  return _Deserialize(body)
+
+
+def _Set(items, ttl):
+  failed = memcache.set_multi(items, int(ttl * STALE_FACTOR))
+  if failed:
+    logging.error("Memcache set failed for %s." % failed)
+
+
+def _store(cache_key, value, ttl, now):
+  _Set(_Encode(cache_key, now + ttl, value), ttl)
+  _LOCAL.set(cache_key, value, now + min(ttl, LOCAL_TTL))
+
+
+def _use_cached(cache_key, header, now):
+  """Decide whether a memcache header can be served as it is."""
+  if header[0] > now:
+    return True
+  # Stale: serve it, unless it is our turn to recompute.
+  return not memcache.add(cache_key + ':lock', 1, LOCK_TIMEOUT)
+
+
+def _remember(cache_key, header, value, now):
+  if header[0] > now:
+    _LOCAL.set(cache_key, value, min(header[0], now + LOCAL_TTL))
+
+
+def get_or_compute(namespace, key, compute, ttl, version=1):
+  """Return a cached value, calling compute() to fill it in when needed.
+
+  A None result from compute() is returned but not cached.
+  """
+  cache_key = make_key(namespace, key, version)
+  now = time.time()
+  value = _LOCAL.get(cache_key, now)
+  if value is not _MISSING:
+    return value
+
+  header = _ReadHeader(memcache.get(cache_key))
+  locked = False
+  if header is not None:
+    if _use_cached(cache_key, header, now):
+      chunks = {}
+      if header[2]:
+        chunks = memcache.get_multi(header[2])
+      value = _Decode(header, chunks)
+      if value is not _MISSING:
+        _remember(cache_key, header, value, now)
+        return value
+    else:
+      locked = True
+
+  value = compute()
+  if value is not None:
+    _store(cache_key, value, ttl, now)
+  if locked:
+    memcache.delete(cache_key + ':lock')
+  return value
+
+
+def get_multi(namespace, keys, compute_missing, ttl, version=1):
+  """Return a dict of key -> value for several keys in one memcache round trip.
+
+  Chunked values need a second round trip, shared by all of them.
+
+  Args:
+    namespace: cache namespace
+    keys: list of keys
+    compute_missing: called with the list of keys that need computing;
+      returns a dict of key -> value.
+    ttl: seconds before values are recomputed
+    version: schema version of the namespace
+
+  Returns:
+    dict of key -> value
+  """
+  now = time.time()
+  results = {}
+  cache_keys = {}
+  for key in keys:
+    cache_key = make_key(namespace, key, version)
+    value = _LOCAL.get(cache_key, now)
+    if value is _MISSING:
+      cache_keys[cache_key] = key
+    else:
+      results[key] = value
+
+  if not cache_keys:
+    return results
+
+  missing = []
+  locked = []
+  usable = {}
+  chunk_keys = []
+  found = memcache.get_multi(cache_keys.keys())
+  for cache_key, key in cache_keys.items():
+    header = _ReadHeader(found.get(cache_key))
+    if header is not None and _use_cached(cache_key, header, now):
+      usable[cache_key] = header
+      chunk_keys.extend(header[2] or [])
+    else:
+      missing.append(key)
+      if header is not None:
+        locked.append(cache_key + ':lock')
+
+  chunks = {}
+  if chunk_keys:
+    chunks = memcache.get_multi(chunk_keys)
+  for cache_key, header in usable.items():
+    value = _Decode(header, chunks)
+    if value is _MISSING:
+      missing.append(cache_keys[cache_key])
+    else:
+      _remember(cache_key, header, value, now)
+      results[cache_keys[cache_key]] = value
+
+  if missing:
+    computed = compute_missing(missing)
+    to_store = {}
+    for key in missing:
+      value = computed.get(key)
+      results[key] = value
+      if value is not None:
+        cache_key = make_key(namespace, key, version)
+        to_store.update(_Encode(cache_key, now + ttl, value))
+        _LOCAL.set(cache_key, value, now + min(ttl, LOCAL_TTL))
+    if to_store:
+      _Set(to_store, ttl)
+    if locked:
+      memcache.delete_multi(locked)
+  return results
+
+
+def invalidate(namespace, key, version=1):
+  """Mark a value as stale: the next request recomputes it, others serve the old one."""
+  cache_key = make_key(namespace, key, version)
+  _LOCAL.delete(cache_key)
+  header = _ReadHeader(memcache.get(cache_key))
+  if header is not None:
+    # Chunks keep their own expiration time; if they go first, the value is
+    # simply recomputed.
+    memcache.set(cache_key, pickle.dumps((0,) + header[1:], pickle.HIGHEST_PROTOCOL),
+                 INVALIDATED_TTL)
+
+
+def delete(namespace, key, version=1):
+  """Remove a value, so the next request has to recompute it."""
+  cache_key = make_key(namespace, key, version)
+  _LOCAL.delete(cache_key)
+  memcache.delete(cache_key)
+
+
+def cached(namespace, ttl, version=1, key=None):
+  """Decorator caching a function's results with get_or_compute.
+
+  Args:
+    namespace: cache namespace
+    ttl: seconds before the value is recomputed
+    version: schema version of the namespace
+    key: called with the function's arguments to build the cache key; by
+      default the arguments are joined with ':'.
+  """
+
+  def decorator(func):
+
+    def wrapper(*args):
+      if key:
+        cache_key = key(*args)
+      else:
+        cache_key = ':'.join([str(x) for x in args])
+      return get_or_compute(namespace, cache_key, lambda: func(*args), ttl, version)
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+  return decorator
@@ -0,0 +1,13 @@
+# Generated by tools/compile_templates.py from templates/jinja2; do not edit.
+#
+# Template name -> (source checksum, Python source from jinja2's compiler).
+
+TEMPLATES = {}
+
+TEMPLATES['country.html'] = ('467b44e86177d3466705acd2cb4f1371', 'from __future__ import division\nfrom jinja2.runtime import LoopContext, TemplateReference, Macro, Markup, TemplateRuntimeError, missing, concat, escape, markup_join, unicode_join, to_string, TemplateNotFound\nname = \'country.html\'\n\ndef root(context, environment=environment):\n    l_count = context.resolve(\'count\')\n    l_recent_submissions = context.resolve(\'recent_submissions\')\n    l_popular_nameservers = context.resolve(\'popular_nameservers\')\n    l_distribution_url = context.resolve(\'distribution_url\')\n    l_country = context.resolve(\'country\')\n    l_last_update = context.resolve(\'last_update\')\n    l_maps_api_key = context.resolve(\'maps_api_key\')\n    l_trends = context.resolve(\'trends\')\n    l_nsdata_raw = context.resolve(\'nsdata_raw\')\n    l_distribution_url_global = context.resolve(\'distribution_url_global\')\n    l_country_code = context.resolve(\'country_code\')\n    l_nsdata = context.resolve(\'nsdata\')\n    l_cycler = context.resolve(\'cycler\')\n    l_trend_days = context.resolve(\'trend_days\')\n    l_submissions = context.resolve(\'submissions\')\n    t_1 = environment.filters[\'floatformat\']\n    t_2 = environment.filters[\'timesince\']\n    t_3 = environment.filters[\'escape\']\n    if 0: yield None\n    yield u\'<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\\n<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">\\n<head>\\n  <title>namebench results: %s</title>\\n  <link href="/media/style.css" rel="stylesheet" type="text/css" />\\n\\n    <script src="http://maps.google.com/maps?file=api&amp;v=2&amp;sensor=false&amp;key=%s" type="text/javascript" type="text/javascript"></script>\\n        <script type="text/javascript">\\n        function initialize() {\\n          if (GBrowserIsCompatible()) {\\n            var map = new GMap2(document.getElementById("map_canvas"));\\n            map.setCenter(new GLatLng(%s), 3); \\n            \' % (\n        l_country, \n        l_maps_api_key, \n        environment.getattr(environment.getitem(l_submissions, 0), \'coordinates\'), \n    )\n    l_submission = missing\n    for l_submission in l_submissions:\n        if 0: yield None\n        yield u\'\\n            map.addOverlay(new GMarker(new GLatLng(%s)));\' % (\n            environment.getattr(l_submission, \'coordinates\'), \n        )\n    l_submission = missing\n    yield u"\\n          }\\n        }\\n        </script>\\n  \\n  <script type=\'text/javascript\' src=\'http://www.google.com/jsapi\'></script>\\n  <script type=\'text/javascript\'>\\n    google.load(\'visualization\', \'1\', {packages:[\'table\']});\\n    google.setOnLoadCallback(drawIndexTable);\\n    function drawIndexTable() {\\n      var data = new google.visualization.DataTable();\\n      data.addColumn(\'string\', \'Name\');\\n      data.addColumn(\'string\', \'Hostname\');\\n      data.addColumn(\'number\', \'Submissions\');\\n      data.addColumn(\'number\', \'Avg Latency\');\\n      data.addColumn(\'number\', \'Avg Rank\');\\n      data.addRows(["\n    l_row = missing\n    for l_row in l_nsdata:\n        if 0: yield None\n        yield u\'\\n        \'\n        if environment.getattr(l_row, \'overall_position\') != -1:\n            if 0: yield None\n            if environment.getattr(l_row, \'count\') != 1:\n                if 0: yield None\n                yield u"[\'%s\',\'%s\', %s, %s, %s]," % (\n                    environment.getattr(l_row, \'name\'), \n                    environment.getattr(l_row, \'hostname\'), \n                    environment.getattr(l_row, \'count\'), \n                    t_1(environment.getattr(l_row, \'overall_average\')), \n                    t_1(environment.getattr(l_row, \'overall_position\')), \n                )\n    l_row = missing\n    yield u\']);\\n      var table = new google.visualization.Table(document.getElementById(\\\'ns_table\\\'));\\n      table.draw(data, {allowHtml: true});\\n    }\\n  </script>  \\n  \\n</head>\\n<body onload="initialize()" onunload="GUnload()" id="site">\\n\\n<div id="container">\\n  <h1>%s (%s)</h1>\\n  <small>Last updated %s, %s listed submissions</small>\\n  \\n  \\n    <h2>Recent Submissions</h2>\\n\\n    <p>Results may be unlisted if there were other recent listed submissions from the same host, or if there was not enough data provided for a conclusive result.</p>\\n    <div id="nsdetails">\\n    <table id="nstable">\\n      <thead>\\n        <tr>\\n          <td>ID</td>\\n          <td>Location</td>\\n          <td>Network</td>\\n          <td>Best</td>\\n          <td>Current</td>\\n          <td>Improvement</td>\\n          <td>Age</td>\\n        </tr>\\n      </thead>\\n      <tbody>\\n  \' % (\n        l_country, \n        l_country_code, \n        l_last_update, \n        l_count, \n    )\n    l_row_class = context.call(l_cycler, \'odd\', \'even\')\n    context.vars[\'row_class\'] = l_row_class\n    context.exported_vars.add(\'row_class\')\n    yield u\'\\n  \'\n    l_submission = missing\n    for l_submission in l_recent_submissions:\n        if 0: yield None\n        yield u\'\\n  \'\n        if (not environment.getattr(l_submission, \'hidden\')):\n            if 0: yield None\n            yield u\'\\n\\n  <tr class="\'\n            if (not environment.getattr(l_submission, \'listed\')):\n                if 0: yield None\n                yield u\'disabled\'\n            else:\n                if 0: yield None\n                yield u\'normal \'\n                yield to_string(context.call(environment.getattr(l_row_class, \'next\')))\n            yield u\'">\\n    <td><a href="/id/%s">%s</a></td>\\n    <td>\' % (\n                context.call(environment.getattr(context.call(environment.getattr(l_submission, \'key\')), \'id\')), \n                context.call(environment.getattr(context.call(environment.getattr(l_submission, \'key\')), \'id\')), \n            )\n            if environment.getattr(l_submission, \'region\'):\n                if 0: yield None\n                yield to_string(t_3(environment.getattr(l_submission, \'region\')))\n                yield u\',\'\n            yield u\' \'\n            if environment.getattr(l_submission, \'country\'):\n                if 0: yield None\n                yield u\'<a href="/country/%s">%s</a>\' % (\n                    t_3(environment.getattr(l_submission, \'country_code\')), \n                    t_3(environment.getattr(l_submission, \'country\')), \n                )\n            else:\n                if 0: yield None\n                yield u\' Unknown \'\n            yield u\'</td>\\n    <td>%s.0/24</td>\\n    <td><a href="/ns/%s">\' % (\n                t_3(environment.getattr(l_submission, \'class_c\')), \n                t_3(environment.getattr(environment.getattr(l_submission, \'best_nameserver\'), \'ip\')), \n            )\n            if environment.getattr(environment.getattr(l_submission, \'best_nameserver\'), \'name\'):\n                if 0: yield None\n                yield to_string(t_3(environment.getattr(environment.getattr(l_submission, \'best_nameserver\'), \'name\')))\n            else:\n                if 0: yield None\n                yield to_string(t_3(environment.getattr(environment.getattr(l_submission, \'best_nameserver\'), \'ip\')))\n            yield u\'</a></td>\\n    <td><a href="/ns/%s">\' % (\n                t_3(environment.getattr(environment.getattr(l_submission, \'primary_nameserver\'), \'ip\')), \n            )\n            if environment.getattr(environment.getattr(l_submission, \'primary_nameserver\'), \'name\'):\n                if 0: yield None\n                yield to_string(t_3(environment.getattr(environment.getattr(l_submission, \'primary_nameserver\'), \'name\')))\n            else:\n                if 0: yield None\n                yield to_string(t_3(environment.getattr(environment.getattr(l_submission, \'primary_nameserver\'), \'ip\')))\n            yield u\'</a></td>\\n    <td>\'\n            if environment.getattr(l_submission, \'best_improvement\'):\n                if 0: yield None\n                yield to_string(t_1(environment.getattr(l_submission, \'best_improvement\')))\n                yield u\'%\'\n            else:\n                if 0: yield None\n                yield u\'N/A\'\n            yield u\'</td>\\n    <td>%s</td>\\n  </tr>\\n  \' % (\n                t_2(environment.getattr(l_submission, \'timestamp\')), \n            )\n        yield u\'\\n  \'\n    l_submission = missing\n    yield u\'\\n  </tbody>\\n  </table>\\n  </div>\\n\\n  <h2>Submissions Map</h2>\\n\\n  <div class="mapwrapper"><div id="map_canvas" style="width: 500px; height: 300px"></div></div>  \\n  \\n  <h2>Popular Tested Nameservers</h2>\\n  <div id="ns_table"></div>\\n\\n  <h2>Global Nameservers, Recent Days</h2>\\n\\n  <div class="config">\\n  <table class="configtable"><thead><tr><td>Name</td>\'\n    l_days = missing\n    for l_days in l_trend_days:\n        if 0: yield None\n        yield u\'<td>Submissions (%s days)</td><td>Avg Latency (%s days)</td>\' % (\n            l_days, \n            l_days, \n        )\n    l_days = missing\n    yield u\'</tr></thead>\\n    \'\n    l_row = missing\n    for l_row in l_trends:\n        if 0: yield None\n        yield u\'\\n      <tr><td><a href="/ns/%s">%s</a></td>\' % (\n            t_3(environment.getattr(l_row, \'ip\')), \n            t_3(environment.getattr(l_row, \'name\')), \n        )\n        l_window = missing\n        for l_window in environment.getattr(l_row, \'windows\'):\n            if 0: yield None\n            yield u\'<td>%s</td><td>\' % (\n                environment.getitem(l_window, 1), \n            )\n            if environment.getitem(l_window, 2):\n                if 0: yield None\n                yield to_string(t_1(environment.getitem(l_window, 2)))\n            else:\n                if 0: yield None\n                yield u\'N/A\'\n            yield u\'</td>\'\n        l_window = missing\n        yield u\'</tr>\\n    \'\n    l_row = missing\n    yield u\'\\n    </table>\\n  </div>\\n    \\n  <h2>Response Distribution Chart (First 350ms)</h2>\\n<!-- \\n%s\\n--!>\\n  <img src="%s" alt="Response Distribution Graph (first 350ms)" />\\n\\n  <h2>Response Distribution Chart, Global Nameservers (First 350ms)</h2>\\n\\n  <img src="%s" alt="Response Distribution Graph for Golobal Nameservers (first 350ms)" />\\n\\n  <h2>Popular Primary Nameservers</h2>\\n\\n  <div class="config" class="section">\\n  <table class="configtable"><thead><tr><td>Name</td><td>Submissions</td></tr></thead>\\n    \' % (\n        l_nsdata_raw, \n        l_distribution_url, \n        l_distribution_url_global, \n    )\n    l_row = missing\n    for l_row in l_popular_nameservers:\n        if 0: yield None\n        yield u\'\\n      <tr><td>%s</td><td>%s</td>\\n    \' % (\n            environment.getitem(l_row, 0), \n            environment.getitem(l_row, 1), \n        )\n    l_row = missing\n    yield u\'\\n    </table>\\n\\n    \\n</div>\\n</body>\\n\\n\\n\\n</html>\'\n\nblocks = {}\ndebug_info = \'1=25&4=26&7=27&12=28&13=31&14=34&30=39&31=42&41=55&42=57&62=60&63=65&64=68&66=71&67=79&68=82&69=97&70=98&71=107&72=116&73=124&75=126&76=128&91=130&92=139&93=142&94=161&100=162&102=163&106=164&112=167&113=170&114=174\'')
+
+TEMPLATES['index.html'] = ('51492b125211f07d2247f4e5ff9a6a77', 'from __future__ import division\nfrom jinja2.runtime import LoopContext, TemplateReference, Macro, Markup, TemplateRuntimeError, missing, concat, escape, markup_join, unicode_join, to_string, TemplateNotFound\nname = \'index.html\'\n\ndef root(context, environment=environment):\n    l_maps_api_key = context.resolve(\'maps_api_key\')\n    l_submission_count = context.resolve(\'submission_count\')\n    l_cycler = context.resolve(\'cycler\')\n    l_submissions = context.resolve(\'submissions\')\n    l_recent_submissions = context.resolve(\'recent_submissions\')\n    t_1 = environment.filters[\'floatformat\']\n    t_2 = environment.filters[\'timesince\']\n    t_3 = environment.filters[\'escape\']\n    if 0: yield None\n    yield u\'<?xml version="1.0" encoding="UTF-8"?>\\n<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.1//EN" "http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd">\\n\\n<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en">\\n<head>\\n  <link href="/media/style.css" rel="stylesheet" type="text/css" />\\n  <title>namebench reports site</title>\\n  <script src="http://maps.google.com/maps?file=api&amp;v=2&amp;sensor=false&amp;key=%s" type="text/javascript" type="text/javascript"></script>\\n      <script type="text/javascript">\\n      function initialize() {\\n        if (GBrowserIsCompatible()) {\\n          var map = new GMap2(document.getElementById("map_canvas"));\\n          map.setCenter(new GLatLng(30, 0), 1);\\n          \' % (\n        l_maps_api_key, \n    )\n    l_submission = missing\n    for l_submission in l_submissions:\n        if 0: yield None\n        if environment.getattr(l_submission, \'coordinates\'):\n            if 0: yield None\n            yield u\'\\n          map.addOverlay(new GMarker(new GLatLng(%s)));\' % (\n                environment.getattr(l_submission, \'coordinates\'), \n            )\n    l_submission = missing\n    yield u\'\\n        }\\n      }\\n      </script>\\n  \\n  \\n</head>\\n<body onload="initialize()" onunload="GUnload()" id="site">\\n  <div id="container">  \\n  <div id="left"><img src="/media/front-left.png" alt="Left bar" /></div>\\n  <div id="right"><img src="/media/front-right.png" alt="Right Bar" /></div>\\n  \\n  <div id="content">\\n  <div id="header"><h1>namebench results</h1></div>\\n\\n  <p>\\n    \\n    This site contains DNS performance data which has been submitted by users of \\n  <strong><a href="http://namebench.googlecode.com/">namebench</a></strong> DNS benchmarking software. \\n  To share your own results, download <a href="http://code.google.com/p/namebench/downloads/list">namebench 1.3</a>, enable it in the user interface, or use the -u option:</p>\\n  \\n  <pre>./namebench.py -u</pre>\\n  \\n  <p>For privacy reasons, namebench only uploads details on a predefined list of <a\\n  href="http://namebench.appspot.com/index_hosts">index \\n  hosts</a>, and masks internal IP addresses before uploading.</p>\\n  \\n  <h2>Recent Submissions</h2>\\n  \\n  <p>Results may be unlisted if there were other recent listed submissions from the same host, or if there was not enough data provided for a conclusive result. %s results have been listed so far.</p>\\n  <div id="nsdetails">\\n  <table id="nstable">\\n    <thead>\\n      <tr>\\n        <td>ID</td>\\n        <td>Location</td>\\n        <td>Network</td>\\n        <td>Best</td>\\n        <td>Current</td>\\n        <td>Improvement</td>\\n        <td>Age</td>\\n      </tr>\\n    </thead>\\n    <tbody>\\n\' % (\n        l_submission_count, \n    )\n    l_row_class = context.call(l_cycler, \'odd\', \'even\')\n    context.vars[\'row_class\'] = l_row_class\n    context.exported_vars.add(\'row_class\')\n    yield u\'\\n\'\n    l_submission = missing\n    for l_submission in l_recent_submissions:\n        if 0: yield None\n        yield u\'\\n<tr class="normal %s">\\n  <td><a href="/id/%s">X</a></td>\\n  <td>\' % (\n            context.call(environment.getattr(l_row_class, \'next\')), \n            environment.getattr(l_submission, \'id\'), \n        )\n        if environment.getattr(l_submission, \'region\'):\n            if 0: yield None\n            yield to_string(t_3(environment.getattr(l_submission, \'region\')))\n            yield u\',\'\n        yield u\' \'\n        if environment.getattr(l_submission, \'country\'):\n            if 0: yield None\n            yield u\'<a href="/country/%s">%s</a>\' % (\n                t_3(environment.getattr(l_submission, \'country_code\')), \n                t_3(environment.getattr(l_submission, \'country\')), \n            )\n        else:\n            if 0: yield None\n            yield u\' Unknown \'\n        yield u\'</td>\\n  <td>%s.0/24</td>\\n  <td>%s</td>\\n  <td><a href="/ns/%s">%s</a></td>\\n  <td>\' % (\n            t_3(environment.getattr(l_submission, \'class_c\')), \n            t_3(environment.getattr(l_submission, \'best_name\')), \n            t_3(environment.getattr(l_submission, \'primary_ip\')), \n            t_3(environment.getattr(l_submission, \'primary_name\')), \n        )\n        if environment.getattr(l_submission, \'best_improvement\'):\n            if 0: yield None\n            yield to_string(t_1(environment.getattr(l_submission, \'best_improvement\')))\n            yield u\'%\'\n        else:\n            if 0: yield None\n            yield u\'&nbsp;\'\n        yield u\'</td>\\n  <td>%s</td>\\n</tr>\\n\' % (\n            t_2(environment.getattr(l_submission, \'timestamp\')), \n        )\n    l_submission = missing\n    yield u\'\\n</tbody>\\n</table>\\n</div>\\n\\n<h2>Submissions Map</h2>\\n\\nFor the most recent 150 submissions:\\n\\n<div class="mapwrapper"><div id="map_canvas" style="width: 500px; height: 300px"></div></div>\\n\\n<h2>Open Source</h2>\\n\\n<p>The source code for this website is available at <a href="http://namebench-appengine.googlecode.com/">Google Code</a> - Contributions are welcome!</p>\\n<p>The anonymized data collected by this site is also free to use by others. We are currently working out the export format details.</p>  \\n</div>\\n<div class="clear"></div>\\n<div class="footer">Powered by Google App Engine.</div>\\n</div>\\n</body>\\n</html>\'\n\nblocks = {}\ndebug_info = \'1=15&8=16&14=19&15=24&44=28&59=30&60=35&61=38&62=39&63=41&64=56&65=57&66=58&67=61&68=69&70=72\'')
+
+TEMPLATES['lookup.html'] = ('8c578c1c99fc0688f2bae31902154ffb', 'from __future__ import division\nfrom jinja2.runtime import LoopContext, TemplateReference, Macro, Markup, TemplateRuntimeError, missing, concat, escape, markup_join, unicode_join, to_string, TemplateNotFound\nname = \'lookup.html\'\n\ndef root(context, environment=environment):\n    l_best_improvement = context.resolve(\'best_improvement\')\n    l_reference = context.resolve(\'reference\')\n    l_submission = context.resolve(\'submission\')\n    l_wiki_index_data = context.resolve(\'wiki_index_data\')\n    l_config = context.resolve(\'config\')\n    l_goog_index_data = context.resolve(\'goog_index_data\')\n    l_fastest_data = context.resolve(\'fastest_data\')\n    l_recommended = context.resolve(\'recommended\')\n    l_version = context.resolve(\'version\')\n    l_nsdata = context.resolve(\'nsdata\')\n    l_min_duration_url = context.resolve(\'min_duration_url\')\n    l_cycler = context.resolve(\'cycler\')\n    l_distribution_url_250 = context.resolve(\'distribution_url_250\')\n    l_id = context.resolve(\'id\')\n    l_best_nameserver = context.resolve(\'best_nameserver\')\n    l_mean_duration_url = context.resolve(\'mean_duration_url\')\n    t_1 = environment.filters[\'floatformat\']\n    t_2 = environment.filters[\'escape\']\n    t_3 = environment.tests[\'none\']\n    if 0: yield None\n    yield u\'<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\\n<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">\\n<head>\\n  <title>namebench results: %s</title>\\n  <link href="/media/report.css" rel="stylesheet" type="text/css" />\\n  \\n  <script type=\\\'text/javascript\\\' src=\\\'http://www.google.com/jsapi\\\'></script>\\n  <script type=\\\'text/javascript\\\'>\\n    google.load(\\\'visualization\\\', \\\'1\\\', {packages:[\\\'table\\\']});\\n    google.setOnLoadCallback(drawGoogIndexTable);\\n    google.setOnLoadCallback(drawWikiIndexTable);\\n    google.setOnLoadCallback(drawPortBehaviorTable);\\n    function drawGoogIndexTable() {\\n      var data = new google.visualization.DataTable();\\n      data.addColumn(\\\'string\\\', \\\'Nameserver\\\');\\n      data.addColumn(\\\'number\\\', \\\'Time\\\');\\n      data.addColumn(\\\'number\\\', \\\'TTL\\\');\\n      data.addColumn(\\\'string\\\', \\\'Response\\\');\\n      data.addRows([%s]);\\n      var table = new google.visualization.Table(document.getElementById(\\\'goog_index_table\\\'));\\n      table.draw(data, {allowHtml: true});\\n    }\\n    function drawWikiIndexTable() {\\n      var data = new google.visualization.DataTable();\\n      data.addColumn(\\\'string\\\', \\\'Nameserver\\\');\\n      data.addColumn(\\\'number\\\', \\\'Time\\\');\\n      data.addColumn(\\\'number\\\', \\\'TTL\\\');\\n      data.addColumn(\\\'string\\\', \\\'Response\\\');\\n      data.addRows([%s]);\\n      var table = new google.visualization.Table(document.getElementById(\\\'wiki_index_table\\\'));\\n      table.draw(data, {allowHtml: true});\\n    }\\n  </script> \\n</head>\\n<body>\\n\\n<div id="container">\\n<div class="version">namebench %s</div>\\n<div id="big_summary" class="greybox">\\n\' % (\n        l_id, \n        l_goog_index_data, \n        l_wiki_index_data, \n        l_version, \n    )\n    if environment.getattr(l_best_nameserver, \'ip\') == environment.getattr(environment.getattr(l_submission, \'primary_nameserver\'), \'ip\'):\n        if 0: yield None\n        yield u\'\\n  Your primary DNS server\\n  <h4><strong>%s</strong></h4>\\n  Is already the fastest.\\n\' % (\n            t_2(environment.getattr(l_best_nameserver, \'ip\')), \n        )\n    else:\n        if 0: yield None\n        yield u\'\\n\\t<h4><strong>%s</strong> is</h4>\\n\\t\' % (\n            t_2(environment.getattr(l_best_nameserver, \'name\')), \n        )\n        if l_best_improvement:\n            if 0: yield None\n            yield u\'\\n  \\t<h1>%s%%</h1><h5 class="faster">Faster</h5>\\n  \' % (\n                t_1(l_best_improvement), \n            )\n        else:\n            if 0: yield None\n            yield u\'\\n    <h1>N/A<h1>\\n  \'\n        yield u\'\\n  <h4>than \'\n        if environment.getattr(l_reference, \'sys_position\') == 0:\n            if 0: yield None\n            yield u\'your current primary DNS server\'\n        else:\n            if 0: yield None\n            yield to_string(environment.getattr(l_reference, \'name\'))\n        yield u\'</h4>\\n\'\n    yield u\'\\n</div>\\n\\n<div id="recommended_config" class="greybox">\\n\\t<h4>Recommended configuration (fastest + nearest)</h4>\\n\\t<table>\\n\\t\'\n    l_ns = missing\n    for l_ns, l_loop in LoopContext(l_recommended):\n        if 0: yield None\n        yield u\'\\n\\t<tr>\\n\\t  <td>\'\n        if environment.getattr(l_loop, \'index\') == 1:\n            if 0: yield None\n            yield u\'Primary\'\n        yield u\'\\n\\t      \'\n        if environment.getattr(l_loop, \'index\') == 2:\n            if 0: yield None\n            yield u\'Secondary\'\n        yield u\'\\n\\t      \'\n        if environment.getattr(l_loop, \'index\') == 3:\n            if 0: yield None\n            yield u\'Tertiary\'\n        yield u\' Server</td>\\n    <td><div class="ip">%s</div></td><td class="rec_name">%s</td>\\n\\t</tr>\\n  \' % (\n            t_2(environment.getattr(l_ns, \'ip\')), \n            t_2(environment.getattr(l_ns, \'name\')), \n        )\n    l_ns = missing\n    yield u\'\\n  </table>\\n</div>\\n\\n<h2>Tested DNS Servers</h2>\\n\\n<div id="nsdetails">\\n<table id="nstable">\\n<thead>\\n<tr>\\n  <td nowrap="nowrap">IP</td>\\n  <td>Descr.</td>\\n  <td nowrap="nowrap">Hostname</td>\\n  <td nowrap="nowrap">Avg</td>\\n  <td nowrap="nowrap">Diff</td>\\n\\t<td nowrap="nowrap">Min</td>\\n\\t<td nowrap="nowrap">Max</td>\\n  <td nowrap="nowrap">TO</td>\\n  <td nowrap="nowrap">NX</td>\\n  <td>Notes</td>\\n</tr>\\n</thead>\\n\\n\'\n    l_row_class = context.call(l_cycler, \'odd\', \'even\')\n    context.vars[\'row_class\'] = l_row_class\n    context.exported_vars.add(\'row_class\')\n    yield u\'\\n\'\n    l_sub = missing\n    for l_sub in l_nsdata:\n        if 0: yield None\n        yield u\'\\n<tr class="\'\n        if environment.getattr(l_sub, \'is_disabled\'):\n            if 0: yield None\n            yield u\'disabled\'\n        else:\n            if 0: yield None\n            yield u\'normal \'\n            yield to_string(context.call(environment.getattr(l_row_class, \'next\')))\n        if environment.getattr(l_sub, \'sys_position\') == 0:\n            if 0: yield None\n            yield u\' primary_row\'\n        if environment.getattr(l_sub, \'is_error_prone\'):\n            if 0: yield None\n            yield u\' unhealthy_host\'\n        yield u\'">\\n  <td class="ip_cell"><a href="http://www.google.com/search?q=%s" class="info">%s\' % (\n            t_2(environment.getattr(l_sub, \'ip\')), \n            t_2(environment.getattr(l_sub, \'ip\')), \n        )\n        if environment.getattr(l_sub, \'version\'):\n            if 0: yield None\n            yield u\'<span>%s</span>\' % (\n                t_2(environment.getattr(l_sub, \'version\')), \n            )\n        yield u\'</td>\\n  <td class="name_cell">%s</td>\\n  <td class="hostname_cell"><a href="http://www.google.com/search?q=%s" class="info">%s\' % (\n            t_2(environment.getattr(l_sub, \'name\')), \n            t_2(environment.getattr(l_sub, \'hostname\')), \n            t_2(environment.getattr(l_sub, \'hostname\')), \n        )\n        if environment.getattr(l_sub, \'node_ids\'):\n            if 0: yield None\n            yield u\'<span>\'\n            l_node = missing\n            for l_node in environment.getattr(l_sub, \'node_ids\'):\n                if 0: yield None\n                yield to_string(t_2(l_node))\n                yield u\' \'\n            l_node = missing\n            yield u\'</span>\'\n        yield u\'</a></td>\\n  <td>\'\n        if environment.getattr(l_sub, \'overall_average\'):\n            if 0: yield None\n            yield to_string(t_1(environment.getattr(l_sub, \'overall_average\')))\n        else:\n            if 0: yield None\n            yield u\'~\'\n            yield to_string(t_1(environment.getattr(l_sub, \'check_average\')))\n        yield u\'</td>\\n  <td>\'\n        if environment.getattr(l_sub, \'diff\'):\n            if 0: yield None\n            yield to_string(t_1(environment.getattr(l_sub, \'diff\')))\n            yield u\'%\'\n        yield u\'</td>  \\n  <td>\'\n        if environment.getattr(l_sub, \'duration_min\'):\n            if 0: yield None\n            yield to_string(t_1(environment.getattr(l_sub, \'duration_min\')))\n        yield u\'</td>\\n  <td>\'\n        if environment.getattr(l_sub, \'duration_max\'):\n            if 0: yield None\n            yield to_string(t_1(environment.getattr(l_sub, \'duration_max\')))\n        yield u\'</td>\\n  <td \'\n        if environment.getattr(l_sub, \'timeout_count\'):\n            if 0: yield None\n            yield u\'class="error_count"\'\n        yield u\'>%s</td>\\n  <td>\' % (\n            environment.getattr(l_sub, \'timeout_count\'), \n        )\n        if (not t_3(environment.getattr(l_sub, \'nx_count\'))):\n            if 0: yield None\n            yield to_string(environment.getattr(l_sub, \'nx_count\'))\n        yield u\'</td>\\n  <td class="notes_cell">\\n  \'\n        if environment.getattr(l_sub, \'notes\'):\n            if 0: yield None\n            yield u\'\\n    <ul class="warnings">\\n\\t\\t\'\n            l_note = missing\n            for l_note in environment.getattr(l_sub, \'notes\'):\n                if 0: yield None\n                yield u\'\\n\\t\\t  <li>\'\n                if environment.getattr(l_note, \'url\'):\n                    if 0: yield None\n                    yield u\'<a href="%s">\' % (\n                        environment.getattr(l_note, \'url\'), \n                    )\n                yield to_string(environment.getattr(l_note, \'text\'))\n                if environment.getattr(l_note, \'url\'):\n                    if 0: yield None\n                    yield u\'</a>\'\n                yield u\'</li>\\n    \'\n            l_note = missing\n            yield u\'\\n\\t</ul>\\n  \'\n        yield u\'\\n  </td>\\n</tr>\\n\'\n    l_sub = missing\n    yield u\'\\n</table>\\n</div>\\n\\n<h2>Graphs</h2>\\n\\n<ul>\\n  \'\n    l_row = missing\n    for l_row in l_fastest_data:\n        if 0: yield None\n        yield u\'\\n  %s\\n  \' % (\n            l_row, \n        )\n    l_row = missing\n    yield u\'\\n</ul>\\n\\n<div id="graphs" class="section">\\n<h2>Mean Response Duration</h2>\\n<img src="%s" alt="Mean Duration Graph" />\\n\\n<h3>Fastest Individual Response Duration</h3>\\n<img src="%s" alt="Fastest Response Graph" />\\n\\n<h3>Response Distribution Chart (First 250ms)</h3>\\n\\n<img src="%s" alt="Response Distribution Graph (first 250ms)" />\\n\\n<h2>Sample Index Results (www.wikipedia.org)</h2>\\n\\n<div id="wiki_index_table"></div>\\n\\n<h2>Sample Index Results (www.google.com)</h2>\\n\\n<div id="goog_index_table"></div>\\n\\n<h2>Config</h2>\\n\\n<div class="config" class="section">\\n<table class="configtable">\\n\\t<thead><tr><td>Name</td><td>Value</td></tr></thead>\\n\\t\' % (\n        l_mean_duration_url, \n        l_min_duration_url, \n        l_distribution_url_250, \n    )\n    l_row = missing\n    for l_row in l_config:\n        if 0: yield None\n        yield u\'\\n\\t<tr><td>%s</td><td>%s</td></tr>\\n  \' % (\n            t_2(environment.getitem(l_row, 0)), \n            t_2(environment.getitem(l_row, 1)), \n        )\n    l_row = missing\n    yield u\'\\n\\t</table>\\n</div>\\n\\n<h2>Location</h2>\\n\\n<div class="config" class="section">\\n<table class="configtable">\\n\\t<thead><tr><td>Name</td><td>Value</td></tr></thead>\\n\\t<tr><td>Country</td><td>%s</td></tr>\\n\\t<tr><td>Region</td><td>%s</td></tr>\\n\\t<tr><td>City</td><td>%s</td></tr>\\n\\t<tr><td>Network</td><td>%s.0/24</td></tr>\\n\\t</table>\\n</div>\\n\\n\\n</div>\\n</body>\\n</html>\' % (\n        t_2(environment.getattr(l_submission, \'country\')), \n        t_2(environment.getattr(l_submission, \'region\')), \n        t_2(environment.getattr(l_submission, \'city\')), \n        t_2(environment.getattr(l_submission, \'class_c\')), \n    )\n\nblocks = {}\ndebug_info = \'1=26&4=27&19=28&29=29&38=30&40=32&42=35&44=39&45=40&46=42&47=45&48=49&50=50&51=51&52=58&58=60&60=63&61=67&62=71&63=75&65=79&88=80&89=85&90=88&91=102&92=111&93=112&94=126&95=134&96=139&97=143&98=147&99=153&101=157&103=161&104=164&105=175&107=176&110=178&117=180&118=183&119=186&124=187&127=188&131=189&146=192&147=195&148=199&157=200&158=201&159=202&160=203\'')
+
+TEMPLATES['nameserver.html'] = ('6a34badddc050f6e3bb4f3165f83e74e', 'from __future__ import division\nfrom jinja2.runtime import LoopContext, TemplateReference, Macro, Markup, TemplateRuntimeError, missing, concat, escape, markup_join, unicode_join, to_string, TemplateNotFound\nname = \'nameserver.html\'\n\ndef root(context, environment=environment):\n    l_ip = context.resolve(\'ip\')\n    l_nameserver = context.resolve(\'nameserver\')\n    l_best_networks_table = context.resolve(\'best_networks_table\')\n    l_nsdata = context.resolve(\'nsdata\')\n    t_1 = environment.filters[\'floatformat\']\n    t_2 = environment.filters[\'escape\']\n    if 0: yield None\n    yield u\'<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\\n<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">\\n<head>\\n  <title>namebench results: nameserver %s</title>\\n  <link href="/media/report.css" rel="stylesheet" type="text/css" />\\n  <link href="/media/style.css" rel="stylesheet" type="text/css" />\\n  \\n  <script type=\\\'text/javascript\\\' src=\\\'http://www.google.com/jsapi\\\'></script>\\n  <script type=\\\'text/javascript\\\'>\\n    google.load(\\\'visualization\\\', \\\'1\\\', {packages:[\\\'table\\\']});\\n    google.setOnLoadCallback(drawIndexTable);\\n    function drawIndexTable() {\\n      var data = new google.visualization.DataTable();\\n      data.addColumn(\\\'string\\\', \\\'Network\\\');\\n      data.addColumn(\\\'number\\\', \\\'Hosts\\\');\\n      data.addColumn(\\\'number\\\', \\\'Tests\\\');\\n      data.addColumn(\\\'number\\\', \\\'Average Placement\\\');\\n      data.addColumn(\\\'number\\\', \\\'Avg Min. Latency\\\');\\n      data.addColumn(\\\'number\\\', \\\'Average Latency\\\');\\n      data.addRows([\' % (\n        l_ip, \n    )\n    l_ns_sub = missing\n    for l_ns_sub in l_nsdata:\n        if 0: yield None\n        l_index_result = missing\n        for l_index_result in environment.getattr(l_ns_sub, \'index_results\'):\n            if 0: yield None\n            yield u"\\n        [\'"\n            if environment.getattr(environment.getattr(l_ns_sub, \'nameserver\'), \'name\'):\n                if 0: yield None\n                yield to_string(t_2(environment.getattr(environment.getattr(l_ns_sub, \'nameserver\'), \'name\')))\n            else:\n                if 0: yield None\n                yield to_string(t_2(environment.getattr(environment.getattr(l_ns_sub, \'nameserver\'), \'ip\')))\n            yield u"\',\'%s\',%s,%s,\'%s\']," % (\n                t_2(environment.getattr(environment.getattr(l_index_result, \'index_host\'), \'record_name\')), \n                t_1(environment.getattr(l_index_result, \'duration\'), 3), \n                environment.getattr(l_index_result, \'ttl\'), \n                t_2(environment.getattr(l_index_result, \'response\')), \n            )\n        l_index_result = missing\n    l_ns_sub = missing\n    yield u\']);\\n      var table = new google.visualization.Table(document.getElementById(\\\'index_table\\\'));\\n      table.draw(data, {allowHtml: true});\\n    }\\n  </script>  \\n  \\n</head>\\n<body id="site">\\n\\n<div id="container">\\n  \'\n    if environment.getattr(l_nameserver, \'ip\'):\n        if 0: yield None\n        yield u\'\\n  <h1>%s (%s)</h1>\\n  <small>First seen %s</small>\\n  <h2>Global Average</h2>\\n  <h2>Best Performing Networks</h2>\\n  \\n  %s\\n  \\n  <h2>Worst Performing Networks</h2>\\n  <h2>Most Popular Networks</h2>\\n  \' % (\n            environment.getattr(l_nameserver, \'name\'), \n            l_ip, \n            environment.getattr(l_nameserver, \'timestamp\'), \n            l_best_networks_table, \n        )\n    else:\n        if 0: yield None\n        yield u\'\\n  <h1>%s died in a fire.</h1>\\n  \' % (\n            l_ip, \n        )\n    yield u\'\\n  \\n  \\n</div>\\n</body>\\n\\n\\n\\n</html>\'\n\nblocks = {}\ndebug_info = \'1=13&4=14&20=17&21=23&31=38&32=41&33=43&37=44&41=48&42=49&43=51\'')
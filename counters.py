@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Sharded counters for statistics that every upload touches.
+
+An entity group only sustains about one write a second, so each counter is
+spread over several CounterShard entities (key_name "name:index") and every
+write goes to a random one. Increments are buffered in memcache first and
+written to a shard in batches: when a counter's buffer reaches
+FLUSH_THRESHOLD, or on its first increment after FLUSH_INTERVAL. Buffered
+increments are lost if memcache evicts them, which these statistics can live
+with.
+
+Totals are read through cache.py, plus whatever is still buffered.
+
+increment_once() adds the increments of an entity, such as a submission,
+only the first time it is called for it; a CounterMarker child records that
+they were made, so retried tasks and backfill jobs do not count it again.
+
+The number of shards is looked up by the part of the counter name before the
+first ':' in SHARD_COUNTS. It may be raised but never lowered, as shards past
+the configured count are not read.
+"""
+import random
+
+from google.appengine.api import memcache
+from google.appengine.ext import db
+
+import cache
+import models
+
+SHARD_COUNTS = {
+  # Every listed submission.
+  'submissions': 20,
+  # Listed submissions per country: "country:<cc>".
+  'country': 5,
+  # Primary nameserver of listed submissions: "primary:<cc>:<ip>".
+  'primary': 2,
+}
+DEFAULT_SHARD_COUNT = 5
+FLUSH_THRESHOLD = 20
+FLUSH_INTERVAL = 60
+# Tries at taking a counter's buffer when other requests keep changing it.
+MAX_FLUSH_ATTEMPTS = 3
+TOTAL_CACHE_TTL = 60
+MAX_GET_BATCH = 500
+BUFFER_PREFIX = 'counter_buffer:'
+FLUSH_PREFIX = 'counter_flush:'
+
+
+def shard_count(name):
+  return SHARD_COUNTS.get(name.split(':')[0], DEFAULT_SHARD_COUNT)
+
+
+def _AddToShard(key_name, name, delta):
+  shard = models.CounterShard.get_by_key_name(key_name)
+  if not shard:
+    shard = models.CounterShard(key_name=key_name, name=name, count=0)
+  shard.count += delta
+  shard.put()
+
+
+def _Write(name, delta):
+  key_name = '%s:%d' % (name, random.randint(0, shard_count(name) - 1))
+  db.run_in_transaction(_AddToShard, key_name, name, delta)
+
+
+def flush(name):
+  """Write the buffered increments of a counter to one of its shards.
+
+  The buffer is taken with a compare-and-set, so of two requests flushing at
+  once, only the one that actually emptied it writes what it held.
+  """
+  buffer_key = BUFFER_PREFIX + name
+  client = memcache.Client()
+  for unused_attempt in range(MAX_FLUSH_ATTEMPTS):
+    pending = client.gets(buffer_key)
+    if not pending:
+      return 0
+    if client.cas(buffer_key, 0):
+      break
+  else:
+    # Busy; a later increment flushes it.
+    return 0
+  try:
+    _Write(name, int(pending))
+  except:
+    memcache.incr(buffer_key, pending, initial_value=0)
+    raise
+  return pending
+
+
+def increment_multi(deltas):
+  """Add to several counters: deltas is a dict of counter name -> amount."""
+  buffered = memcache.offset_multi(deltas, key_prefix=BUFFER_PREFIX, initial_value=0)
+  # Counters whose flush interval has passed; add_multi returns the others.
+  due = set(deltas) - set(memcache.add_multi(dict([(x, 1) for x in deltas]),
+                                             time=FLUSH_INTERVAL, key_prefix=FLUSH_PREFIX))
+  for name, delta in deltas.items():
+    if buffered.get(name) is None:
+      # memcache is unavailable, so write straight through.
+      _Write(name, delta)
+    elif name in due or buffered[name] >= FLUSH_THRESHOLD:
+      flush(name)
+
+
+def increment(name, delta=1):
+  increment_multi({name: delta})
+
+
+def _Mark(marker_key):
+  if db.get(marker_key):
+    return False
+  models.CounterMarker(key=marker_key).put()
+  return True
+
+
+def increment_once(parent_key, deltas):
+  """Add deltas for the entity of parent_key, unless they were added already.
+
+  Returns True if they were added.
+  """
+  marker_key = db.Key.from_path('CounterMarker', 'counted', parent=parent_key)
+  if not db.run_in_transaction(_Mark, marker_key):
+    return False
+  increment_multi(deltas)
+  return True
+
+
+def _LoadCounts(names):
+  keys = []
+  for name in names:
+    keys.extend([db.Key.from_path('CounterShard', '%s:%d' % (name, x))
+                 for x in range(shard_count(name))])
+  counts = dict([(x, 0) for x in names])
+  for i in range(0, len(keys), MAX_GET_BATCH):
+    for shard in db.get(keys[i:i + MAX_GET_BATCH]):
+      if shard:
+        counts[shard.name] += shard.count
+  return counts
+
+
+def get_counts(names):
+  """Return a dict of counter name -> total, for several counters at once."""
+  if not names:
+    return {}
+  stored = cache.get_multi('counter', names, _LoadCounts, TOTAL_CACHE_TTL)
+  pending = memcache.get_multi(names, key_prefix=BUFFER_PREFIX)
+  return dict([(x, (stored.get(x) or 0) + int(pending.get(x) or 0)) for x in names])
+
+
+def get_count(name):
+  return get_counts([name])[name]
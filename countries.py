@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Per-country nameserver statistics, folded in as submissions arrive.
+
+Storing a listed submission queues a fold task in the same transaction. For
+submissions with a country code, the task adds the submission's nameserver rows to the CountryAggregate of its
+country (key_name: country code), so /country/<cc> reads one entity instead
+of walking hundreds of submissions. Aggregates cover every listed
+submission of a country, not just the most recent ones.
+
+Rows are kept as sums rather than lists, keyed by IP:
+
+  name, ip, hostname, is_global, count, position_sum, position_count,
+  average_sum, average_count, histogram (a packed histogram.LatencyHistogram)
+
+The LOCAL_IP row collects the fastest non-global nameserver of each
+submission.
+
+Aggregates of submissions stored before folding existed, or built the wrong
+way, are not re-folded one task at a time: the "Recompute country aggregates
+and daily rollups" mapreduce job (recompute.py) builds them out of place and
+replaces each aggregate whole once every submission is in.
+"""
+import pickle
+import zlib
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import db
+
+from libnamebench import histogram
+import cache
+import models
+import prefetch
+
+FOLD_QUEUE = 'aggregate'
+FOLD_URL = '/tasks/fold_country'
+TABLE_CACHE_TTL = 3600
+LOCAL_IP = '__local__'
+# Only positions better than this count towards the average position.
+MAX_COUNTED_POSITION = 15
+# Folded submission ids remembered per country, so that a retried task does
+# not count a submission twice. Only recent folds are retried, so this does
+# not have to cover older submissions.
+MAX_FOLDED_IDS = 500
+# Late submissions read per query by replace_aggregate().
+LATE_BATCH_SIZE = 200
+# Times replace_aggregate() starts over when a fold gets in between.
+MAX_REPLACE_ATTEMPTS = 5
+# Keeps the aggregate well below the 1MB entity limit. The least popular
+# local nameservers are dropped first; global ones and LOCAL_IP always stay.
+MAX_ROWS = 300
+
+
+def queue_fold(submission_id):
+  """Queue the fold of a listed submission, within the transaction storing it."""
+  taskqueue.add(url=FOLD_URL, params={'id': submission_id}, queue_name=FOLD_QUEUE,
+                transactional=True)
+
+
+def _NewRow(name, ip, hostname, is_global):
+  return {
+    'name': name,
+    'ip': ip,
+    'hostname': hostname,
+    'is_global': is_global,
+    'count': 0,
+    'position_sum': 0,
+    'position_count': 0,
+    'average_sum': 0.0,
+    'average_count': 0,
+    'histogram': histogram.LatencyHistogram()
+  }
+
+
+def _AddToRow(row, ns_sub, latencies, count_position):
+  row['count'] += 1
+  if ns_sub.position is not None and count_position:
+    row['position_sum'] += ns_sub.position
+    row['position_count'] += 1
+  if ns_sub.overall_average is not None:
+    row['average_sum'] += ns_sub.overall_average
+    row['average_count'] += 1
+  row['histogram'].Merge(latencies)
+
+
+def submission_rows(ns_subs):
+  """Return the rows a single submission adds to its country, keyed by IP."""
+  rows = {LOCAL_IP: _NewRow('(Fastest local nameserver)', LOCAL_IP, '__fastest.local__', True)}
+  fastest_local = None
+  for ns_sub in ns_subs:
+    ns = ns_sub.nameserver
+    ip = "%s" % ns.ip
+    if ip not in rows:
+      rows[ip] = _NewRow(ns.name, ip, ns.hostname, ns.is_global)
+    latencies = ns_sub.latency_histogram()
+    _AddToRow(rows[ip], ns_sub, latencies, ns_sub.position < MAX_COUNTED_POSITION)
+    if not ns.is_global and (not fastest_local or
+                             ns_sub.overall_average < fastest_local[0].overall_average):
+      fastest_local = (ns_sub, latencies)
+
+  if fastest_local:
+    _AddToRow(rows[LOCAL_IP], fastest_local[0], fastest_local[1], True)
+  return rows
+
+
+def _LoadRows(aggregate):
+  rows = {}
+  if aggregate.data:
+    rows = pickle.loads(zlib.decompress(aggregate.data))
+  for row in rows.values():
+    row['histogram'] = histogram.Unpack(row['histogram'])
+  return rows
+
+
+def trim_rows(rows, max_rows=MAX_ROWS):
+  """Drop the least popular local nameserver rows, in place, until max_rows are left."""
+  if len(rows) > max_rows:
+    optional = [x for x in rows.values() if not x['is_global'] and x['ip'] != LOCAL_IP]
+    optional.sort(key=lambda x: x['count'])
+    for row in optional[:len(rows) - max_rows]:
+      del rows[row['ip']]
+
+
+def _SaveRows(aggregate, rows):
+  trim_rows(rows)
+  for row in rows.values():
+    row['histogram'] = histogram.Pack(row['histogram'])
+  aggregate.data = zlib.compress(pickle.dumps(rows, pickle.HIGHEST_PROTOCOL))
+
+
+def merge_rows(rows, additions):
+  """Add rows such as those of submission_rows() into rows, in place.
+
+  additions is left untouched, as the transaction may be retried.
+  """
+  for ip, addition in additions.items():
+    if ip not in rows:
+      rows[ip] = _NewRow(addition['name'], ip, addition['hostname'], addition['is_global'])
+    row = rows[ip]
+    # Names get filled in over time.
+    for field in ('name', 'hostname', 'is_global'):
+      if addition[field] is not None:
+        row[field] = addition[field]
+    for field in ('count', 'position_sum', 'position_count', 'average_sum', 'average_count'):
+      row[field] += addition[field]
+    row['histogram'].Merge(addition['histogram'])
+
+
+def _Fold(submission, additions):
+  """Add the rows of a submission to its CountryAggregate. Run in a transaction."""
+  submission_id = submission.key().id()
+  aggregate = models.CountryAggregate.get_by_key_name(submission.country_code)
+  if not aggregate:
+    aggregate = models.CountryAggregate(key_name=submission.country_code,
+                                        submission_count=0)
+  elif submission_id in aggregate.folded_ids:
+    return False
+  elif aggregate.recomputed_before and submission.timestamp < aggregate.recomputed_before:
+    # The recompute job counted it.
+    return False
+
+  rows = _LoadRows(aggregate)
+  merge_rows(rows, additions)
+  _SaveRows(aggregate, rows)
+  aggregate.submission_count += 1
+  if submission.country:
+    aggregate.country = submission.country
+  if not aggregate.last_submission or submission.timestamp > aggregate.last_submission:
+    aggregate.last_submission = submission.timestamp
+  aggregate.folded_ids = (aggregate.folded_ids + [submission_id])[-MAX_FOLDED_IDS:]
+  aggregate.put()
+  return True
+
+
+def load_nameservers(submission):
+  """Return the SubmissionNameServers of a submission, with their NameServers."""
+  return prefetch.prefetch_refprops(
+      models.SubmissionNameServer.all().filter('submission =', submission),
+      models.SubmissionNameServer.nameserver)
+
+
+def load_submission(submission_id):
+  """Return a listed submission and its SubmissionNameServers, or (None, None)."""
+  submission = models.Submission.get_by_id(submission_id)
+  if not submission or not submission.listed:
+    return (None, None)
+  return (submission, load_nameservers(submission))
+
+
+def counter_increments(submission, ns_subs):
+  """Return the counters.py increments of a listed submission, as a dict."""
+  increments = {'submissions': 1}
+  country_code = submission.country_code
+  if not country_code:
+    return increments
+  increments['country:%s' % country_code] = 1
+  primary_key = models.Submission.primary_nameserver.get_value_for_datastore(submission)
+  for ns_sub in ns_subs:
+    if ns_sub.nameserver.key() == primary_key:
+      increments['primary:%s:%s' % (country_code, ns_sub.nameserver.ip)] = 1
+  return increments
+
+
+def fold_submission(submission, rows):
+  """Fold the submission_rows of a submission into its CountryAggregate.
+
+  Returns True if it was added, False if it had been already.
+  """
+  added = db.run_in_transaction(_Fold, submission, rows)
+  if added:
+    cache.invalidate('country_table', submission.country_code)
+  return added
+
+
+def _Replace(country_code, folded_ids, fields, rows):
+  """Write a recomputed CountryAggregate, unless a fold changed it. Run in a transaction."""
+  aggregate = models.CountryAggregate.get_by_key_name(country_code)
+  if not aggregate:
+    aggregate = models.CountryAggregate(key_name=country_code)
+  if aggregate.folded_ids != folded_ids:
+    return False
+  _SaveRows(aggregate, rows)
+  for name, value in fields.items():
+    setattr(aggregate, name, value)
+  aggregate.put()
+  return True
+
+
+def _LateSubmissions(country_code, cutoff, folded_ids):
+  """Return the listed submissions of a country stored from cutoff on, oldest first.
+
+  The query pages through all of them. Its index may lag behind, so the
+  submissions a fold task already added (folded_ids) are fetched by key as
+  well: those are counted in the aggregate being replaced, and would be lost
+  otherwise. Any other submission the query misses has not been folded yet;
+  its fold task adds it later.
+  """
+  late = {}
+  query = models.Submission.all().filter('listed =', True)
+  query.filter('country_code =', country_code).filter('timestamp >=', cutoff)
+  query.order('-timestamp')
+  page = query.fetch(LATE_BATCH_SIZE)
+  while page:
+    for submission in page:
+      late[submission.key().id()] = submission
+    if len(page) < LATE_BATCH_SIZE:
+      break
+    page = query.with_cursor(query.cursor()).fetch(LATE_BATCH_SIZE)
+
+  missing = [x for x in folded_ids if x not in late]
+  for submission in models.Submission.get_by_id(missing):
+    if submission and submission.listed and submission.timestamp >= cutoff:
+      late[submission.key().id()] = submission
+  return sorted(late.values(), key=lambda x: x.timestamp)
+
+
+def replace_aggregate(country_code, country, submission_count, last_submission, rows, cutoff):
+  """Overwrite a CountryAggregate with rows recomputed from its submissions stored before cutoff.
+
+  Every submission stored from cutoff on is folded in on top, and becomes
+  folded_ids. From then on, fold tasks skip submissions stored before cutoff
+  as well as those, so none is counted twice. If a fold task gets in while the
+  late submissions are looked up, this starts over.
+  """
+  for unused_attempt in range(MAX_REPLACE_ATTEMPTS):
+    current = models.CountryAggregate.get_by_key_name(country_code)
+    folded_ids = (current and current.folded_ids) or []
+    late = _LateSubmissions(country_code, cutoff, folded_ids)
+
+    merged = {}
+    merge_rows(merged, rows)
+    # All of them, even past MAX_FOLDED_IDS, so that a fold task still queued
+    # for any of them skips it. Later folds trim the list as usual.
+    fields = {'country': country, 'submission_count': submission_count + len(late),
+              'last_submission': last_submission, 'recomputed_before': cutoff,
+              'folded_ids': [x.key().id() for x in late]}
+    for submission in late:
+      merge_rows(merged, submission_rows(load_nameservers(submission)))
+      fields['country'] = submission.country or fields['country']
+      if not fields['last_submission'] or submission.timestamp > fields['last_submission']:
+        fields['last_submission'] = submission.timestamp
+    if db.run_in_transaction(_Replace, country_code, folded_ids, fields, merged):
+      cache.invalidate('country_table', country_code)
+      return
+  raise db.TransactionFailedError('Folds kept changing CountryAggregate %s.' % country_code)
+
+
+def _LoadTable(country_code):
+  aggregate = models.CountryAggregate.get_by_key_name(country_code)
+  if not aggregate:
+    return None
+
+  rows = _LoadRows(aggregate)
+  for row in rows.values():
+    if row['average_count']:
+      row['overall_average'] = row['average_sum'] / row['average_count']
+    else:
+      row['overall_average'] = -1
+    if row['position_count']:
+      row['overall_position'] = float(row['position_sum']) / row['position_count']
+    else:
+      row['overall_position'] = -1
+    row['results'] = row.pop('histogram')
+  return {
+    'country': aggregate.country,
+    'submission_count': aggregate.submission_count,
+    'last_submission': aggregate.last_submission,
+    'nameservers': rows
+  }
+
+
+def get_table(country_code):
+  """Return the nameserver table of a country, or None if nothing was folded yet.
+
+  The result is a dict with the country name, submission_count,
+  last_submission and 'nameservers', a dict of IP -> row. Rows have
+  overall_average and overall_position (-1 when unknown) and 'results', a
+  histogram.LatencyHistogram. The table is shared, so treat it as read-only.
+  """
+  return cache.get_or_compute('country_table', country_code,
+                              lambda: _LoadTable(country_code), TABLE_CACHE_TTL)
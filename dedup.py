@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Duplicate upload and listing rate checks for /submit.
+
+Both checks are keyed lookups rather than queries:
+
+  - SubmissionMarker, key_name "class_c:submit_id", catches a re-sent upload.
+  - ListingWindow, key_name "class_c:client_id", remembers when a client last
+    had a listed submission. /submit reads it through memcache to tell the
+    client early; the ingest worker reserves the listing in a transaction on
+    it with reserve_listing(), so that uploads queued close together cannot
+    all be listed.
+
+tasks.ClearDuplicateIdHandler deletes both once they are older than
+MIN_LISTING_DELTA, in batches with clear_expired().
+"""
+import datetime
+import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import db
+
+import models
+
+# The minimum amount of time between submissions that we list.
+MIN_LISTING_DELTA = datetime.timedelta(hours=6)
+LISTING_CACHE_PREFIX = 'listings:'
+# What clear_expired() works through, in order. SubmissionMarker and
+# ListingWindow records are deleted; Submissions stored before dedup.py have
+# their client_id and submit_id cleared.
+EXPIRY_STAGES = ('SubmissionMarker', 'ListingWindow', 'Submission')
+EXPIRY_BATCH_SIZE = 200
+# Lowest IntegerProperty value: "client_id >=" this matches every Submission
+# that still has a client_id, and unlike "!=" can be resumed from a cursor.
+_MIN_INTEGER = -2 ** 63
+
+
+def reserve_submission_key(class_c, submit_id):
+  """Return (submission_key, is_duplicate) for an upload.
+
+  The Submission id is reserved by the first upload for a class_c:submit_id
+  pair. Later uploads get the same key back, and are reported as duplicates
+  when that submission has already been written or queued.
+  """
+  key_name = '%s:%s' % (class_c, submit_id)
+  marker = models.SubmissionMarker.get_by_key_name(key_name)
+  if marker:
+    submission_key = db.Key.from_path('Submission', marker.submission_id)
+    payload_key = db.Key.from_path('SubmissionPayload', 'payload', parent=submission_key)
+    return (submission_key, db.get([submission_key, payload_key]) != [None, None])
+
+  first_id = db.allocate_ids(db.Key.from_path('Submission', 1), 1)[0]
+  marker = models.SubmissionMarker.get_or_insert(key_name, submission_id=first_id)
+  return (db.Key.from_path('Submission', marker.submission_id), False)
+
+
+def _get_listing_times(key_name):
+  times = memcache.get(LISTING_CACHE_PREFIX + key_name)
+  if times is not None:
+    return times
+  window = models.ListingWindow.get_by_key_name(key_name)
+  if window:
+    times = window.listed
+  else:
+    times = []
+  memcache.set(LISTING_CACHE_PREFIX + key_name, times)
+  return times
+
+
+def recent_listing_count(class_c, client_id, delta):
+  """Return how many listed submissions the client had within delta."""
+  check_ts = datetime.datetime.now() - delta
+  times = _get_listing_times('%s:%s' % (class_c, client_id))
+  return len([x for x in times if x > check_ts])
+
+
+def _ReserveListing(key_name, submission_id, now, delta):
+  """Add a listing to a ListingWindow unless another is within delta. Run in a transaction.
+
+  Returns:
+    (reserved, listing times)
+  """
+  window = models.ListingWindow.get_by_key_name(key_name)
+  if not window:
+    window = models.ListingWindow(key_name=key_name)
+  ids = window.submission_ids
+  ids = [None] * (len(window.listed) - len(ids)) + ids
+  recent = [(x, y) for (x, y) in zip(window.listed, ids) if x > now - delta]
+  if submission_id in [y for (x, y) in recent]:
+    # A retried ingest task reserved it already.
+    return (True, [x for (x, y) in recent])
+  if recent:
+    return (False, [x for (x, y) in recent])
+  window.listed = [now]
+  window.submission_ids = [submission_id]
+  window.put()
+  return (True, window.listed)
+
+
+def reserve_listing(class_c, client_id, submission_id, delta):
+  """Reserve a listing for a submission unless the client had another within delta.
+
+  Returns True if the submission may be listed. Asking again for the same
+  submission returns True again.
+  """
+  key_name = '%s:%s' % (class_c, client_id)
+  reserved, times = db.run_in_transaction(_ReserveListing, key_name, submission_id,
+                                          datetime.datetime.now(), delta)
+  memcache.set(LISTING_CACHE_PREFIX + key_name, times, int(delta.days * 86400 + delta.seconds))
+  return reserved
+
+
+def _ExpiryQuery(stage, expired_before):
+  if stage == 'Submission':
+    # Nothing sets client_id any more, so this only finds old submissions.
+    return models.Submission.all(keys_only=True).filter('client_id >=', _MIN_INTEGER)
+  return getattr(models, stage).all(keys_only=True).filter('timestamp <', expired_before)
+
+
+def _ClearBatch(stage, keys, expired_before):
+  if stage != 'Submission':
+    db.delete(keys)
+    return len(keys)
+  cleared = []
+  for record in db.get(keys):
+    if record and record.timestamp < expired_before:
+      record.client_id = None
+      record.submit_id = None
+      cleared.append(record)
+  db.put(cleared)
+  return len(cleared)
+
+
+def clear_expired(expired_before, stage=0, cursor=None, deadline=20):
+  """Clear dedup records older than expired_before, a batch at a time.
+
+  Works through EXPIRY_STAGES, starting at the given stage index and query
+  cursor, until everything is done or deadline seconds have passed.
+
+  Returns:
+    (stage, cursor, rows cleared, finished); pass stage and cursor back in to
+    carry on where this call stopped.
+  """
+  started = time.time()
+  cleared = 0
+  while stage < len(EXPIRY_STAGES) and time.time() - started < deadline:
+    query = _ExpiryQuery(EXPIRY_STAGES[stage], expired_before)
+    if cursor:
+      query.with_cursor(cursor)
+    keys = query.fetch(EXPIRY_BATCH_SIZE)
+    if keys:
+      cleared += _ClearBatch(EXPIRY_STAGES[stage], keys, expired_before)
+    if len(keys) < EXPIRY_BATCH_SIZE:
+      stage += 1
+      cursor = None
+    else:
+      cursor = query.cursor()
+  return (stage, cursor, cleared, stage >= len(EXPIRY_STAGES))
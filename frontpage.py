@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import db
+from google.appengine.ext import webapp
+from django.utils import simplejson
+
+import counters
+import http_cache
+import recent
+
+MAPS_API_KEY = 'ABQIAAAAUgt_ZC0I2rXmTLwIzIUALxR_qblnQoD-DakP6eidTTtErCQTehR_m1HgdQwvNF2bjiq3H5qlCIV-jQ'
+# Changes whenever the list of index hosts does; used as the /index_hosts ETag.
+INDEX_HOSTS_VERSION_KEY = 'index_hosts_version'
+
+class MainHandler(webapp.RequestHandler):
+  """Handler for / requests"""
+  def get(self):
+    # Imported here: every namebench run fetches /index_hosts from this
+    # module, and has no use for the template system.
+    import rendering
+
+    submissions = recent.get_rows()
+    template_values = {
+      'submission_count': counters.get_count('submissions'),
+      'recent_submissions': submissions[0:15],
+      'submissions': submissions,
+      'maps_api_key': MAPS_API_KEY
+    }  
+    self.response.out.write(rendering.render('index.html', template_values))
+
+
+class IndexHostsHandler(webapp.RequestHandler):
+    
+  """Handler for /index_requests."""
+  def get(self):
+    hosts = []
+    for record in db.GqlQuery("SELECT * FROM IndexHost WHERE listed=True"):
+      hosts.append((str(record.record_type), str(record.record_name)))
+    self.response.out.write(simplejson.dumps(hosts))
+
+
+def index_hosts_version():
+  """Validator for http_cache.conditional."""
+  version = memcache.get(INDEX_HOSTS_VERSION_KEY)
+  if version is None:
+    version = int(time.time())
+    memcache.add(INDEX_HOSTS_VERSION_KEY, version)
+  return 'index-hosts-%s' % version
+
+
+IndexHostsHandler = http_cache.conditional(IndexHostsHandler, validator=index_hosts_version)
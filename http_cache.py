@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Conditional GET and Cache-Control headers for webapp handlers.
+
+conditional() wraps a handler class so that a request carrying a matching
+If-None-Match gets a 304 before the handler runs, and every other response is
+marked as publicly cacheable so that Google's frontend cache can answer
+repeat hits. Immutable pages are validated by their handler instead, through
+not_modified(), once it has found what the page shows: a 304 then also
+vouches that the page exists. Errors,
+whether returned or raised, are not cached, and neither are pages whose
+handler calls disable(), such as fallbacks shown until the real page exists.
+"""
+import calendar
+import email.utils
+
+DEFAULT_MAX_AGE = 3600
+# Submission pages never change; a year is the most HTTP/1.1 allows.
+IMMUTABLE_MAX_AGE = 365 * 86400
+
+
+def _set_cache_headers(response, etag, max_age):
+  response.headers['Cache-Control'] = 'public, max-age=%d' % max_age
+  if etag:
+    response.headers['ETag'] = etag
+
+
+def set_last_modified(response, timestamp):
+  """Send a Last-Modified header for a naive UTC datetime."""
+  response.headers['Last-Modified'] = email.utils.formatdate(
+      calendar.timegm(timestamp.utctimetuple()), usegmt=True)
+
+
+def disable(response):
+  """Keep a response out of every cache, e.g. for errors or unfinished pages."""
+  for header in ('ETag', 'Last-Modified'):
+    if header in response.headers:
+      del response.headers[header]
+  response.headers['Cache-Control'] = 'no-cache'
+
+
+def _not_modified(request, etag, last_modified=None):
+  if_none_match = request.headers.get('If-None-Match')
+  if if_none_match:
+    if not etag:
+      return False
+    tags = [x.strip() for x in if_none_match.split(',')]
+    tags = [x.startswith('W/') and x[2:] or x for x in tags]
+    return '*' in tags or etag in tags
+  if_modified_since = request.headers.get('If-Modified-Since')
+  if not if_modified_since or not last_modified:
+    return False
+  since = email.utils.parsedate_tz(if_modified_since)
+  if not since:
+    return False
+  return calendar.timegm(last_modified.utctimetuple()) <= email.utils.mktime_tz(since)
+
+
+def not_modified(handler, timestamp):
+  """Validate the request of an immutable page, once its handler found the page's data.
+
+  Sends Last-Modified for timestamp, a naive UTC datetime. Returns True, with
+  the status set to 304, if the client's copy matches the ETag or is not
+  older than timestamp; the handler should then return without a body.
+  """
+  set_last_modified(handler.response, timestamp)
+  if _not_modified(handler.request, handler.response.headers.get('ETag'), timestamp):
+    handler.response.set_status(304)
+    return True
+  return False
+
+
+def conditional(handler_class, validator=None, max_age=DEFAULT_MAX_AGE, immutable=False):
+  """Return a subclass of handler_class with conditional GET support.
+
+  Args:
+    handler_class: a webapp.RequestHandler subclass.
+    validator: called with the URL arguments; returns a string that changes
+      whenever the page does, or None. Must not touch the datastore.
+    max_age: seconds that browsers and proxies may cache the page.
+    immutable: the page never changes once it has been served successfully.
+      Its handler validates the request with not_modified().
+
+  Returns:
+    The wrapped handler class.
+  """
+
+  class ConditionalHandler(handler_class):
+
+    def get(self, *args):
+      etag = None
+      if validator:
+        etag = validator(*args)
+      if etag:
+        etag = '"%s"' % etag
+      _set_cache_headers(self.response, etag, max_age)
+      if not immutable and _not_modified(self.request, etag):
+        self.response.set_status(304)
+        return
+      result = handler_class.get(self, *args)
+      if self.response.status_int not in (200, 304):
+        disable(self.response)
+      return result
+
+    def handle_exception(self, exception, debug_mode):
+      disable(self.response)
+      return handler_class.handle_exception(self, exception, debug_mode)
+
+  ConditionalHandler.__name__ = handler_class.__name__
+  return ConditionalHandler
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Mapper functions and input readers for the bundled mapreduce library.
+
+Jobs are registered in mapreduce.yaml and started from /mapreduce.
+"""
+
+import datetime
+
+# our private stash of third party code
+import third_party
+
+from google.appengine.ext import db
+from mapreduce import context
+from mapreduce import errors
+from mapreduce import input_readers
+from mapreduce import operation as op
+
+from libnamebench import histogram
+from libnamebench import packing
+import analytics
+import counters
+import countries
+import models
+import recompute
+import reports
+import submit
+
+
+def pack_run_results(ns_sub):
+  """Move the RunResult rows of a SubmissionNameServer into packed_durations.
+
+  Safe to re-run: rows left behind by an interrupted run are deleted once the
+  durations have been packed.
+  """
+  runs = sorted(ns_sub.results, key=lambda x: x.run_number)
+  if not ns_sub.packed_durations:
+    if not runs:
+      yield op.counters.Increment('no_durations')
+      return
+    ns_sub.packed_durations = packing.PackDurations([x.durations for x in runs])
+    yield op.db.Put(ns_sub)
+    yield op.counters.Increment('packed')
+  for run in runs:
+    yield op.db.Delete(run)
+  yield op.counters.Increment('run_results_deleted', len(runs))
+
+
+def rebuild_report(submission):
+  """Rebuild the SubmissionReport of a submission if it is from an older REPORT_VERSION."""
+  report = models.SubmissionReport.get(
+      db.Key.from_path('SubmissionReport', 'report', parent=submission.key()))
+  if report and report.version == reports.REPORT_VERSION:
+    yield op.counters.Increment('current')
+    return
+  reports.save_report(submission)
+  yield op.counters.Increment('rebuilt')
+
+
+def pack_latency_histogram(ns_sub):
+  """Fill in packed_histogram for SubmissionNameServers stored before it existed."""
+  if ns_sub.packed_histogram:
+    yield op.counters.Increment('current')
+    return
+  latencies = ns_sub.latency_histogram()
+  if not latencies.count:
+    yield op.counters.Increment('no_durations')
+    return
+  ns_sub.packed_histogram = histogram.Pack(latencies)
+  yield op.db.Put(ns_sub)
+  yield op.counters.Increment('packed')
+
+
+def backfill_counters(submission):
+  """Add the counters.py increments of a listed submission that was not counted yet.
+
+  Submissions the fold task counted already are skipped, so this can run
+  alongside uploads. To rebuild the counters from scratch, delete the
+  CounterShard and CounterMarker entities before starting this job.
+  """
+  if not submission.listed:
+    yield op.counters.Increment('skipped')
+    return
+  increments = countries.counter_increments(submission, countries.load_nameservers(submission))
+  if counters.increment_once(submission.key(), increments):
+    yield op.counters.Increment('counted')
+  else:
+    yield op.counters.Increment('already_counted')
+
+
+class ListedSubmissionReader(input_readers.InputReader):
+  """Reads the listed submissions of the last days, newest first.
+
+  The window is split into one timestamp range per shard. A shard pages
+  through its range with a query cursor, and its state is the cursor of the
+  current page plus how many of its submissions were read, so a resumed shard
+  neither skips nor repeats any.
+  """
+  DAYS_PARAM = 'days'
+  BATCH_SIZE_PARAM = 'batch_size'
+  TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+  _BATCH_SIZE = 50
+
+  def __init__(self, start, end, cursor=None, read=0, batch_size=_BATCH_SIZE):
+    self._start = start
+    self._end = end
+    self._cursor = cursor
+    self._read = read
+    self._batch_size = batch_size
+
+  def _Query(self):
+    query = models.Submission.all().filter('listed =', True)
+    query.filter('timestamp >=', self._start).filter('timestamp <', self._end)
+    return query.order('-timestamp')
+
+  def __iter__(self):
+    while True:
+      query = self._Query()
+      if self._cursor:
+        query.with_cursor(self._cursor)
+      page = query.fetch(self._batch_size)
+      for submission in page[self._read:]:
+        # The caller consumes what is yielded before it saves the state.
+        self._read += 1
+        yield submission
+      if len(page) < self._batch_size:
+        return
+      self._cursor = query.cursor()
+      self._read = 0
+
+  def __str__(self):
+    return '%s to %s' % (self._start, self._end)
+
+  def to_json(self):
+    return {'start': self._start.strftime(self.TIME_FORMAT),
+            'end': self._end.strftime(self.TIME_FORMAT),
+            'cursor': self._cursor, 'read': self._read,
+            self.BATCH_SIZE_PARAM: self._batch_size}
+
+  @classmethod
+  def from_json(cls, json):
+    return cls(datetime.datetime.strptime(json['start'], cls.TIME_FORMAT),
+               datetime.datetime.strptime(json['end'], cls.TIME_FORMAT),
+               json['cursor'], json['read'], json[cls.BATCH_SIZE_PARAM])
+
+  @classmethod
+  def validate(cls, mapper_spec):
+    if mapper_spec.input_reader_class() != cls:
+      raise errors.BadReaderParamsError("Input reader class mismatch")
+    for name in (cls.DAYS_PARAM, cls.BATCH_SIZE_PARAM):
+      if name not in mapper_spec.params:
+        continue
+      try:
+        if int(mapper_spec.params[name]) < 1:
+          raise errors.BadReaderParamsError("Bad %s: %s" % (name, mapper_spec.params[name]))
+      except ValueError, e:
+        raise errors.BadReaderParamsError("Bad %s: %s" % (name, e))
+
+  @classmethod
+  def split_input(cls, mapper_spec):
+    params = mapper_spec.params
+    end = datetime.datetime.now()
+    since = end - datetime.timedelta(days=int(params.get(cls.DAYS_PARAM, 7)))
+    batch_size = int(params.get(cls.BATCH_SIZE_PARAM, cls._BATCH_SIZE))
+    shards = max(1, mapper_spec.shard_count)
+    step = (end - since) / shards
+    bounds = [since + step * i for i in range(shards)] + [end]
+    return [cls(start, shard_end, batch_size=batch_size)
+            for (start, shard_end) in zip(bounds[:-1], bounds[1:])]
+
+
+def count_submissions(submission):
+  """Count a listed submission into the group totals of the job.
+
+  Run with ListedSubmissionReader; takes the comma separated group_by from the
+  job parameters. The totals are summed in recompute.py parts, as counters
+  would outgrow their entity with a value per nameserver; read them with
+  tools/get_country_totals.py --job. Unlike analytics.count_submissions,
+  every submission of a class C network is counted.
+  """
+  params = context.get().mapreduce_spec.mapper.params
+  group_bys = [x.strip() for x in params.get('group_by', 'country').split(',')]
+  values = analytics.group_values(submission, group_bys)
+  if 'input_source' in group_bys:
+    config = models.SubmissionConfig.all().ancestor(submission).get()
+    values['input_source'] = config and config.input_source
+  recompute.combiner().count(submission, values)
+  yield op.counters.Increment('counted')
+
+
+def recompute_statistics(submission):
+  """Add a listed submission to the recomputed CountryAggregates and DailyRollups.
+
+  See recompute.py; the job needs /tasks/finish_recompute as its done_callback.
+  """
+  if not submission.listed or not submission.country_code:
+    yield op.counters.Increment('skipped')
+    return
+  combiner = recompute.combiner()
+  if submission.timestamp >= combiner.cutoff:
+    # Folded in by finish(), along with the fold task.
+    yield op.counters.Increment('after_cutoff')
+    return
+  rows = countries.submission_rows(countries.load_nameservers(submission))
+  combiner.add(submission, rows)
+  yield op.counters.Increment('submissions')
+
+
+def recompute_submission_fields(submission):
+  """Refresh the denormalized fields of a submission from its SubmissionNameServers."""
+  ns_subs = models.SubmissionNameServer.all().filter('submission =', submission)
+  fields = submit.submission_fields(ns_subs)
+  current = {}
+  for name in fields:
+    prop = getattr(models.Submission, name)
+    current[name] = prop.get_value_for_datastore(submission)
+  if current == fields:
+    yield op.counters.Increment('current')
+    return
+  for name, value in fields.items():
+    setattr(submission, name, value)
+  yield op.db.Put(submission)
+  yield op.counters.Increment('updated')
@@ -16,15 +16,22 @@
 
 __author__ = 'tstromberg@google.com (Thomas Stromberg)'
 
-import itertools
+import bisect
 import math
 import re
 import urllib
 
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
 # external dependencies (from nb_third_party)
 from graphy import common
 from graphy.backends import google_chart_api
 
+from libnamebench import histogram
+
 CHART_URI = 'http://chart.apis.google.com/chart'
 BASE_COLORS = ('ff9900', '1a00ff', 'ff00e6', '80ff00', '00e6ff', 'fae30a',
                'BE81F7', '9f5734', '000000', 'ff0000', '3090c0', '477248f',
@@ -32,6 +39,8 @@ BASE_COLORS = ('ff9900', '1a00ff', 'ff00e6', '80ff00', '00e6ff', 'fae30a',
                '051290', 'f3e000', '9030f0', 'f03060', 'e0a030', '4598cd')
 CHART_WIDTH = 720
 CHART_HEIGHT = 415
+# Shorter series are faster to walk in plain Python than to hand to numpy.
+NUMPY_MIN_RESULTS = 256
 
 
 def DarkenHexColorCode(color, shade=1):
@@ -153,7 +162,8 @@ def _MakeCumulativeDistribution(run_data, x_chunk=1.5, percent_chunk=3.5):
   """Given run data, generate a cumulative distribution (X in Xms).
 
   Args:
-    run_data: a tuple of nameserver and query durations
+    run_data: a tuple of nameserver and query durations (a list of durations
+      or a histogram.LatencyHistogram)
     x_chunk: How much value should be chunked together on the x-axis
     percent_chunk: How much percentage should be chunked together on y-axis.
 
@@ -163,47 +173,125 @@ def _MakeCumulativeDistribution(run_data, x_chunk=1.5, percent_chunk=3.5):
   We chunk the data together to intelligently minimize the number of points
   that need to be passed to the Google Chart API later (URL limitation!)
   """
-  # TODO(tstromberg): Use a more efficient algorithm. Pop values out each iter?
   dist = []
   for (ns, results) in run_data:
     if not results:
       continue
-    
-    host_dist = [(0, 0)]
-    max_result = max(results)
-    chunk_max = min(results)
-    # Why such a low value? To make sure the delta for the first coordinate is
-    # always >percent_chunk. We always want to store the first coordinate.
-    last_percent = -99
-
-    while chunk_max < max_result:
-      values = [x for x in results if x <= chunk_max]
-      percent = float(len(values)) / float(len(results)) * 100
 
+    if isinstance(results, histogram.LatencyHistogram):
+      dist.append((ns, _HistogramHostDistribution(results, percent_chunk)))
+      continue
+
+    values = sorted(results)
+    if numpy and len(values) >= NUMPY_MIN_RESULTS:
+      host_dist = _NumpyHostDistribution(values, x_chunk, percent_chunk)
+    else:
+      host_dist = _HostDistribution(values, x_chunk, percent_chunk)
+    dist.append((ns, host_dist))
+  return dist
+
+
+def _HostDistribution(values, x_chunk, percent_chunk):
+  """Return the cumulative distribution points for one sorted series.
+
+  chunk_max is still stepped by repeatedly adding x_chunk, so the points are
+  exactly those of the original per-step scan; the sorted values are just
+  walked once instead of being filtered again at every step.
+  """
+  host_dist = [(0, 0)]
+  total = len(values)
+  max_result = values[-1]
+  chunk_max = values[0]
+  # Why such a low value? To make sure the delta for the first coordinate is
+  # always >percent_chunk. We always want to store the first coordinate.
+  last_percent = -99
+  count = 0
+
+  while chunk_max < max_result:
+    if values[count] <= chunk_max:
+      count = bisect.bisect_right(values, chunk_max, count)
+      percent = float(count) / float(total) * 100
+      # Steps that add no values cannot add a point, so they are skipped.
       if (percent - last_percent) > percent_chunk:
-        host_dist.append((percent, max(values)))
+        host_dist.append((percent, values[count - 1]))
         last_percent = percent
 
-      # TODO(tstromberg): Think about using multipliers to degrade precision.
-      chunk_max += x_chunk
+    # TODO(tstromberg): Think about using multipliers to degrade precision.
+    chunk_max += x_chunk
+
+  # Make sure the final coordinate is exact.
+  host_dist.append((100, max_result))
+  return host_dist
+
+
+def _NumpyHostDistribution(values, x_chunk, percent_chunk):
+  """numpy version of _HostDistribution, for long series."""
+  max_result = values[-1]
+  values = numpy.array(values, dtype=numpy.float64)
+  # cumsum adds sequentially, giving the same chunk_max values as the loop.
+  steps = int(math.ceil((max_result - values[0]) / x_chunk)) + 2
+  chunk_maxes = numpy.empty(steps, dtype=numpy.float64)
+  chunk_maxes[0] = values[0]
+  chunk_maxes[1:] = x_chunk
+  chunk_maxes = numpy.cumsum(chunk_maxes)
+  if chunk_maxes[-1] < max_result:
+    return _HostDistribution(values.tolist(), x_chunk, percent_chunk)
+  chunk_maxes = chunk_maxes[:numpy.searchsorted(chunk_maxes, max_result, 'left')]
+
+  counts = numpy.searchsorted(values, chunk_maxes, 'right')
+  percents = counts / float(len(values)) * 100
+  # Only steps that add values can add a point.
+  changed = numpy.flatnonzero(numpy.diff(counts)) + 1
+  host_dist = [(0, 0)]
+  last_percent = -99
+  if len(counts):
+    changed = [0] + changed.tolist()
+  for index in changed:
+    percent = float(percents[index])
+    if (percent - last_percent) > percent_chunk:
+      host_dist.append((percent, float(values[counts[index] - 1])))
+      last_percent = percent
+
+  host_dist.append((100, max_result))
+  return host_dist
+
+
+def _HistogramHostDistribution(results, percent_chunk):
+  """Return the cumulative distribution points for a LatencyHistogram.
+
+  The histogram buckets already group nearby durations, so there is no
+  x_chunk stepping: every bucket is a candidate point.
+  """
+  host_dist = [(0, 0)]
+  last_percent = -99
+  for (duration, seen) in results.CumulativeCounts()[:-1]:
+    percent = float(seen) / float(results.count) * 100
+    if (percent - last_percent) > percent_chunk:
+      host_dist.append((percent, duration))
+      last_percent = percent
 
-    # Make sure the final coordinate is exact.
-    host_dist.append((100, max_result))
-    dist.append((ns, host_dist))
-  return dist
+  host_dist.append((100, results.max))
+  return host_dist
 
 
 def _MaximumRunDuration(run_data):
   """For a set of run data, return the longest duration.
 
   Args:
-    run_data: a tuple of nameserver and query durations
+    run_data: a tuple of nameserver and query durations (a list of durations
+      or a histogram.LatencyHistogram)
 
   Returns:
     longest duration found in runs_data (float)
   """
-  times = [x[1] for x in run_data]
-  return max(itertools.chain(*times))
+  longest = []
+  for (ns, results) in run_data:
+    if isinstance(results, histogram.LatencyHistogram):
+      if results.count:
+        longest.append(results.max)
+    elif results:
+      longest.append(max(results))
+  return max(longest)
 
 
 def _SortDistribution(a, b):
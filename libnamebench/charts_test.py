@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the cumulative distributions of charts.py.
+
+Run from the top directory: python -m unittest libnamebench.charts_test
+"""
+
+import random
+import unittest
+
+# our private stash of third party code, for graphy
+import third_party
+
+from libnamebench import charts
+
+
+def _OriginalCumulativeDistribution(run_data, x_chunk=1.5, percent_chunk=3.5):
+  """_MakeCumulativeDistribution as it was before the single sorted pass."""
+  dist = []
+  for (ns, results) in run_data:
+    if not results:
+      continue
+
+    host_dist = [(0, 0)]
+    max_result = max(results)
+    chunk_max = min(results)
+    last_percent = -99
+
+    while chunk_max < max_result:
+      values = [x for x in results if x <= chunk_max]
+      percent = float(len(values)) / float(len(results)) * 100
+
+      if (percent - last_percent) > percent_chunk:
+        host_dist.append((percent, max(values)))
+        last_percent = percent
+
+      chunk_max += x_chunk
+
+    host_dist.append((100, max_result))
+    dist.append((ns, host_dist))
+  return dist
+
+
+def _RunData():
+  rng = random.Random(2010)
+  run_data = [
+      ('empty', []),
+      ('single', [12.5]),
+      ('same', [30.0] * 20),
+      ('integers', [rng.randint(1, 400) for x in range(300)]),
+      ('uniform', [rng.uniform(0.5, 250) for x in range(500)]),
+      ('long tail', [rng.expovariate(1 / 40.0) for x in range(1000)]),
+      ('fast', [rng.uniform(0.1, 3) for x in range(400)]),
+      ('shuffled duplicates', [rng.choice((1.5, 3.0, 4.5, 80.25)) for x in range(260)]),
+  ]
+  for count in (2, 3, 10, 255, 256, 257):
+    run_data.append(('%d values' % count, [rng.lognormvariate(3, 1) for x in range(count)]))
+  return run_data
+
+
+class CumulativeDistributionTest(unittest.TestCase):
+
+  def setUp(self):
+    self.numpy = charts.numpy
+    self.numpy_min_results = charts.NUMPY_MIN_RESULTS
+
+  def tearDown(self):
+    charts.numpy = self.numpy
+    charts.NUMPY_MIN_RESULTS = self.numpy_min_results
+
+  def assertSameDistribution(self, x_chunk, percent_chunk):
+    run_data = _RunData()
+    expected = _OriginalCumulativeDistribution(run_data, x_chunk, percent_chunk)
+    actual = charts._MakeCumulativeDistribution(run_data, x_chunk, percent_chunk)
+    self.assertEqual([x[0] for x in expected], [x[0] for x in actual])
+    for ((ns, expected_points), (unused_ns, points)) in zip(expected, actual):
+      self.assertEqual(expected_points, points, ns)
+
+  def testPurePython(self):
+    charts.numpy = None
+    for (x_chunk, percent_chunk) in ((1.5, 3.5), (0.1, 0.5), (7, 10)):
+      self.assertSameDistribution(x_chunk, percent_chunk)
+
+  @unittest.skipUnless(charts.numpy, 'numpy is not installed')
+  def testNumpy(self):
+    charts.NUMPY_MIN_RESULTS = 0
+    for (x_chunk, percent_chunk) in ((1.5, 3.5), (0.1, 0.5), (7, 10)):
+      self.assertSameDistribution(x_chunk, percent_chunk)
+
+
+if __name__ == '__main__':
+  unittest.main()
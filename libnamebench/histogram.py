@@ -0,0 +1,196 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A mergeable, log-bucketed latency histogram.
+
+Durations are counted in buckets whose width grows by GROWTH (2%) each, so
+any quantile is within about 1% of the true value, while a histogram never
+needs more than a few hundred buckets however many durations it has seen.
+Histograms of different submissions can be merged into one.
+
+A packed histogram looks like this (all integers little-endian):
+
+  format version (B), flags (B), bucket count (H), total count (I),
+  minimum (d), maximum (d), sum (d), bucket indexes (H * bucket count),
+  bucket counts (I * bucket count).
+
+Everything after the header is zlib compressed when FLAG_ZLIB is set.
+"""
+
+import array
+import math
+import struct
+import sys
+import zlib
+
+FORMAT_VERSION = 1
+FLAG_ZLIB = 1
+COMPRESS_THRESHOLD = 512
+
+# Durations (in ms) below MIN_VALUE share bucket 0.
+MIN_VALUE = 0.1
+GROWTH = 1.02
+MAX_BUCKET = 65535
+
+_LOG_GROWTH = math.log(GROWTH)
+_HEADER = '<BBHIddd'
+_HEADER_SIZE = struct.calcsize(_HEADER)
+
+
+def BucketIndex(value):
+  """Return the bucket a duration is counted in."""
+  if value < MIN_VALUE:
+    return 0
+  return min(int(math.log(value / MIN_VALUE) / _LOG_GROWTH) + 1, MAX_BUCKET)
+
+
+def _ToLittleEndian(values):
+  if sys.byteorder == 'big':
+    values.byteswap()
+  return values
+
+
+class LatencyHistogram(object):
+  """Counts of durations by bucket, plus their exact count, sum, min and max."""
+
+  def __init__(self, values=None):
+    self.buckets = {}
+    self.count = 0
+    self.total = 0.0
+    self.min = None
+    self.max = None
+    if values:
+      self.Extend(values)
+
+  def __len__(self):
+    return self.count
+
+  def __repr__(self):
+    return '<LatencyHistogram count=%s min=%s max=%s>' % (self.count, self.min, self.max)
+
+  def __getstate__(self):
+    return Pack(self)
+
+  def __setstate__(self, state):
+    self.__dict__.update(Unpack(state).__dict__)
+
+  def Add(self, value, count=1):
+    value = float(value)
+    index = BucketIndex(value)
+    self.buckets[index] = self.buckets.get(index, 0) + count
+    self.count += count
+    self.total += value * count
+    if self.min is None or value < self.min:
+      self.min = value
+    if self.max is None or value > self.max:
+      self.max = value
+
+  def Extend(self, values):
+    for value in values:
+      self.Add(value)
+
+  def Merge(self, other):
+    """Add the counts of another histogram to this one."""
+    if not other.count:
+      return
+    for index, count in other.buckets.iteritems():
+      self.buckets[index] = self.buckets.get(index, 0) + count
+    self.count += other.count
+    self.total += other.total
+    if self.min is None or other.min < self.min:
+      self.min = other.min
+    if self.max is None or other.max > self.max:
+      self.max = other.max
+
+  def Mean(self):
+    if not self.count:
+      return None
+    return self.total / self.count
+
+  def _BucketValue(self, index):
+    """Return the value that stands for the durations in a bucket."""
+    if index == 0:
+      value = self.min
+    else:
+      # The geometric middle of the bucket.
+      value = MIN_VALUE * GROWTH ** (index - 0.5)
+    return min(max(value, self.min), self.max)
+
+  def CumulativeCounts(self):
+    """Return a sorted list of (duration, number of durations <= it) tuples.
+
+    The last tuple is always (max, count).
+    """
+    points = []
+    seen = 0
+    for index in sorted(self.buckets):
+      seen += self.buckets[index]
+      points.append((self._BucketValue(index), seen))
+    if points:
+      points[-1] = (self.max, seen)
+    return points
+
+  def Quantile(self, fraction):
+    """Return the approximate duration below which a fraction (0-1) of them fall."""
+    if not self.count:
+      return None
+    if fraction <= 0:
+      return self.min
+    rank = fraction * self.count
+    for value, seen in self.CumulativeCounts():
+      if seen >= rank:
+        return value
+    return self.max
+
+
+def Pack(histogram, compress_threshold=COMPRESS_THRESHOLD):
+  """Pack a LatencyHistogram into a string."""
+  indexes = sorted(histogram.buckets)
+  body = (_ToLittleEndian(array.array('H', indexes)).tostring() +
+          _ToLittleEndian(array.array('I', [histogram.buckets[x] for x in indexes])).tostring())
+
+  flags = 0
+  if len(body) > compress_threshold:
+    compressed = zlib.compress(body)
+    if len(compressed) < len(body):
+      body = compressed
+      flags |= FLAG_ZLIB
+
+  header = struct.pack(_HEADER, FORMAT_VERSION, flags, len(indexes), histogram.count,
+                       histogram.min or 0.0, histogram.max or 0.0, histogram.total)
+  return header + body
+
+
+def Unpack(blob):
+  """Unpack a string made by Pack into a LatencyHistogram."""
+  (version, flags, bucket_count, count, minimum, maximum,
+   total) = struct.unpack(_HEADER, blob[:_HEADER_SIZE])
+  if version != FORMAT_VERSION:
+    raise ValueError('Unknown packed histogram format: %s' % version)
+  body = blob[_HEADER_SIZE:]
+  if flags & FLAG_ZLIB:
+    body = zlib.decompress(body)
+
+  indexes = array.array('H')
+  indexes.fromstring(body[:bucket_count * indexes.itemsize])
+  counts = array.array('I')
+  counts.fromstring(body[bucket_count * indexes.itemsize:])
+  histogram = LatencyHistogram()
+  histogram.buckets = dict(zip(_ToLittleEndian(indexes), _ToLittleEndian(counts)))
+  histogram.count = count
+  histogram.total = total
+  if count:
+    histogram.min = minimum
+    histogram.max = maximum
+  return histogram
@@ -0,0 +1,90 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compact storage for per-run query durations.
+
+A packed blob looks like this (all integers little-endian):
+
+  format version (B), flags (B), run count (H), run lengths (I * run count),
+  float32 durations for every run, back to back.
+
+The duration section is zlib compressed when FLAG_ZLIB is set.
+"""
+
+import array
+import struct
+import sys
+import zlib
+
+FORMAT_VERSION = 1
+FLAG_ZLIB = 1
+# Compressing tiny blobs costs more CPU than it saves bytes.
+COMPRESS_THRESHOLD = 512
+
+
+def _ToLittleEndian(values):
+  if sys.byteorder == 'big':
+    values.byteswap()
+  return values
+
+
+def PackDurations(runs, compress_threshold=COMPRESS_THRESHOLD):
+  """Pack a list of runs (each a list of durations in ms) into a string."""
+  lengths = [len(run) for run in runs]
+  values = array.array('f')
+  for run in runs:
+    values.extend([float(x) for x in run])
+  body = _ToLittleEndian(values).tostring()
+
+  flags = 0
+  if len(body) > compress_threshold:
+    compressed = zlib.compress(body)
+    if len(compressed) < len(body):
+      body = compressed
+      flags |= FLAG_ZLIB
+
+  header = struct.pack('<BBH%dI' % len(lengths), FORMAT_VERSION, flags, len(lengths), *lengths)
+  return header + body
+
+
+def _Decode(blob):
+  """Return the run lengths and an array('f') of all durations in a packed string."""
+  version, flags, run_count = struct.unpack('<BBH', blob[:4])
+  if version != FORMAT_VERSION:
+    raise ValueError('Unknown packed duration format: %s' % version)
+  offset = 4 + run_count * 4
+  lengths = struct.unpack('<%dI' % run_count, blob[4:offset])
+  body = blob[offset:]
+  if flags & FLAG_ZLIB:
+    body = zlib.decompress(body)
+
+  values = array.array('f')
+  values.fromstring(body)
+  return (lengths, _ToLittleEndian(values))
+
+
+def UnpackDurations(blob):
+  """Unpack a string made by PackDurations into a list of array('f'), one per run."""
+  lengths, values = _Decode(blob)
+  runs = []
+  start = 0
+  for length in lengths:
+    runs.append(values[start:start + length])
+    start += length
+  return runs
+
+
+def UnpackAllDurations(blob):
+  """Unpack every duration from a PackDurations string into a single array('f')."""
+  return _Decode(blob)[1]
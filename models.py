@@ -14,10 +14,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import array
+import datetime
+
 from google.appengine.ext import db
 from google.appengine.ext import webapp
 from google.appengine.ext.webapp import util
 
+from libnamebench import histogram
+from libnamebench import packing
+
 class IndexHost(db.Model):
   record_type = db.StringProperty()
   record_name = db.StringProperty()
@@ -58,6 +64,111 @@ class Submission(db.Model):
   best_improvement = db.FloatProperty()
   primary_nameserver = db.ReferenceProperty(NameServer, collection_name="primary_submissions")
 
+# Reserves a Submission id for an upload. The key_name is "class_c:submit_id",
+# so a retried upload maps back onto the same (pre-allocated) Submission key.
+class SubmissionMarker(db.Model):
+  submission_id = db.IntegerProperty(indexed=False)
+  timestamp = db.DateTimeProperty(auto_now_add=True)
+
+# Times of recent listed submissions for a "class_c:client_id" key_name, and
+# the ids of those submissions (in the same order; absent for records written
+# before they were kept). See dedup.py.
+class ListingWindow(db.Model):
+  listed = db.ListProperty(datetime.datetime, indexed=False)
+  submission_ids = db.ListProperty(int, indexed=False)
+  timestamp = db.DateTimeProperty(auto_now=True)
+
+# Everything /id/<n> shows, built once by reports.py. key_name is "report",
+# parent is the Submission.
+class SubmissionReport(db.Model):
+  version = db.IntegerProperty()
+  # zlib compressed pickle of the template values.
+  data = db.BlobProperty()
+  timestamp = db.DateTimeProperty(auto_now=True)
+
+# An upload waiting for the ingest task queue worker. Stored as a child of the
+# reserved Submission key (key_name "payload") so that the worker can write the
+# submission and delete the payload in one transaction.
+class SubmissionPayload(db.Model):
+  class_c = db.StringProperty(indexed=False)
+  client_id = db.IntegerProperty(indexed=False)
+  submit_id = db.IntegerProperty(indexed=False)
+  # Whatever the client sent; a StringProperty would refuse more than 500
+  # characters.
+  hidden = db.TextProperty()
+  excess_listings = db.IntegerProperty(indexed=False)
+  # gzip or zlib compressed JSON, see uploads.py.
+  data = db.BlobProperty()
+  timestamp = db.DateTimeProperty(auto_now_add=True)
+
+# Nameserver statistics of every listed submission from a country; key_name is
+# the country code. Maintained by countries.py.
+class CountryAggregate(db.Model):
+  country = db.StringProperty()
+  submission_count = db.IntegerProperty()
+  last_submission = db.DateTimeProperty()
+  # zlib compressed pickle of the rows, see countries.py.
+  data = db.BlobProperty()
+  folded_ids = db.ListProperty(int, indexed=False)
+  # Submissions stored before this were counted by the recompute job.
+  recomputed_before = db.DateTimeProperty(indexed=False)
+  timestamp = db.DateTimeProperty(auto_now=True)
+
+# The most recent listed submissions, as shown on the front page. A single
+# entity with key_name "front", maintained by recent.py.
+class FrontPageSummary(db.Model):
+  # zlib compressed pickle of the row tuples, newest first.
+  data = db.BlobProperty()
+  timestamp = db.DateTimeProperty(auto_now=True)
+
+# Latency summary of a (country, nameserver) over an hour or a day, see
+# rollups.py.
+class LatencyRollup(db.Model):
+  country_code = db.StringProperty(indexed=False)
+  ip = db.StringProperty(indexed=False)
+  start = db.DateTimeProperty()
+  submission_count = db.IntegerProperty(indexed=False)
+  count = db.IntegerProperty(indexed=False)
+  mean = db.FloatProperty(indexed=False)
+  minimum = db.FloatProperty(indexed=False)
+  maximum = db.FloatProperty(indexed=False)
+  packed_histogram = db.BlobProperty()
+  timestamp = db.DateTimeProperty(auto_now=True)
+
+  def latency_histogram(self):
+    if self.packed_histogram:
+      return histogram.Unpack(self.packed_histogram)
+    return histogram.LatencyHistogram()
+
+class HourlyRollup(LatencyRollup):
+  folded_ids = db.ListProperty(int, indexed=False)
+
+class DailyRollup(LatencyRollup):
+  # Hours of the day already merged in from HourlyRollups.
+  merged_hours = db.ListProperty(int, indexed=False)
+  # Submissions merged in, so that a fold arriving after its hour was
+  # compacted is still recognized.
+  folded_ids = db.ListProperty(int, indexed=False)
+
+# The partial totals of one mapreduce shard for one recomputed entity, see
+# recompute.py. The key_name is "mapreduce_id:target:shard".
+class RecomputePart(db.Model):
+  # zlib compressed pickle of the totals.
+  data = db.BlobProperty()
+  # The slice that last added to it, so that a retried slice is not added twice.
+  last_slice = db.StringProperty(indexed=False)
+  timestamp = db.DateTimeProperty(auto_now=True)
+
+# One shard of a sharded counter; key_name is "name:index". See counters.py.
+class CounterShard(db.Model):
+  name = db.StringProperty()
+  count = db.IntegerProperty(indexed=False)
+
+# Child of an entity whose counter increments were made; key_name "counted".
+# See counters.increment_once().
+class CounterMarker(db.Model):
+  timestamp = db.DateTimeProperty(auto_now_add=True)
+
 class SubmissionConfig(db.Model):
   submission = db.ReferenceProperty(Submission, collection_name='config')  
   input_source = db.StringProperty()
@@ -93,8 +204,37 @@ class SubmissionNameServer(db.Model):
   diff = db.FloatProperty()
   notes = db.ListProperty(str)
   port_behavior = db.StringProperty()
+  # Durations for every run, see libnamebench/packing.py. Replaces RunResult.
+  packed_durations = db.BlobProperty()
+  # The same durations as a histogram.LatencyHistogram, for aggregation.
+  packed_histogram = db.BlobProperty()
+
+  def run_durations(self):
+    """Return the durations for each run, as a list of array('f')."""
+    if self.packed_durations:
+      return packing.UnpackDurations(self.packed_durations)
+    # Submissions stored before durations were packed.
+    runs = sorted(self.results, key=lambda x: x.run_number)
+    return [array.array('f', x.durations) for x in runs]
+
+  def durations(self):
+    """Return the durations of all runs as a single array('f')."""
+    if self.packed_durations:
+      return packing.UnpackAllDurations(self.packed_durations)
+    values = array.array('f')
+    for run in self.run_durations():
+      values.extend(run)
+    return values
+
+  def latency_histogram(self):
+    """Return a histogram.LatencyHistogram of all durations."""
+    if self.packed_histogram:
+      return histogram.Unpack(self.packed_histogram)
+    return histogram.LatencyHistogram(self.durations())
 
 # Store one row per run for run_results, since we do not need to do much with them.
+# Obsolete: new submissions use SubmissionNameServer.packed_durations, and
+# jobs.pack_run_results migrates existing rows.
 class RunResult(db.Model):
   submission_nameserver = db.ReferenceProperty(SubmissionNameServer, collection_name='results')
   run_number = db.IntegerProperty()
@@ -16,45 +16,52 @@
 #
 import cgi
 import datetime
+import hashlib
 import operator
-import os
 import logging
 from django.utils import simplejson
-from google.appengine.api import memcache
 from google.appengine.ext import db
 from google.appengine.ext import webapp
-from google.appengine.ext.webapp import template
 from google.appengine.ext.webapp import util
 
-# our private stash of third party code
-import third_party
-
-from libnamebench import charts
+import cache
+import counters
+import countries
+import http_cache
 import models
-
+import prefetch
+import registry
+import rendering
+import rollups
+
+# Global nameservers shown with their latency over TREND_DAYS on a country page.
+TREND_NAMESERVERS = 8
+TREND_DAYS = (7, 30)
+TREND_CACHE_TTL = 1800
 MAPS_API_KEY = 'ABQIAAAAUgt_ZC0I2rXmTLwIzIUALxR_qblnQoD-DakP6eidTTtErCQTehR_m1HgdQwvNF2bjiq3H5qlCIV-jQ'
 
 
-def CalculateListAverage(values):
-  """Computes the arithmetic mean of a list of numbers."""
-  values = [x for x in values if x != None]
-
-  if not values:
-    return 0
-  return sum(values) / float(len(values))
+def nameserver_version(ip):
+  """Validator for http_cache.conditional."""
+  ns = registry.get(ip)
+  if not ns:
+    return 'ns-%s-none' % ip
+  fields = repr((ns.name, ns.hostname, ns.listed, ns.timestamp))
+  return 'ns-%s-%s' % (ip, hashlib.md5(fields).hexdigest()[:12])
 
 
 class LookupHandler(webapp.RequestHandler):
   """Handler for /ns/### requests."""
 
   def get(self, ip):
-    nameserver = models.NameServer.get_by_key_name(ip)
+    nameserver = registry.get(ip)
     template_values = {
       'ip': ip,
       'nameserver': nameserver
     }
-    path = os.path.join(os.path.dirname(__file__), 'templates', 'nameserver.html')
-    self.response.out.write(template.render(path, template_values))
+    self.response.out.write(rendering.render('nameserver.html', template_values))
+
+LookupHandler = http_cache.conditional(LookupHandler, validator=nameserver_version)
 
 class UnlistedServerHandler(webapp.RequestHandler):
   """Handler for /unlisted_servers requests."""
@@ -67,147 +74,145 @@ class UnlistedServerHandler(webapp.RequestHandler):
       if ns.ip and 'x' not in ns.ip:
         self.response.out.write('%s<br />\r\n' % (ns.ip))
 
-class DummyNameserver(object):
-  name = '(Fastest Local Nameserver)'
+class ChartNameServer(object):
+  """The name and IP of a nameserver: all that charts need to label a row.
+
+  The cached nameserver table holds plain values rather than entities, so
+  rows are turned into these when charting.
+  """
+
+  def __init__(self, name, ip):
+    self.name = name
+    self.ip = ip
+
+LOCAL_CHART_NAMESERVER = ChartNameServer('(Fastest Local Nameserver)', '__local__')
 
 class CountryHandler(webapp.RequestHandler):
   """Handler for /ns/### requests."""
 
 
   def get(self, country_code):
-    ns_count = {}
-    avg_latencies = {}
-
-    country = None
-    total = 0
-    last_timestamp = None
     submissions = self.get_cached_submissions(country_code)
-    for sub in submissions:
-      total += 1
-      if not country:
-        country = sub.country
-      if not last_timestamp:
-        last_timestamp = sub.timestamp
-    ns_data = self.cached_nameserver_table(submissions, key=country_code)
+    # Only the first 15 rows show nameserver names. The cached entities are
+    # shared with other requests, so the references are resolved on copies.
+    recent_submissions = [db.model_from_protobuf(db.model_to_protobuf(x))
+                          for x in submissions[0:15]]
+    prefetch.prefetch_refprops(recent_submissions, models.Submission.best_nameserver,
+                               models.Submission.primary_nameserver)
+    table = countries.get_table(country_code)
+    if table:
+      ns_data = table['nameservers']
+      country = table['country']
+      folded = table['submission_count']
+      last_timestamp = table['last_submission']
+    else:
+      # Not folded yet; show what there is without caching it.
+      http_cache.disable(self.response)
+      ns_data = {}
+      country = None
+      folded = 0
+      last_timestamp = None
+      if submissions:
+        country = submissions[0].country
+        last_timestamp = submissions[0].timestamp
+
     runs_data = []
     runs_data_global = []
     ns_popular_list = sorted(ns_data.values(), key=lambda x:(x['count']), reverse=True)
     for row in ns_popular_list:
-      if 'results' in row:
-        if row['ip'] != '__local__' and len(runs_data) < 10:
-          runs_data.append((row['ns'], row['results']))
-        if row['is_global']:
-          runs_data_global.append((row['ns'], row['results']))
-      if 'averages' in row:
-        row['overall_average'] = CalculateListAverage(row['averages'])
-      else:
-        row['overall_average'] = -1
-      if 'positions' in row:
-        row['overall_position'] = CalculateListAverage(row['positions'])
+      if not row['results']:
+        continue
+      if row['ip'] == countries.LOCAL_IP:
+        chart_ns = LOCAL_CHART_NAMESERVER
       else:
-        row['overall_position'] = -1
+        chart_ns = ChartNameServer(row['name'], row['ip'])
+      if row['ip'] != countries.LOCAL_IP and len(runs_data) < 10:
+        runs_data.append((chart_ns, row['results']))
+      if row['is_global']:
+        runs_data_global.append((chart_ns, row['results']))
 
-    ns_count = {}
     template_values = {
       'country_code': country_code,
-      'count': total,
-      'popular_nameservers': ns_count.items(),
+      'count': counters.get_count('country:%s' % country_code),
+      'popular_nameservers': self._PopularPrimaryNameServers(country_code, ns_data),
+      'trends': self._Trends(country_code, ns_popular_list),
+      'trend_days': TREND_DAYS,
       'nsdata': ns_data.values(),
       'nsdata_raw': ns_data,
       'country': country,
       'maps_api_key': MAPS_API_KEY,
       'submissions': submissions,
-      'recent_submissions': submissions[0:15],
-      'distribution_url': self._CreateDistributionUrl(runs_data, scale=350, key="dist-%s" % country_code),
-      'distribution_url_global': self._CreateDistributionUrl(runs_data_global, scale=350, key="distglobal-%s" % country_code),
+      'recent_submissions': recent_submissions,
       'last_update': last_timestamp
     }
-    path = os.path.join(os.path.dirname(__file__), 'templates', 'country.html')
-    self.response.out.write(template.render(path, template_values))
+    # Charts follow the aggregate as submissions are folded in.
+    runs_by_name = {'distribution_url': runs_data, 'distribution_url_global': runs_data_global}
+    template_values.update(self._CreateDistributionUrls(
+        dict([(x, y) for (x, y) in runs_by_name.items() if y]),
+        scale=350, key='%s:%s' % (country_code, folded)))
+    self.response.out.write(rendering.render('country.html', template_values))
+
+  def _PopularPrimaryNameServers(self, country_code, ns_data, limit=10):
+    """Return (name, submission count) for the most common primary nameservers."""
+    names = dict([('primary:%s:%s' % (country_code, x['ip']), x['name'] or x['ip'])
+                  for x in ns_data.values() if x['ip'] != countries.LOCAL_IP])
+    counts = counters.get_counts(names.keys())
+    popular = sorted([(names[x], y) for (x, y) in counts.items() if y],
+                     key=lambda x: x[1], reverse=True)
+    return popular[:limit]
+
+  def _Trends(self, country_code, ns_popular_list):
+    """Return the rollups of the most popular global nameservers over TREND_DAYS.
+
+    Rows are dicts with the name and ip of a nameserver, and 'windows': a
+    (days, submission count, average latency or None) tuple for each of
+    TREND_DAYS.
+    """
+    names = [(x['ip'], x['name'] or x['ip']) for x in ns_popular_list
+             if x['is_global'] and x['ip'] != countries.LOCAL_IP]
+    names = names[:TREND_NAMESERVERS]
+    if not names:
+      return []
+
+    def Compute():
+      windows = rollups.get_recent(country_code, [x[0] for x in names], TREND_DAYS)
+      rows = []
+      for ip, name in names:
+        rows.append({'ip': ip, 'name': name,
+                     'windows': [(x, windows[ip][x][0], windows[ip][x][1].Mean())
+                                 for x in TREND_DAYS]})
+      return rows
+
+    return cache.get_or_compute('country_trends', country_code, Compute, TREND_CACHE_TTL)
 
   def _SortDistribution(self, a, b):
     """Sort distribution graph by name (for now)."""
     return cmp(a[0].name, b[0].name)
 
-  def cached_nameserver_table(self, submissions, key=None):
-    key = "nstable-%s" % key
-    ns_data = memcache.get(key)
-    if ns_data is not None:
-      return ns_data
-
-    ns_data = {
-      '__local__': {
-        'name': '(Fastest local nameserver)',
-        'ip': '__local__',
-        'hostname': '__fastest.local__',
-        'ns': DummyNameserver(),
-        'count': 0,
-        'is_global': True,
-        'overall_position': -1,
-        'positions': [],
-        'averages': [],
-        'results': []
-      }
-    }
-    for sub in submissions:
-      fastest_local = None
-      for ns_sub in sub.nameservers:
-        ip = "%s" % ns_sub.nameserver.ip
-        if ip not in ns_data:
-          ns_data[ip] = {
-            'name': ns_sub.nameserver.name,
-            'ip': ip,
-            'hostname': ns_sub.nameserver.hostname,
-            'ns': ns_sub.nameserver,
-            'is_global': ns_sub.nameserver.is_global,
-            'overall_position': -1
-        }
-        if not ns_sub.nameserver.is_global and (not fastest_local or ns_sub.overall_average < fastest_local.overall_average):
-          fastest_local = ns_sub
-
-        ns_data[ip]['count'] = ns_data[ip].setdefault('count', 0) + 1
-        if ns_sub.position < 15:
-          ns_data[ip].setdefault('positions', []).append(ns_sub.position)
-        ns_data[ip].setdefault('averages', []).append(ns_sub.overall_average)
-
-        for run in ns_sub.results:
-          ns_data[ip].setdefault('results', []).extend(run.durations)
-
-      if fastest_local:
-        ns_sub = fastest_local
-        ns_data['__local__']['count'] += 1
-        ns_data['__local__'].setdefault('positions', []).append(ns_sub.position)
-        ns_data['__local__'].setdefault('averages', []).append(ns_sub.overall_average)
-        for run in ns_sub.results:
-          ns_data['__local__'].setdefault('results', []).extend(run.durations)
-
-    if not memcache.add(key, ns_data, 7200):
-      logging.error("Memcache set failed.")
-    return ns_data
-
-
+  @cache.cached('country_submissions', 7200, key=lambda self, country_code: country_code)
   def get_cached_submissions(self, country_code):
-    key = "submissions-%s" % country_code
-    submissions = memcache.get(key)
-    if submissions is not None:
-      return submissions
-
     query = models.Submission.all()
     query.filter("country_code =", country_code)
     query.filter('listed =', True)
     query.order('-timestamp')
-    submissions = query.fetch(250)
-    if not memcache.add(key, submissions, 7200):
-      logging.error("Memcache set failed.")
-    return submissions
+    return query.fetch(250)
+
+  def _CreateDistributionUrls(self, runs_by_name, scale, key=None):
+    """Return a dict of name -> distribution chart URL, fetched from the cache together."""
+    # our private stash of third party code, only needed for drawing charts
+    import third_party
+    from libnamebench import charts
 
-  def _CreateDistributionUrl(self, runs_data, scale, key=None):
-    url = memcache.get(key)
-    if url != None:
-      return url
+    cache_keys = dict([('%s:%s' % (name, key), name) for name in runs_by_name])
 
-    url = charts.DistributionLineGraph(runs_data, scale=scale, sort_by=self._SortDistribution)
-    memcache.add(key, url, 86400)
-    return url
+    def Compute(missing):
+      urls = {}
+      for cache_key in missing:
+        urls[cache_key] = charts.DistributionLineGraph(runs_by_name[cache_keys[cache_key]],
+                                                       scale=scale, sort_by=self._SortDistribution)
+      return urls
 
+    urls = cache.get_multi('country_dist', cache_keys.keys(), Compute, 86400)
+    return dict([(cache_keys[x], y) for (x, y) in urls.items()])
 
+CountryHandler = http_cache.conditional(CountryHandler, max_age=600)
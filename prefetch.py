@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Batched dereferencing of ReferenceProperty values.
+
+Dereferencing ns_sub.nameserver in a loop costs one datastore get per row.
+prefetch_refprops() collects the keys of every row first, fetches them with one
+batched get and wires the entities back in. Fetched entities are kept in a
+per-request identity map, so an entity is only fetched once per request;
+NameServer entities come from the instance-wide registry.
+"""
+import threading
+
+from google.appengine.ext import db
+
+import registry
+
+_LOCAL = threading.local()
+
+
+def clear():
+  """Forget every entity fetched so far. Called at the start of each request."""
+  _LOCAL.entities = {}
+
+
+def _identity_map():
+  if not hasattr(_LOCAL, 'entities'):
+    clear()
+  return _LOCAL.entities
+
+
+def get_many(keys):
+  """Return a dict of key -> entity (or None), fetching only unseen keys."""
+  entities = _identity_map()
+  missing = []
+  for key in keys:
+    if key not in entities:
+      entities[key] = None
+      missing.append(key)
+
+  nameserver_keys = [x for x in missing if x.kind() == 'NameServer']
+  other_keys = [x for x in missing if x.kind() != 'NameServer']
+  if nameserver_keys:
+    entities.update(registry.get_many(nameserver_keys))
+  if other_keys:
+    entities.update(zip(other_keys, db.get(other_keys)))
+  return entities
+
+
+def prefetch_refprops(entities, *props):
+  """Resolve the given ReferenceProperty attributes of entities in one batch.
+
+  Args:
+    entities: list (or query) of entities of the same kind.
+    props: ReferenceProperty class attributes, e.g. models.Submission.best_nameserver
+
+  Returns:
+    The entities, as a list.
+  """
+  entities = list(entities)
+  fields = []
+  for entity in entities:
+    for prop in props:
+      fields.append((entity, prop, prop.get_value_for_datastore(entity)))
+
+  found = get_many([key for (entity, prop, key) in fields if key])
+  for entity, prop, key in fields:
+    if key and found[key] is not None:
+      prop.__set__(entity, found[key])
+  return entities
+
+
+class IdentityMapMiddleware(object):
+  """WSGI middleware giving each request an empty identity map."""
+
+  def __init__(self, app):
+    self.app = app
+
+  def __call__(self, environ, start_response):
+    clear()
+    return self.app(environ, start_response)
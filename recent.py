@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""The most recent listed submissions, kept ready for the front page.
+
+Storing a listed submission queues a task (/tasks/add_recent) in the same
+transaction, which summarizes it into a small tuple (see ROW_FIELDS) and adds
+it to the FrontPageSummary entity and to its copy in memcache. The memcache
+copy is updated with compare-and-set rather than dropped, so the front page
+never has to rebuild the list after an upload; the entity is the fallback
+when memcache has lost it. A reader that puts the entity back in memcache
+checks that it did not change meanwhile, as a task that found memcache empty
+only updates the entity. The entity itself is only rebuilt from a Submission
+query when it does not exist, so delete it to start over.
+
+The tasks have a queue of their own, rate limited to keep writes to the
+single entity well within what one entity group can take.
+"""
+import logging
+import pickle
+import zlib
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import db
+
+import models
+import prefetch
+
+ADD_QUEUE = 'recent'
+ADD_URL = '/tasks/add_recent'
+SUMMARY_KEY_NAME = 'front'
+MEMCACHE_KEY = 'front_summary'
+MEMCACHE_TTL = 3600
+MAX_ROWS = 150
+CAS_RETRIES = 5
+ROW_FIELDS = ('id', 'timestamp', 'region', 'country', 'country_code', 'class_c',
+              'best_name', 'primary_name', 'primary_ip', 'best_improvement', 'coordinates')
+
+
+def queue_add(submission_id):
+  """Queue the addition of a listed submission, within the transaction storing it."""
+  taskqueue.add(url=ADD_URL, params={'id': submission_id}, queue_name=ADD_QUEUE,
+                transactional=True)
+
+
+def _NameOrIp(ns):
+  if not ns:
+    return ''
+  return ns.name or ns.ip
+
+
+def summarize(submission):
+  """Return the row tuple of a submission, dereferencing its nameservers."""
+  primary = submission.primary_nameserver
+  coordinates = None
+  if submission.coordinates:
+    coordinates = '%s,%s' % (submission.coordinates.lat, submission.coordinates.lon)
+  return (submission.key().id(), submission.timestamp, submission.region,
+          submission.country, submission.country_code, submission.class_c,
+          _NameOrIp(submission.best_nameserver), _NameOrIp(primary),
+          (primary and primary.ip) or '', submission.best_improvement, coordinates)
+
+
+def _AddRow(rows, row):
+  """Return rows with row added, newest first. Tasks may run out of order."""
+  if [x for x in rows if x[0] == row[0]]:
+    return rows
+  rows = [row] + rows
+  rows.sort(key=lambda x: x[1], reverse=True)
+  return rows[:MAX_ROWS]
+
+
+def _Rebuild():
+  query = models.Submission.all().filter('listed =', True).order('-timestamp')
+  submissions = prefetch.prefetch_refprops(query.fetch(MAX_ROWS), models.Submission.best_nameserver,
+                                           models.Submission.primary_nameserver)
+  return [summarize(x) for x in submissions]
+
+
+def _Encode(rows):
+  return zlib.compress(pickle.dumps(rows, pickle.HIGHEST_PROTOCOL))
+
+
+def _Create(rows):
+  """Store rebuilt rows, unless another request got there first. Run in a transaction."""
+  summary = models.FrontPageSummary.get_by_key_name(SUMMARY_KEY_NAME)
+  if not summary:
+    summary = models.FrontPageSummary(key_name=SUMMARY_KEY_NAME, data=_Encode(rows))
+    summary.put()
+  return summary.data
+
+
+def _LoadStored():
+  """Return the encoded rows of the FrontPageSummary entity, creating it if needed."""
+  summary = models.FrontPageSummary.get_by_key_name(SUMMARY_KEY_NAME)
+  if summary:
+    return summary.data
+  return db.run_in_transaction(_Create, _Rebuild())
+
+
+def _AddToStored(row):
+  """Add a row to the FrontPageSummary entity. Run in a transaction."""
+  summary = models.FrontPageSummary.get_by_key_name(SUMMARY_KEY_NAME)
+  if not summary:
+    # The first read rebuilds it, and will find the submission.
+    return
+  summary.data = _Encode(_AddRow(pickle.loads(zlib.decompress(summary.data)), row))
+  summary.put()
+
+
+def add_submission(submission):
+  """Add a listed submission to the stored and cached summary."""
+  prefetch.prefetch_refprops([submission], models.Submission.best_nameserver,
+                             models.Submission.primary_nameserver)
+  row = summarize(submission)
+  db.run_in_transaction(_AddToStored, row)
+  client = memcache.Client()
+  for i in range(CAS_RETRIES):
+    rows = client.gets(MEMCACHE_KEY)
+    if rows is None:
+      # The next reader loads the stored summary, which has the row.
+      return
+    if client.cas(MEMCACHE_KEY, _AddRow(rows, row), time=MEMCACHE_TTL):
+      return
+  logging.warning("Could not update %s, dropping it." % MEMCACHE_KEY)
+  memcache.delete(MEMCACHE_KEY)
+
+
+def get_rows():
+  """Return the summary rows, newest first, as dicts with ROW_FIELDS as keys."""
+  rows = memcache.get(MEMCACHE_KEY)
+  if rows is None:
+    data = _LoadStored()
+    rows = pickle.loads(zlib.decompress(data))
+    if memcache.add(MEMCACHE_KEY, rows, time=MEMCACHE_TTL):
+      # A submission added between the load and the add is only in the entity.
+      summary = models.FrontPageSummary.get_by_key_name(SUMMARY_KEY_NAME)
+      if summary and summary.data != data:
+        memcache.delete(MEMCACHE_KEY)
+  return [dict(zip(ROW_FIELDS, x)) for x in rows]
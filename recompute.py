@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Recompute derived statistics from every submission, with mapreduce jobs.
+
+The fold task keeps CountryAggregates and rollups up to date one submission
+at a time. When the way they are computed changes, the "Recompute country
+aggregates and daily rollups" job (jobs.recompute_statistics) rebuilds them
+from all listed submissions:
+
+  - The mapper adds each submission to the Combiner of its slice, which sums
+    them in memory per target: "country:<country code>" for a
+    CountryAggregate, "daily:<country code>:<YYYYMMDD>" for the DailyRollups
+    of a day.
+  - At the end of the slice, the Combiner adds its sums to one RecomputePart
+    per (target, shard), with a batch get and put. No two shards write the
+    same part, so this needs no transactions; each part remembers the last
+    slice it took, so a retried slice is not added twice. Like aggregates,
+    parts drop their least popular local nameservers to fit in an entity.
+  - Once every shard is done, the job's done_callback (tasks.
+    FinishRecomputeHandler) runs finish(): it merges the parts of each
+    target, overwrites the CountryAggregate or DailyRollups, then deletes the
+    parts. Targets are only written once all their parts are in, and written
+    whole, so finish() can be retried or resumed at any point.
+
+Aggregates and rollups only change when finish() writes them. The mapper
+only takes submissions stored before the job started, its cutoff; the fold
+task keeps adding the others to the live aggregates meanwhile.
+countries.replace_aggregate() folds those in on top of the recomputed
+totals, and has the fold task skip everything before the cutoff from then
+on. Daily rollups are only recomputed for days long past, which uploads no
+longer touch.
+
+The "Count listed submissions" job (jobs.count_submissions) sums its groups
+through the Combiner too, into "group:<group_by>:<bucket>" parts, each with
+the values that hash to its bucket. It has no done_callback: group_totals()
+reads its totals, and delete_parts() removes them once they are no longer
+needed.
+"""
+import datetime
+import pickle
+import time
+import zlib
+
+# our private stash of third party code
+import third_party
+
+from google.appengine.ext import db
+from mapreduce import context
+from mapreduce import model as mapreduce_model
+
+from libnamebench import histogram
+import analytics
+import countries
+import models
+import rollups
+
+POOL_KEY = 'recompute'
+# Parts read per query by finish(). Must be well above the shard count, so
+# that a page always holds at least one whole target.
+PART_BATCH_SIZE = 500
+# Rows kept per part of a CountryAggregate. More than the aggregate keeps, so
+# that rows close to the cut are ranked on most of their submissions.
+PART_MAX_ROWS = 2 * countries.MAX_ROWS
+# Parts are trimmed further past this, to stay below the 1MB entity limit.
+MAX_PART_BYTES = 900 * 1024
+# Parts per group_by of a count job, so that a nameserver group_by with many
+# values is spread over several entities.
+GROUP_BUCKETS = 16
+FINISH_STAGES = ('write', 'delete')
+
+
+def _Encode(totals):
+  return zlib.compress(pickle.dumps(totals, pickle.HIGHEST_PROTOCOL))
+
+
+def _Decode(data):
+  return pickle.loads(zlib.decompress(data))
+
+
+def _NewTotals(kind):
+  if kind == 'group':
+    # value -> submission count
+    return {}
+  if kind == 'country':
+    return {'country': None, 'submission_count': 0, 'last_submission': None, 'rows': {}}
+  # daily rows: ip -> [submission count, histogram.LatencyHistogram]
+  return {'rows': {}, 'submission_ids': []}
+
+
+def _MergeTotals(kind, totals, additions):
+  """Add the additions into totals, in place. additions is left untouched."""
+  if kind == 'group':
+    for value, count in additions.items():
+      totals[value] = totals.get(value, 0) + count
+    return
+  if kind == 'country':
+    totals['country'] = additions['country'] or totals['country']
+    totals['submission_count'] += additions['submission_count']
+    if not totals['last_submission'] or additions['last_submission'] > totals['last_submission']:
+      totals['last_submission'] = additions['last_submission']
+    countries.merge_rows(totals['rows'], additions['rows'])
+    return
+  for ip, (count, latencies) in additions['rows'].items():
+    if ip not in totals['rows']:
+      totals['rows'][ip] = [0, histogram.LatencyHistogram()]
+    totals['rows'][ip][0] += count
+    totals['rows'][ip][1].Merge(latencies)
+  totals['submission_ids'].extend(additions['submission_ids'])
+
+
+def _Pack(kind, totals):
+  """Return totals with their histograms packed, for pickling."""
+  if kind == 'group':
+    return totals
+  if kind == 'country':
+    rows = {}
+    for ip, row in totals['rows'].items():
+      rows[ip] = dict(row, histogram=histogram.Pack(row['histogram']))
+    return dict(totals, rows=rows)
+  rows = dict([(ip, (count, histogram.Pack(latencies)))
+               for (ip, (count, latencies)) in totals['rows'].items()])
+  return dict(totals, rows=rows)
+
+
+def _Unpack(kind, totals):
+  if kind == 'group':
+    return totals
+  if kind == 'country':
+    for row in totals['rows'].values():
+      row['histogram'] = histogram.Unpack(row['histogram'])
+    return totals
+  totals['rows'] = dict([(ip, [count, histogram.Unpack(packed)])
+                         for (ip, (count, packed)) in totals['rows'].items()])
+  return totals
+
+
+def _EncodePart(kind, totals):
+  """Encode the totals of a part, trimmed to fit in an entity."""
+  if kind == 'group':
+    return _Encode(totals)
+  if kind == 'daily':
+    # replace_daily() keeps no more than these.
+    totals['submission_ids'] = sorted(totals['submission_ids'])[-rollups.MAX_DAILY_FOLDED_IDS:]
+    return _Encode(_Pack(kind, totals))
+  countries.trim_rows(totals['rows'], PART_MAX_ROWS)
+  data = _Encode(_Pack(kind, totals))
+  while len(data) > MAX_PART_BYTES:
+    row_count = len(totals['rows'])
+    countries.trim_rows(totals['rows'], max(countries.MAX_ROWS, row_count * 3 / 4))
+    if len(totals['rows']) == row_count:
+      break
+    data = _Encode(_Pack(kind, totals))
+  return data
+
+
+class Combiner(object):
+  """Sums the submissions of a mapreduce slice, and adds them to RecomputeParts on flush."""
+
+  def __init__(self, mapreduce_id, shard_number, counters):
+    self.mapreduce_id = mapreduce_id
+    self.shard_number = shard_number
+    self.counters = counters
+    self.cutoff = mapreduce_model.MapreduceState.get_by_job_id(mapreduce_id).start_time
+    # target -> totals
+    self.targets = {}
+    # Identifies the slice: a retry starts from the same submission.
+    self.slice = None
+
+  def _Totals(self, target):
+    if target not in self.targets:
+      self.targets[target] = _NewTotals(target.split(':')[0])
+    return self.targets[target]
+
+  def add(self, submission, rows):
+    """Add a listed submission with a country, and its countries.submission_rows().
+
+    The submission must be stored before self.cutoff.
+    """
+    if not self.slice:
+      self.slice = str(submission.key())
+    _MergeTotals('country', self._Totals('country:%s' % submission.country_code),
+                 {'country': submission.country, 'submission_count': 1,
+                  'last_submission': submission.timestamp, 'rows': rows})
+
+    # Decided against the cutoff, not the time of the slice, so that every
+    # slice rebuilds the same days: a day that became recomputable partway
+    # through would only get the parts of the later slices.
+    day = rollups.recomputable_day(submission.timestamp, self.cutoff)
+    if day:
+      # The same rows as rollups.record_submission() takes.
+      additions = {'rows': dict([(ip, (1, x['histogram'])) for (ip, x) in rows.items()
+                                 if x['histogram'].count and x['is_global']]),
+                   'submission_ids': [submission.key().id()]}
+      target = 'daily:%s:%s' % (submission.country_code, day.strftime('%Y%m%d'))
+      _MergeTotals('daily', self._Totals(target), additions)
+
+  def count(self, submission, values):
+    """Count a submission once for each of its analytics.group_values()."""
+    if not self.slice:
+      self.slice = str(submission.key())
+    for group_by, value in values.items():
+      bucket = zlib.crc32(unicode(value).encode('utf-8')) % GROUP_BUCKETS
+      _MergeTotals('group', self._Totals('group:%s:%d' % (group_by, bucket)), {value: 1})
+
+  def flush(self):
+    if not self.targets:
+      return
+    targets = sorted(self.targets.keys())
+    key_names = ['%s:%s:%d' % (self.mapreduce_id, x, self.shard_number) for x in targets]
+    parts = models.RecomputePart.get_by_key_name(key_names)
+    changed = []
+    for target, key_name, part in zip(targets, key_names, parts):
+      kind = target.split(':')[0]
+      if not part:
+        part = models.RecomputePart(key_name=key_name)
+        totals = _NewTotals(kind)
+      elif part.last_slice == self.slice:
+        self.counters.increment('parts_already_added')
+        continue
+      else:
+        totals = _Unpack(kind, _Decode(part.data))
+      _MergeTotals(kind, totals, self.targets[target])
+      part.data = _EncodePart(kind, totals)
+      part.last_slice = self.slice
+      changed.append(part)
+    db.put(changed)
+    self.counters.increment('parts_written', len(changed))
+    self.targets = {}
+    self.slice = None
+
+
+def combiner():
+  """Return the Combiner of the running mapreduce slice."""
+  ctx = context.get()
+  pool = ctx.get_pool(POOL_KEY)
+  if not pool:
+    pool = Combiner(ctx.mapreduce_id, ctx.shard_state.shard_number, ctx.counters)
+    ctx.register_pool(POOL_KEY, pool)
+  return pool
+
+
+def _Target(part):
+  return part.key().name().split(':', 1)[1].rsplit(':', 1)[0]
+
+
+def _WriteTarget(target, parts, cutoff):
+  kind = target.split(':')[0]
+  totals = _NewTotals(kind)
+  for part in parts:
+    _MergeTotals(kind, totals, _Unpack(kind, _Decode(part.data)))
+  if kind == 'country':
+    countries.replace_aggregate(target.split(':')[1], totals['country'],
+                                totals['submission_count'], totals['last_submission'],
+                                totals['rows'], cutoff)
+    return
+  unused_kind, country_code, day = target.split(':')
+  start = datetime.datetime.strptime(day, '%Y%m%d')
+  for ip, (count, latencies) in totals['rows'].items():
+    rollups.replace_daily(country_code, ip, start, count, latencies, totals['submission_ids'])
+
+
+def _PartQuery(mapreduce_id, start, keys_only=False):
+  """Parts of a job from the key name start on, in key order, which groups them by target."""
+  # Key names of a job run from "mapreduce_id:" up to, but not including, "mapreduce_id;".
+  query = models.RecomputePart.all(keys_only=keys_only)
+  query.filter('__key__ >=', db.Key.from_path('RecomputePart', start or mapreduce_id + ':'))
+  return query.filter('__key__ <', db.Key.from_path('RecomputePart', mapreduce_id + ';'))
+
+
+def _WriteBatch(mapreduce_id, start, cutoff):
+  """Write the targets of a page of parts.
+
+  Returns:
+    (key name of the first part not written yet or None, targets written)
+  """
+  parts = _PartQuery(mapreduce_id, start).fetch(PART_BATCH_SIZE)
+  groups = []
+  for part in parts:
+    if not groups or groups[-1][0] != _Target(part):
+      groups.append((_Target(part), []))
+    groups[-1][1].append(part)
+  next_start = None
+  if len(parts) == PART_BATCH_SIZE:
+    # The last target may have parts on the next page.
+    next_start = groups.pop()[1][0].key().name()
+  for target, target_parts in groups:
+    _WriteTarget(target, target_parts, cutoff)
+  return (next_start, len(groups))
+
+
+def finish(mapreduce_id, stage=0, start=None, deadline=20):
+  """Write the targets of a finished recompute job, then delete its parts.
+
+  Works through FINISH_STAGES from the given stage index and part key name,
+  until everything is done or deadline seconds have passed. The targets of a
+  job that did not succeed are left alone, and its parts deleted.
+
+  Returns:
+    (stage, start, entities handled, finished)
+  """
+  started = time.time()
+  handled = 0
+  cutoff = None
+  if stage == 0:
+    state = mapreduce_model.MapreduceState.get_by_job_id(mapreduce_id)
+    if not state or state.result_status != mapreduce_model.MapreduceState.RESULT_SUCCESS:
+      stage = 1
+    else:
+      cutoff = state.start_time
+  while stage < len(FINISH_STAGES) and time.time() - started < deadline:
+    if FINISH_STAGES[stage] == 'write':
+      start, written = _WriteBatch(mapreduce_id, start, cutoff)
+      handled += written
+    else:
+      keys = _PartQuery(mapreduce_id, None, keys_only=True).fetch(PART_BATCH_SIZE)
+      db.delete(keys)
+      handled += len(keys)
+      if len(keys) == PART_BATCH_SIZE:
+        continue
+    if not start:
+      stage += 1
+  return (stage, start, handled, stage >= len(FINISH_STAGES))
+
+
+def delete_parts(mapreduce_id):
+  """Delete every part of a job, such as a count job whose totals were read."""
+  finished = False
+  while not finished:
+    finished = finish(mapreduce_id, FINISH_STAGES.index('delete'))[3]
+
+
+def group_totals(mapreduce_id):
+  """Return the analytics.Totals of a count job, summed from its parts."""
+  counts = {}
+  query = _PartQuery(mapreduce_id, None)
+  parts = query.fetch(PART_BATCH_SIZE)
+  while parts:
+    for part in parts:
+      unused_kind, group_by, unused_bucket = _Target(part).split(':')
+      _MergeTotals('group', counts.setdefault(group_by, {}), _Decode(part.data))
+    if len(parts) < PART_BATCH_SIZE:
+      break
+    parts = query.with_cursor(query.cursor()).fetch(PART_BATCH_SIZE)
+
+  totals = analytics.Totals(counts.keys())
+  totals.counts.update(counts)
+  if counts:
+    # Every submission has a value for each group_by.
+    totals.total = sum(counts.values()[0].values())
+  return totals
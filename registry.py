@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""In-process registry of NameServer entities.
+
+Nearly every upload and page refers to the same few hundred public resolvers,
+so NameServer entities are kept per instance and re-read from the datastore
+once they are older than REFRESH_INTERVAL. The registry is shared by the
+requests an instance serves concurrently, so it is only touched under _LOCK;
+datastore calls happen outside of it.
+"""
+import threading
+import time
+
+from google.appengine.ext import db
+
+import models
+
+# Seconds before a registry entry is fetched again.
+REFRESH_INTERVAL = 600
+# Start over rather than grow without bounds on an instance that has seen
+# every custom nameserver in the world.
+MAX_ENTRIES = 5000
+# The most entity groups a cross-group transaction may touch.
+MAX_XG_ENTITY_GROUPS = 25
+
+# db.Key -> (load time, NameServer)
+_REGISTRY = {}
+_LOCK = threading.Lock()
+
+
+def _remember(entities, now):
+  _LOCK.acquire()
+  try:
+    if len(_REGISTRY) + len(entities) > MAX_ENTRIES:
+      _REGISTRY.clear()
+    for entity in entities:
+      _REGISTRY[entity.key()] = (now, entity)
+  finally:
+    _LOCK.release()
+
+
+def get_many(keys):
+  """Return a dict of key -> NameServer (or None) for a list of NameServer keys."""
+  now = time.time()
+  found = {}
+  missing = []
+  _LOCK.acquire()
+  try:
+    for key in keys:
+      entry = _REGISTRY.get(key)
+      if entry and now - entry[0] < REFRESH_INTERVAL:
+        found[key] = entry[1]
+      elif key not in found:
+        found[key] = None
+        missing.append(key)
+  finally:
+    _LOCK.release()
+
+  if missing:
+    entities = [x for x in db.get(missing) if x]
+    _remember(entities, now)
+    for entity in entities:
+      found[entity.key()] = entity
+  return found
+
+
+def get(ip):
+  """Return the NameServer for an IP, or None."""
+  key = db.Key.from_path('NameServer', ip)
+  return get_many([key])[key]
+
+
+def _InsertMissing(entities):
+  """Put the entities whose keys are still free. Run in a cross-group transaction.
+
+  Returns:
+    The stored entity for each, whether it was just put or already there.
+  """
+  stored = db.get([x.key() for x in entities])
+  db.put([x for (x, y) in zip(entities, stored) if not y])
+  return [y or x for (x, y) in zip(entities, stored)]
+
+
+def upsert_nameservers(nameservers):
+  """Return a dict of ip -> NameServer for namebench nameserver records.
+
+  Records are looked up with a single batch get. Those that are not in the
+  datastore yet are created, unlisted, MAX_XG_ENTITY_GROUPS at a time in
+  cross-group transactions, so that a record another upload created
+  meanwhile is kept.
+  """
+  keys = [db.Key.from_path('NameServer', x['ip']) for x in nameservers]
+  found = get_many(keys)
+  missing = {}
+  for nsdata, key in zip(nameservers, keys):
+    if not found[key] and key not in missing:
+      missing[key] = models.NameServer(
+          key=key,
+          ip=nsdata['ip'],
+          name=nsdata['name'],
+          hostname=nsdata['hostname'],
+          is_global=nsdata.get('is_global', False),
+          is_regional=nsdata.get('is_regional', False),
+          is_custom=nsdata.get('is_custom', False),
+          listed=False
+      )
+
+  created = []
+  missing = missing.values()
+  options = db.create_transaction_options(xg=True)
+  for start in range(0, len(missing), MAX_XG_ENTITY_GROUPS):
+    created.extend(db.run_in_transaction_options(
+        options, _InsertMissing, missing[start:start + MAX_XG_ENTITY_GROUPS]))
+  for ns_record in created:
+    found[ns_record.key()] = ns_record
+  if created:
+    _remember(created, time.time())
+  return dict([(nsdata['ip'], found[key]) for (nsdata, key) in zip(nameservers, keys)])
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Render pages with Jinja2, from templates compiled ahead of time.
+
+The templates in templates/jinja2 are ports of the Django ones in templates.
+tools/compile_templates.py turns them into Python source in
+compiled_templates.py, which ships with the app, so a cold instance only has
+to compile() that instead of parsing the templates. A template that is not in
+compiled_templates.py, or whose source changed since, is compiled from its
+file instead, with the bytecode kept in memcache for the other instances.
+
+Templates render like the Django ones did: unknown variables and attributes
+are empty, nothing is escaped unless asked for, and the floatformat and
+timesince filters work like Django's.
+"""
+import datetime
+import hashlib
+import logging
+import os
+
+from google.appengine.api import memcache
+
+import third_party
+import jinja2
+from jinja2 import bccache
+
+try:
+  import compiled_templates
+except ImportError:
+  compiled_templates = None
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates', 'jinja2')
+BYTECODE_PREFIX = 'jinja2_bytecode:'
+BYTECODE_TTL = 86400
+TIMESINCE_CHUNKS = (
+  (60 * 60 * 24 * 365, 'year'),
+  (60 * 60 * 24 * 30, 'month'),
+  (60 * 60 * 24 * 7, 'week'),
+  (60 * 60 * 24, 'day'),
+  (60 * 60, 'hour'),
+  (60, 'minute')
+)
+
+
+def source_checksum(source):
+  """Identifies the template source a compiled_templates.py entry was built from."""
+  if isinstance(source, unicode):
+    source = source.encode('utf-8')
+  return hashlib.md5(source).hexdigest()
+
+
+class _SilentUndefined(jinja2.Undefined):
+  """Like Django, render unknown variables and anything looked up on them as ''."""
+
+  def _Self(self, *args, **kwargs):
+    return self
+
+  def __html__(self):
+    return u''
+
+  __getattr__ = __getitem__ = __call__ = _Self
+
+
+class _PrecompiledLoader(jinja2.FileSystemLoader):
+  """Load templates from compiled_templates.py while they match their source."""
+
+  def load(self, environment, name, globals=None):
+    source, filename, uptodate = self.get_source(environment, name)
+    entry = compiled_templates and compiled_templates.TEMPLATES.get(name)
+    if entry and entry[0] == source_checksum(source):
+      code = compile(entry[1], filename, 'exec')
+      return environment.template_class.from_code(environment, code, globals or {}, uptodate)
+    logging.warning("%s is not precompiled; run tools/compile_templates.py." % name)
+    return jinja2.FileSystemLoader.load(self, environment, name, globals)
+
+
+def floatformat(value, places=-1):
+  """Django's floatformat: a negative places only shows decimals if there are any."""
+  try:
+    value = float(value)
+  except (TypeError, ValueError):
+    return ''
+  if places < 0 and value == int(value):
+    return '%d' % int(value)
+  return '%.*f' % (abs(places), value)
+
+
+def timesince(value, now=None):
+  """Django's timesince: the age of a datetime, such as "2 days, 3 hours"."""
+  if not value:
+    return ''
+  if not now:
+    now = datetime.datetime.now()
+  delta = now - value
+  since = delta.days * 86400 + delta.seconds
+  for (i, (seconds, name)) in enumerate(TIMESINCE_CHUNKS):
+    count = since // seconds
+    if count > 0:
+      break
+  else:
+    return '0 minutes'
+  parts = ['%d %s%s' % (count, name, (count != 1 and 's') or '')]
+  if i + 1 < len(TIMESINCE_CHUNKS):
+    seconds2, name2 = TIMESINCE_CHUNKS[i + 1]
+    count2 = (since - seconds * count) // seconds2
+    if count2 > 0:
+      parts.append('%d %s%s' % (count2, name2, (count2 != 1 and 's') or ''))
+  return ', '.join(parts)
+
+
+def create_environment(loader=None, bytecode_cache=None):
+  """Return a Jinja2 environment set up like the one render() uses."""
+  env = jinja2.Environment(
+      loader=loader or jinja2.FileSystemLoader(TEMPLATE_DIR),
+      bytecode_cache=bytecode_cache,
+      undefined=_SilentUndefined,
+      # Deployed templates never change, so skip the stat() on every render.
+      auto_reload=os.environ.get('SERVER_SOFTWARE', '').startswith('Development'))
+  env.filters['floatformat'] = floatformat
+  env.filters['timesince'] = timesince
+  return env
+
+
+_environment = create_environment(
+    loader=_PrecompiledLoader(TEMPLATE_DIR),
+    bytecode_cache=bccache.MemcachedBytecodeCache(memcache, prefix=BYTECODE_PREFIX,
+                                                  timeout=BYTECODE_TTL))
+
+
+def render(name, values):
+  """Render templates/jinja2/<name> with a dict of values, as a UTF-8 string."""
+  return _environment.get_template(name).render(values).encode('utf-8')
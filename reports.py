@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Materialized /id/<n> reports.
+
+Submissions never change after upload, so everything lookup.html shows is
+computed once, stored as a compressed SubmissionReport child of the
+Submission and cached under a single cache key. Bump REPORT_VERSION when
+the contents change; jobs.rebuild_report brings old reports up to date, and
+stale ones are rebuilt on their next view anyway.
+
+Serving a stored report needs none of the charting code, so charts and
+url_map are only imported by the functions that build reports.
+"""
+import operator
+import pickle
+import zlib
+
+from google.appengine.ext import db
+
+import cache
+import models
+import prefetch
+
+REPORT_VERSION = 1
+REPORT_CACHE_TTL = 86400
+# Batch sizes for the queries of build_report(). A submission has a few dozen
+# nameservers, each with a handful of index results.
+NAMESERVER_BATCH_SIZE = 100
+INDEX_RESULT_BATCH_SIZE = 500
+
+
+def _ReportKey(submission_id):
+  return db.Key.from_path('Submission', submission_id, 'SubmissionReport', 'report')
+
+
+def get_report(submission_id):
+  """Return the report dict for a submission id, or None if there is no submission."""
+  blob = cache.get_or_compute('report', submission_id, lambda: _LoadReport(submission_id),
+                              REPORT_CACHE_TTL, version=REPORT_VERSION)
+  if blob is None:
+    return None
+  return pickle.loads(zlib.decompress(blob))
+
+
+def _LoadReport(submission_id):
+  """Return the stored report for a submission, building it if needed."""
+  submission, report = db.get([db.Key.from_path('Submission', submission_id),
+                               _ReportKey(submission_id)])
+  if report and report.version == REPORT_VERSION:
+    return report.data
+  elif submission:
+    return save_report(submission)
+  return None
+
+
+def save_report(submission):
+  """Build and store the report for a submission. Returns the encoded report."""
+  blob = zlib.compress(pickle.dumps(build_report(submission), pickle.HIGHEST_PROTOCOL))
+  models.SubmissionReport(key=_ReportKey(submission.key().id()), version=REPORT_VERSION,
+                          data=blob).put()
+  return blob
+
+
+def build_report(submission):
+  """Compute the lookup.html template values for a submission.
+
+  The queries only depend on the submission, so they are all started before
+  the first result is read: Query.run() sends the first batch right away.
+  """
+  ns_subs = models.SubmissionNameServer.all().filter("submission =", submission).run(
+      batch_size=NAMESERVER_BATCH_SIZE)
+  configs = models.SubmissionConfig.all().filter("submission =", submission).run()
+  index_results = models.IndexResult.all().ancestor(submission).run(
+      batch_size=INDEX_RESULT_BATCH_SIZE)
+
+  nsdata = prefetch.prefetch_refprops(ns_subs, models.SubmissionNameServer.nameserver)
+  # The best and primary nameservers are normally among the tested ones, so
+  # this is served from the identity map.
+  prefetch.prefetch_refprops([submission], models.Submission.best_nameserver,
+                             models.Submission.primary_nameserver)
+  ns_summary = _CreateNameServerTable(nsdata)
+  report = {
+    'id': submission.key().id(),
+    'timestamp': submission.timestamp,
+    'index_data': [],     # DISABLED: _CreateIndexData(nsdata)
+    'nsdata': ns_summary,
+    'submission': {
+      'country': submission.country,
+      'region': submission.region,
+      'city': submission.city,
+      'class_c': submission.class_c,
+      'primary_nameserver': _NameServerSummary(submission.primary_nameserver),
+    },
+    'best_nameserver': _NameServerSummary(submission.best_nameserver),
+    'best_improvement': submission.best_improvement,
+  }
+  if not ns_summary:
+    return report
+
+  recommended = [ns_summary[0]]
+  reference = None
+  
+  for row in ns_summary:
+    if row['is_reference']:
+      reference = row
+  
+  for record in sorted(ns_summary, key=operator.itemgetter('duration_min')):      
+    if record['ip'] != recommended[0]['ip']:
+      recommended.append(record)
+      if len(recommended) == 3:
+        break
+
+  # Charts first, while the config and index result queries are still running.
+  report.update({
+    'reference': reference,
+    'port_behavior_data': _CreatePortBehaviorData(ns_summary),
+    'mean_duration_url': _CreateMeanDurationUrl(nsdata),
+    'min_duration_url': _CreateMinimumDurationUrl(nsdata),
+    'distribution_url_250': _CreateDistributionUrl(nsdata, 250),
+    'recommended': recommended,
+  })
+  version, config = _GetConfigTuples(configs)
+  index_results = _GetIndexResults(index_results)
+  report.update({
+    'config': config,
+    'version': version,
+    'goog_index_data': _CreateIndexData(nsdata, index_results, 'A/www.google.com.'),
+    'wiki_index_data': _CreateIndexData(nsdata, index_results, 'A/www.wikipedia.org.'),
+  })
+  return report
+
+
+def _NameServerSummary(ns):
+  if not ns:
+    return None
+  return {'ip': ns.ip, 'name': ns.name}
+
+
+def _GetConfigTuples(configs):
+  # configuration is only one row, so the for loop is kind of silly here.
+  hide_keys = ['submission']
+  
+  show_config = []
+  version = None
+  for configuration in configs:
+    for key in sorted(models.SubmissionConfig.properties().keys()):
+      if key == 'version':
+        version = getattr(configuration, key)
+      if key not in hide_keys:
+        show_config.append((key, getattr(configuration, key)))
+  return (version, show_config)
+
+
+def _GetIndexResults(results):
+  """Return a dict of (SubmissionNameServer key, IndexHost key) -> [IndexResult]."""
+  index_results = {}
+  for result in results:
+    key = (models.IndexResult.submission_nameserver.get_value_for_datastore(result),
+           models.IndexResult.index_host.get_value_for_datastore(result))
+    index_results.setdefault(key, []).append(result)
+  return index_results
+
+
+def _Charts():
+  # our private stash of third party code
+  import third_party
+  from libnamebench import charts
+  return charts
+
+
+def _CreateMeanDurationUrl(nsdata):
+  charts = _Charts()
+  runs_data = [(x.nameserver.name, x.averages) for x in nsdata if not x.is_disabled]
+  return charts.PerRunDurationBarGraph(runs_data)
+
+
+def _CreateMinimumDurationUrl(nsdata):
+  charts = _Charts()
+  fastest_nsdata = [x for x in sorted(nsdata, key=operator.attrgetter('duration_min')) if not x.is_disabled]
+  min_data = [(x.nameserver, x.duration_min) for x in fastest_nsdata]
+  return charts.MinimumDurationBarGraph(min_data)
+
+
+def _CreateDistributionUrl(nsdata, scale):
+  charts = _Charts()
+  runs_data = []
+  for ns_sub in nsdata:
+    runs_data.append((ns_sub.nameserver, ns_sub.durations()))
+  return charts.DistributionLineGraph(runs_data, scale=scale, sort_by=_SortDistribution)
+
+
+def _SortDistribution(a, b):
+  """Sort distribution graph by name (for now)."""
+  return cmp(a[0].name, b[0].name)
+
+
+def _CreatePortBehaviorData(ns_summary):
+  data = []
+  for row in ns_summary:
+    data.append("['%s','%s']," % (row['name'], row['port_behavior']))
+  return ''.join(data)
+
+
+def _CreateIndexData(nsdata, index_results, record):
+  host_key = db.Key.from_path('IndexHost', record)
+  data = []
+  for ns in nsdata:
+    name = ns.nameserver.name
+    if not name:
+      name = ns.nameserver.ip
+    for result in index_results.get((ns.key(), host_key), []):
+      data.append("['%s',%0.1f,%i,'%s']," % (name, result.duration, result.ttl, result.response))
+  return ''.join(data)
+
+
+def _CreateNameServerTable(nsdata):
+  from libnamebench import url_map
+  table = []
+  for ns_sub in nsdata:
+    table.append({
+      'ip': ns_sub.nameserver.ip,
+      'name': ns_sub.nameserver.name,
+      'version': ns_sub.version,
+      'node_ids': [x for x in ns_sub.node_ids if x],
+      'is_disabled': ns_sub.is_disabled,
+      'is_reference': ns_sub.is_reference,
+      'sys_position': ns_sub.sys_position,
+      'hostname': ns_sub.nameserver.hostname,
+      'diff': ns_sub.diff,
+      'check_average': ns_sub.check_average,
+      'overall_average': ns_sub.overall_average,
+      'duration_min': ns_sub.duration_min,
+      'duration_max': ns_sub.duration_max,
+      'error_count': ns_sub.error_count,
+      'port_behavior': ns_sub.port_behavior,
+      'timeout_count': ns_sub.timeout_count,
+      'nx_count': ns_sub.nx_count,
+      'notes': url_map.CreateNoteUrlTuples(ns_sub.notes)
+    })
+  return table
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Hourly and daily latency rollups per (country, nameserver).
+
+The country fold task also adds every listed submission to an HourlyRollup
+for each of its global nameservers, plus the fastest local one (as
+countries.LOCAL_IP). A cron job compacts hourly rollups older than
+HOURLY_RETENTION into DailyRollups, and deletes daily ones older than
+DAILY_RETENTION. Daily rollups remember the submissions merged into them, so
+that a fold retried, or run late, after its hour was compacted is neither
+counted twice nor dropped: it creates an hourly rollup again, which the next
+compaction merges in if it has submissions the daily rollup does not.
+
+get_window() merges the rollups covering a time window: a 30 day view is one
+batch get of about 30 daily and 27 hourly entities, whatever the number of
+submissions. get_recent() does the same for several nameservers and windows
+at once, for the trends on the country page.
+
+Key names are "country_code:ip:start", with start formatted as YYYYMMDDHH for
+hourly rollups and YYYYMMDD for daily ones. Times are UTC.
+"""
+import datetime
+import logging
+import time
+
+from google.appengine.ext import db
+
+from libnamebench import histogram
+import models
+
+HOURLY_RETENTION = datetime.timedelta(days=1)
+DAILY_RETENTION = datetime.timedelta(days=400)
+# Submission ids remembered per hourly rollup, so that a retried task does not
+# count a submission twice.
+MAX_FOLDED_IDS = 1000
+# The same for a daily rollup, which takes every hour of the day.
+MAX_DAILY_FOLDED_IDS = 20000
+# How far the cron job may fall behind on compacting hourly rollups.
+COMPACTION_LAG = datetime.timedelta(hours=2)
+HOUR = datetime.timedelta(hours=1)
+DAY = datetime.timedelta(days=1)
+
+
+def _HourStart(timestamp):
+  return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _DayStart(timestamp):
+  return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _HourlyKeyName(country_code, ip, start):
+  return '%s:%s:%s' % (country_code, ip, start.strftime('%Y%m%d%H'))
+
+
+def _DailyKeyName(country_code, ip, start):
+  return '%s:%s:%s' % (country_code, ip, start.strftime('%Y%m%d'))
+
+
+def _Merge(rollup, latencies):
+  """Add a LatencyHistogram to a rollup and refresh its summary fields."""
+  merged = rollup.latency_histogram()
+  merged.Merge(latencies)
+  rollup.packed_histogram = histogram.Pack(merged)
+  rollup.count = merged.count
+  rollup.mean = merged.Mean()
+  rollup.minimum = merged.min
+  rollup.maximum = merged.max
+
+
+def _AddToHour(key_name, country_code, ip, start, submission_id, latencies):
+  rollup = models.HourlyRollup.get_by_key_name(key_name)
+  if not rollup:
+    rollup = models.HourlyRollup(key_name=key_name, country_code=country_code, ip=ip,
+                                 start=start, submission_count=0)
+  elif submission_id in rollup.folded_ids:
+    return False
+  _Merge(rollup, latencies)
+  rollup.submission_count += 1
+  rollup.folded_ids = (rollup.folded_ids + [submission_id])[-MAX_FOLDED_IDS:]
+  rollup.put()
+  return True
+
+
+def record_submission(submission, rows):
+  """Add the countries.submission_rows of a listed submission to its hourly rollups."""
+  start = _HourStart(submission.timestamp)
+  submission_id = submission.key().id()
+  ips = [ip for (ip, row) in rows.items() if row['histogram'].count and row['is_global']]
+  # Once the hour is compacted, its daily rollup knows the submission instead.
+  dailies = db.get([db.Key.from_path('DailyRollup',
+                                     _DailyKeyName(submission.country_code, x, _DayStart(start)))
+                    for x in ips])
+  for ip, daily in zip(ips, dailies):
+    if daily and submission_id in daily.folded_ids:
+      continue
+    row = rows[ip]
+    key_name = _HourlyKeyName(submission.country_code, ip, start)
+    db.run_in_transaction(_AddToHour, key_name, submission.country_code, ip, start,
+                          submission_id, row['histogram'])
+
+
+def _CompactHour(hourly):
+  """Merge an hourly rollup into its daily rollup. Run in a transaction."""
+  start = _DayStart(hourly.start)
+  key_name = _DailyKeyName(hourly.country_code, hourly.ip, start)
+  daily = models.DailyRollup.get_by_key_name(key_name)
+  if not daily:
+    daily = models.DailyRollup(key_name=key_name, country_code=hourly.country_code,
+                               ip=hourly.ip, start=start, submission_count=0)
+  merged_ids = set(daily.folded_ids)
+  new_ids = [x for x in hourly.folded_ids if x not in merged_ids]
+  # Either this hour was merged already and the delete did not happen, or the
+  # hourly rollup was created again by late folds, which record_submission()
+  # only lets through for submissions that are not merged yet.
+  if hourly.start.hour in daily.merged_hours and not new_ids:
+    return False
+  if len(new_ids) < len(hourly.folded_ids):
+    logging.warning("Hourly rollup %s has submissions already merged into %s." %
+                    (hourly.key().name(), key_name))
+  _Merge(daily, hourly.latency_histogram())
+  daily.submission_count += hourly.submission_count
+  daily.folded_ids = (daily.folded_ids + new_ids)[-MAX_DAILY_FOLDED_IDS:]
+  if hourly.start.hour not in daily.merged_hours:
+    daily.merged_hours = daily.merged_hours + [hourly.start.hour]
+  daily.put()
+  return True
+
+
+def compact(now=None, deadline=20):
+  """Fold old hourly rollups into daily ones, and expire old daily rollups.
+
+  Stops after deadline seconds; returns a (compacted, expired, finished)
+  tuple, where finished is False if there is work left over.
+  """
+  if not now:
+    now = datetime.datetime.utcnow()
+  started = time.time()
+  compacted = 0
+  expired = 0
+
+  hour_cutoff = _HourStart(now - HOURLY_RETENTION)
+  while time.time() - started < deadline:
+    hourlies = models.HourlyRollup.all().filter('start <', hour_cutoff).fetch(50)
+    if not hourlies:
+      break
+    for hourly in hourlies:
+      # A daily rollup remembers the submissions it merged, so if we are
+      # interrupted before the delete, the next run only deletes.
+      db.run_in_transaction(_CompactHour, hourly)
+    db.delete(hourlies)
+    compacted += len(hourlies)
+  else:
+    return (compacted, expired, False)
+
+  day_cutoff = _DayStart(now - DAILY_RETENTION)
+  while time.time() - started < deadline:
+    keys = models.DailyRollup.all(keys_only=True).filter('start <', day_cutoff).fetch(500)
+    if not keys:
+      return (compacted, expired, True)
+    db.delete(keys)
+    expired += len(keys)
+  return (compacted, expired, False)
+
+
+def recomputable_day(timestamp, now=None):
+  """Return the start of the day of a timestamp if replace_daily() may write it.
+
+  That is a day that is past HOURLY_RETENTION, so its hourly rollups are
+  compacted, and still within DAILY_RETENTION; for other days, None.
+  """
+  if not now:
+    now = datetime.datetime.utcnow()
+  start = _DayStart(timestamp)
+  if start + DAY > _HourStart(now - HOURLY_RETENTION) or start < _DayStart(now - DAILY_RETENTION):
+    return None
+  return start
+
+
+def replace_daily(country_code, ip, start, submission_count, latencies, submission_ids=()):
+  """Overwrite a DailyRollup with totals recomputed from the submissions of its day."""
+  daily = models.DailyRollup(key_name=_DailyKeyName(country_code, ip, start),
+                             country_code=country_code, ip=ip, start=start,
+                             submission_count=submission_count)
+  _Merge(daily, latencies)
+  # Everything is in already, so compact() only merges hourly rollups left
+  # over if they have submissions that are not in submission_ids.
+  daily.merged_hours = range(24)
+  daily.folded_ids = list(submission_ids)[-MAX_DAILY_FOLDED_IDS:]
+  daily.put()
+
+
+def _WindowKeys(country_code, ip, start, end, now):
+  """Return the keys of every rollup that may hold submissions between start and end."""
+  keys = []
+  # Days are only in daily rollups once some of their hours were compacted.
+  day = _DayStart(start)
+  while day < min(end, _HourStart(now - HOURLY_RETENTION)):
+    keys.append(db.Key.from_path('DailyRollup', _DailyKeyName(country_code, ip, day)))
+    day += DAY
+  # Hourly rollups only exist for the last HOURLY_RETENTION, plus whatever
+  # the cron job has not got to yet.
+  hour = max(_HourStart(start), _HourStart(now - HOURLY_RETENTION - COMPACTION_LAG))
+  while hour < end:
+    keys.append(db.Key.from_path('HourlyRollup', _HourlyKeyName(country_code, ip, hour)))
+    hour += HOUR
+  return keys
+
+
+def _MergeWindow(rollups, start):
+  """Merge the rollups of one (country, nameserver) that cover start or later.
+
+  Returns:
+    (submission count, histogram.LatencyHistogram)
+  """
+  rollups = [x for x in rollups if x and x.start >= _DayStart(start)]
+  merged_hours = {}
+  for rollup in rollups:
+    if isinstance(rollup, models.DailyRollup):
+      merged_hours[rollup.start] = set(rollup.merged_hours)
+
+  submission_count = 0
+  latencies = histogram.LatencyHistogram()
+  for rollup in rollups:
+    if isinstance(rollup, models.HourlyRollup):
+      if rollup.start < _HourStart(start):
+        continue
+      if rollup.start.hour in merged_hours.get(_DayStart(rollup.start), ()):
+        continue
+    submission_count += rollup.submission_count
+    latencies.Merge(rollup.latency_histogram())
+  return (submission_count, latencies)
+
+
+def get_window(country_code, ip, start, end, now=None):
+  """Return the merged rollups of a (country, nameserver) between two UTC times.
+
+  Older data only has day resolution, so days are included whole once they
+  have been compacted. Reads one daily rollup per day and about
+  HOURLY_RETENTION + COMPACTION_LAG worth of hourly ones.
+
+  Returns:
+    (submission count, histogram.LatencyHistogram)
+  """
+  if not now:
+    now = datetime.datetime.utcnow()
+  end = min(end, now)
+  return _MergeWindow(db.get(_WindowKeys(country_code, ip, start, end, now)), start)
+
+
+def get_recent(country_code, ips, days, now=None):
+  """Return get_window() up to now for several nameservers and numbers of days.
+
+  Everything is read with one batch get, of the rollups of the longest
+  window.
+
+  Args:
+    country_code: the country of the rollups.
+    ips: nameserver IPs, such as countries.LOCAL_IP.
+    days: numbers of days, such as (7, 30).
+
+  Returns:
+    A dict of ip -> {days: (submission count, histogram.LatencyHistogram)}
+  """
+  if not now:
+    now = datetime.datetime.utcnow()
+  starts = dict([(x, now - datetime.timedelta(days=x)) for x in days])
+  earliest = min(starts.values())
+  keys = [_WindowKeys(country_code, ip, earliest, now, now) for ip in ips]
+  fetched = db.get([key for ip_keys in keys for key in ip_keys])
+  results = {}
+  for ip, ip_keys in zip(ips, keys):
+    rollups = fetched[:len(ip_keys)]
+    fetched = fetched[len(ip_keys):]
+    results[ip] = dict([(x, _MergeWindow(rollups, start)) for (x, start) in starts.items()])
+  return results
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for reading rollups.py windows across hour and day boundaries.
+
+Run from the top directory, with the App Engine SDK on the path:
+
+  python -m unittest rollups_test
+"""
+import datetime
+import unittest
+
+from google.appengine.ext import db
+from google.appengine.ext import testbed
+
+from libnamebench import histogram
+import models
+import rollups
+
+IP = '8.8.8.8'
+
+
+class FakeSubmission(object):
+  """The parts of a Submission that record_submission() looks at."""
+
+  def __init__(self, submission_id, timestamp, country_code='DE'):
+    self.submission_id = submission_id
+    self.timestamp = timestamp
+    self.country_code = country_code
+
+  def key(self):
+    return db.Key.from_path('Submission', self.submission_id)
+
+
+def _Rows(latency, ips=(IP,)):
+  latencies = histogram.LatencyHistogram()
+  latencies.Add(latency)
+  return dict([(ip, {'histogram': latencies, 'is_global': True}) for ip in ips])
+
+
+class WindowTest(unittest.TestCase):
+
+  def setUp(self):
+    self.testbed = testbed.Testbed()
+    self.testbed.activate()
+    self.testbed.init_datastore_v3_stub()
+    self.next_id = 1
+
+  def tearDown(self):
+    self.testbed.deactivate()
+
+  def _Record(self, timestamp, latency=10.0, ips=(IP,)):
+    submission = FakeSubmission(self.next_id, timestamp)
+    self.next_id += 1
+    rollups.record_submission(submission, _Rows(latency, ips))
+    return submission
+
+  def _Count(self, start, end, now):
+    return rollups.get_window('DE', IP, start, end, now=now)[0]
+
+  def testHourBoundary(self):
+    now = datetime.datetime(2010, 6, 2, 1, 15)
+    self._Record(datetime.datetime(2010, 6, 1, 23, 59), latency=20.0)
+    self._Record(datetime.datetime(2010, 6, 2, 0, 0), latency=40.0)
+    self._Record(datetime.datetime(2010, 6, 2, 0, 30), latency=60.0)
+
+    self.assertEqual(3, self._Count(datetime.datetime(2010, 6, 1, 23, 0), now, now))
+    # Recent data has hour resolution: the window starts with its hour.
+    self.assertEqual(2, self._Count(datetime.datetime(2010, 6, 2, 0, 0), now, now))
+    self.assertEqual(2, self._Count(datetime.datetime(2010, 6, 2, 0, 45), now, now))
+    self.assertEqual(1, self._Count(datetime.datetime(2010, 6, 1, 23, 0),
+                                    datetime.datetime(2010, 6, 2, 0, 0), now))
+    count, latencies = rollups.get_window('DE', IP, datetime.datetime(2010, 6, 2, 0, 0), now,
+                                          now=now)
+    self.assertEqual(50.0, latencies.Mean())
+
+  def testCompactedDaysAreWhole(self):
+    self._Record(datetime.datetime(2010, 6, 1, 5, 30))
+    self._Record(datetime.datetime(2010, 6, 1, 23, 30))
+    self._Record(datetime.datetime(2010, 6, 2, 0, 30))
+    now = datetime.datetime(2010, 6, 4, 12, 0)
+    self.assertEqual((3, 0, True), rollups.compact(now=now))
+    self.assertEqual(0, models.HourlyRollup.all().count())
+
+    self.assertEqual(3, self._Count(datetime.datetime(2010, 5, 31, 0, 0), now, now))
+    self.assertEqual(3, self._Count(datetime.datetime(2010, 6, 1, 18, 0), now, now))
+    self.assertEqual(1, self._Count(datetime.datetime(2010, 6, 2, 0, 0), now, now))
+    self.assertEqual(1, self._Count(datetime.datetime(2010, 6, 2, 12, 0), now, now))
+    self.assertEqual(0, self._Count(datetime.datetime(2010, 6, 3, 0, 0), now, now))
+
+  def testDayHalfCompacted(self):
+    # Hours before the compaction cutoff are in the daily rollup, later ones
+    # of the same day still in hourly rollups.
+    self._Record(datetime.datetime(2010, 6, 1, 8, 30))
+    self._Record(datetime.datetime(2010, 6, 1, 9, 30))
+    self._Record(datetime.datetime(2010, 6, 1, 10, 30))
+    now = datetime.datetime(2010, 6, 2, 10, 5)
+    self.assertEqual((2, 0, True), rollups.compact(now=now))
+    self.assertEqual(1, models.HourlyRollup.all().count())
+
+    self.assertEqual(3, self._Count(datetime.datetime(2010, 6, 1, 0, 0), now, now))
+    self.assertEqual(3, self._Count(datetime.datetime(2010, 6, 1, 10, 0), now, now))
+    # The day is compacted, so it is counted whole from any hour on.
+    self.assertEqual(3, self._Count(datetime.datetime(2010, 6, 1, 10, 45), now, now))
+    self.assertEqual(0, self._Count(datetime.datetime(2010, 6, 2, 0, 0), now, now))
+
+  def testMergedHourLeftOverIsNotCountedTwice(self):
+    self._Record(datetime.datetime(2010, 6, 1, 5, 30))
+    hourly = models.HourlyRollup.all().get()
+    now = datetime.datetime(2010, 6, 2, 7, 0)
+    rollups.compact(now=now)
+    # As if the cron job had stopped before deleting the hourly rollup.
+    models.HourlyRollup(key_name=hourly.key().name(), country_code='DE', ip=IP,
+                        start=hourly.start, submission_count=1,
+                        packed_histogram=hourly.packed_histogram,
+                        folded_ids=hourly.folded_ids).put()
+    self.assertEqual(1, self._Count(datetime.datetime(2010, 6, 1, 0, 0), now, now))
+
+  def testGetRecent(self):
+    now = datetime.datetime(2010, 6, 30, 12, 0)
+    for day in (1, 20, 25, 29, 30):
+      self._Record(datetime.datetime(2010, 6, day, 11, 0), ips=(IP, '4.2.2.1'))
+    self._Record(datetime.datetime(2010, 6, 30, 11, 30))
+    rollups.compact(now=now)
+
+    recent = rollups.get_recent('DE', [IP, '4.2.2.1', '1.2.3.4'], (1, 7, 30), now=now)
+    # The day before now is compacted, so it is in the last day whole.
+    self.assertEqual({1: 3, 7: 4, 30: 6},
+                     dict([(x, y[0]) for (x, y) in recent[IP].items()]))
+    self.assertEqual({1: 2, 7: 3, 30: 5},
+                     dict([(x, y[0]) for (x, y) in recent['4.2.2.1'].items()]))
+    self.assertEqual({1: 0, 7: 0, 30: 0},
+                     dict([(x, y[0]) for (x, y) in recent['1.2.3.4'].items()]))
+    for days in (1, 7, 30):
+      self.assertEqual(recent[IP][days][0],
+                       self._Count(now - datetime.timedelta(days=days), now, now))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -16,22 +16,36 @@
 #
 import cgi
 import datetime
+import logging
 import os
 import re
+import zlib
 from google.appengine.ext import db
-from google.appengine.api import memcache
+from google.appengine.api import taskqueue
 from google.appengine.ext import webapp
-from google.appengine.ext.webapp import template
 from google.appengine.ext.webapp import util
 from django.utils import simplejson
 
+from libnamebench import histogram
+from libnamebench import packing
+import cache
+import countries
+import dedup
 import models
+import recent
+import registry
+import uploads
 
 MIN_QUERY_COUNT = 100
 MIN_SERVER_COUNT = 7
-# The minimum amount of time between submissions that we list
-# TODO(tstromberg): Fix duplication in tasks.py
-MIN_LISTING_DELTA = datetime.timedelta(hours=6)
+# The datastore refuses batch puts larger than this.
+MAX_PUT_BATCH = 500
+# Store uploads and hand them to a task queue worker instead of writing them
+# while the client waits.
+DEFERRED_INGEST = True
+INGEST_QUEUE = 'ingest'
+# Queued uploads must fit in a SubmissionPayload, below the 1MB entity limit.
+MAX_PAYLOAD_SIZE = 1000 * 1024
 
 # TODO(tstromberg): Remove duplicate code - comes from libnamebench/util.py
 def is_private_ip(ip):
@@ -48,29 +62,59 @@ def is_private_ip(ip):
   else:
     return None
 
+def compact_nameserver(nsdata):
+  """Pack the durations of a nameserver record as soon as it has been parsed.
+
+  Raises ValueError for records that are not shaped like one, so that they
+  are refused like any other undecodable upload.
+  """
+  if not isinstance(nsdata, dict):
+    raise ValueError("Nameserver record is not a JSON object.")
+  if nsdata.get('durations'):
+    runs = nsdata.pop('durations')
+    if not isinstance(runs, list) or [x for x in runs if not isinstance(x, list)]:
+      raise ValueError("Nameserver durations are not a list of runs.")
+    for run in runs:
+      if [x for x in run if not isinstance(x, (int, long, float))]:
+        raise ValueError("Nameserver durations are not all numbers.")
+    nsdata['packed_durations'] = packing.PackDurations(runs)
+    latencies = histogram.LatencyHistogram()
+    for run in runs:
+      latencies.Extend(run)
+    nsdata['packed_histogram'] = histogram.Pack(latencies)
+  return nsdata
+
 def list_average(values):
   """Computes the arithmetic mean of a list of numbers."""
   if not values:
     return 0
   return sum(values) / float(len(values))
 
+def submission_fields(ns_subs):
+  """Return the denormalized Submission fields for its SubmissionNameServers, as a dict.
+
+  Nameservers are returned as keys. jobs.recompute_submission_fields uses it
+  to refresh the fields of stored submissions.
+  """
+  fields = {'primary_nameserver': None, 'best_nameserver': None, 'best_improvement': None}
+  for ns_sub in ns_subs:
+    ns_key = models.SubmissionNameServer.nameserver.get_value_for_datastore(ns_sub)
+    if ns_sub.sys_position == 0:
+      fields['primary_nameserver'] = ns_key
+    # The fastest ns wins a special award.
+    if ns_sub.position == 0:
+      fields['best_nameserver'] = ns_key
+      if not ns_sub.sys_position == 0 and ns_sub.diff:
+        fields['best_improvement'] = ns_sub.diff
+  return fields
+
 
 class SubmitHandler(webapp.RequestHandler):
 
   """Handler for result submissions."""
 
-  def _duplicate_run_count(self, class_c, client_id, submit_id):
-    """Check if the user has submitted anything in the last 24 hours."""
-    dupes = models.Submission.all().filter("submit_id = ", submit_id).filter("class_c = ", class_c).count()
-    if dupes:
-      return -1
-    
-    check_ts = datetime.datetime.now() - MIN_LISTING_DELTA
-    excess_listings = models.Submission.all().filter("client_id =", client_id).filter("class_c =", class_c).filter("timestamp > ", check_ts).filter("listed = ", True).count()
-    return excess_listings
-
   def _process_index_submission(self, index_results, submission, ns_sub, index_hosts):
-    """Process the index submission for a particular host."""
+    """Build the index results for a particular host. Returns unsaved entities."""
 
     result_list = []
     for host, req_type, duration, answer_count, ttl, response in index_results:
@@ -89,65 +133,146 @@ class SubmitHandler(webapp.RequestHandler):
           break
 
       if not results:
-        print "Odd, %s did not match." % host
+        logging.warning("Odd, %s did not match." % host)
     
-    db.put(result_list)
+    return result_list
+
+  def _validate(self, data):
+    """Return a list of problems that make an upload impossible to ingest."""
+    problems = []
+    if not isinstance(data, dict):
+      return ["Submission data is not a JSON object."]
+    if not isinstance(data.get('config'), dict) or 'query_count' not in data['config']:
+      problems.append("Missing config.query_count.")
+    if not isinstance(data.get('nameservers'), list):
+      problems.append("Missing nameservers.")
+    else:
+      for nsdata in data['nameservers']:
+        if not isinstance(nsdata, dict) or 'ip' not in nsdata or 'sys_position' not in nsdata:
+          problems.append("Nameserver record without ip or sys_position.")
+          break
+    return problems
 
   def post(self):
-    """Store the results from a submission. Rather long."""
-    notes = []
+    """Store the results from a submission. Rather long.
+
+    Newer clients send the upload as a gzip or deflate encoded JSON request
+    body; older ones send it URL-encoded in the 'data' form field.
+    """
     client_id = int(self.request.get('client_id'))
     submit_id = int(self.request.get('submit_id'))
-    data = simplejson.loads(self.request.get('data'))
+    try:
+      if self.request.headers.get('Content-Encoding', '').lower() in ('gzip', 'deflate'):
+        # Keep the compressed body as it is; it is also what gets queued.
+        blob = self.request.body
+        data = uploads.parse(uploads.iter_decompressed(blob), transform=compact_nameserver)
+      else:
+        raw_data = self.request.get('data').encode('utf-8')
+        data = uploads.parse(uploads.iter_chunks(raw_data), transform=compact_nameserver)
+        blob = None
+        if DEFERRED_INGEST:
+          blob = zlib.compress(raw_data)
+        del raw_data
+    except uploads.UploadTooLarge, e:
+      self.error(413)
+      response = {'state': 'error', 'url': '/', 'notes': [str(e)]}
+      return self.response.out.write(simplejson.dumps(response))
+    except (ValueError, zlib.error), e:
+      self.error(400)
+      response = {'state': 'error', 'url': '/', 'notes': ["Could not decode upload: %s" % e]}
+      return self.response.out.write(simplejson.dumps(response))
+    hidden = self.request.get('hidden', False)
+    if DEFERRED_INGEST and len(blob) + len(unicode(hidden).encode('utf-8')) > MAX_PAYLOAD_SIZE:
+      self.error(413)
+      response = {'state': 'error', 'url': '/',
+                  'notes': ["Upload is larger than %d bytes compressed." % MAX_PAYLOAD_SIZE]}
+      return self.response.out.write(simplejson.dumps(response))
     ip = self.request.remote_addr
     class_c = '.'.join(ip.split('.')[0:3])
-    cached_index_hosts = self.get_cached_index_hosts()
-    ns_map = self.insert_nameservers_from_data(data)
-    excess_listings = self._duplicate_run_count(class_c, client_id, submit_id)
+    problems = self._validate(data)
+    if problems:
+      self.error(400)
+      response = {'state': 'error', 'url': '/', 'notes': problems}
+      return self.response.out.write(simplejson.dumps(response))
+
+    submission_key, is_duplicate = dedup.reserve_submission_key(class_c, submit_id)
     # A special handler for the unlikely case of a duplicate submit_id. 
-    if excess_listings == -1:
-      response = {'state': 'dupe', 'url': '/', 'notes': ["Duplicate submit_id. How'd that happen?"]}
+    if is_duplicate:
+      response = {'state': 'dupe', 'url': '/id/%s' % submission_key.id(),
+                  'notes': ["Duplicate submit_id. How'd that happen?"]}
       return self.response.out.write(simplejson.dumps(response))
     
-    return db.run_in_transaction(self.insert_data, class_c, submit_id, client_id, data, ns_map,
-                                 cached_index_hosts, excess_listings=excess_listings)
+    excess_listings = dedup.recent_listing_count(class_c, client_id, dedup.MIN_LISTING_DELTA)
+    if DEFERRED_INGEST:
+      response = db.run_in_transaction(self._queue_payload, submission_key, class_c, submit_id,
+                                       client_id, blob, hidden, excess_listings)
+    else:
+      response = self.ingest(submission_key, class_c, client_id, data, hidden, excess_listings)
+    self.response.out.write(simplejson.dumps(response))
+
+  def _queue_payload(self, submission_key, class_c, submit_id, client_id, blob, hidden,
+                     excess_listings):
+    """Store the raw upload and queue it for ingestion. Runs in a transaction."""
+    existing = models.Submission.get(submission_key)
+    if existing:
+      return self._submission_response(existing, ["Already received this upload."])
+
+    url = '/id/%s' % submission_key.id()
+    notes = ["Your results are being processed."]
+    payload_key = db.Key.from_path('SubmissionPayload', 'payload', parent=submission_key)
+    if models.SubmissionPayload.get(payload_key):
+      return {'state': 'processing', 'url': url, 'notes': notes}
+
+    payload = models.SubmissionPayload(key=payload_key)
+    payload.class_c = class_c
+    payload.submit_id = submit_id
+    payload.client_id = client_id
+    payload.hidden = hidden or None
+    payload.excess_listings = excess_listings
+    payload.data = blob
+    payload.put()
+    taskqueue.add(url='/tasks/ingest', queue_name=INGEST_QUEUE,
+                  params={'key': str(payload_key)}, transactional=True)
+    return {'state': 'processing', 'url': url, 'notes': notes}
+
+  def ingest_payload(self, payload):
+    """Ingest an upload stored by _queue_payload. Used by the task queue worker."""
+    data = uploads.parse(uploads.iter_decompressed(payload.data), transform=compact_nameserver)
+    submission_key = payload.key().parent()
+    return self.ingest(submission_key, payload.class_c, payload.client_id, data, payload.hidden,
+                       payload.excess_listings, payload=payload)
 
+  def ingest(self, submission_key, class_c, client_id, data, hidden, excess_listings,
+             payload=None):
+    """Write an upload to the datastore. Returns the response for the client."""
+    cached_index_hosts = self.get_cached_index_hosts()
+    ns_map = self.insert_nameservers_from_data(data)
+    if not excess_listings and self._listing_checks(class_c, data, hidden)[1]:
+      # Uploads are queued before any of them is listed, so the check /submit
+      # made is redone here, and the listing taken at once.
+      if not dedup.reserve_listing(class_c, client_id, submission_key.id(),
+                                   dedup.MIN_LISTING_DELTA):
+        excess_listings = 1
+    return db.run_in_transaction(self.insert_data, submission_key, class_c, data, ns_map,
+                                 cached_index_hosts, hidden=hidden,
+                                 excess_listings=excess_listings, payload=payload)
+
+  @cache.cached('index_hosts', 14400, key=lambda self: 'listed')
   def get_cached_index_hosts(self):
-    index_hosts = memcache.get('index_hosts')
-    if index_hosts is not None:
-      return index_hosts
-    
     index_hosts = []
     for record in db.GqlQuery("SELECT * FROM IndexHost WHERE listed=True"):
       index_hosts.append(record)
-    if not memcache.add("index_hosts", index_hosts, 14400):
-      logging.error("Memcache set failed.")
     return index_hosts
 
   def insert_nameservers_from_data(self, data):
-    """Insert nameservers from data. Designed to run in another transaction.
+    """Insert nameservers from data, creating those that are missing.
     
-    Caches the result for re-use by insert_data
+    Returns a dict of ip -> NameServer for re-use by insert_data.
     """
-
-    ns_map = {}
-    for nsdata in data['nameservers']:
-      ns_record = models.NameServer.get_or_insert(
-          nsdata['ip'],
-          ip=nsdata['ip'],
-          name=nsdata['name'],
-          hostname=nsdata['hostname'],
-          is_global=nsdata.get('is_global', False),
-          is_regional=nsdata.get('is_regional', False),
-          is_custom=nsdata.get('is_custom', False),
-          listed=False
-      )
-      ns_map[nsdata['ip']] = ns_record
-    return ns_map
+    return registry.upsert_nameservers(data['nameservers'])
       
-  def insert_data(self, class_c, submit_id, client_id, data, ns_map, cached_index_hosts, excess_listings=None):
-    """Process data uploaded by namebench."""
-    
+  def _listing_checks(self, class_c, data, hidden):
+    """Return (notes, listed, hidden) for an upload, apart from the listing rate."""
     notes = []
     listed = True
   
@@ -159,27 +284,43 @@ class SubmitHandler(webapp.RequestHandler):
       notes.append("Not enough servers to list (need %s)." % MIN_SERVER_COUNT)
       listed = False
 
-    if excess_listings:
-      notes.append("You have already submitted a listed entry within %s" % MIN_LISTING_DELTA)
-      listed = False
-
-    submission = models.Submission()
-    submission.client_id = client_id
-    submission.submit_id = submit_id
-    submission.class_c = class_c
     # Hide from the main index. 
-    hide_me = self.request.get('hidden', False)
+    hide_me = hidden
     # simplejson does not seem to convert booleans
     if hide_me and hide_me != 'False':
       notes.append("Hidden on request: %s [%s]" % (hide_me, type(hide_me)))
-      submission.hidden = True
-      listed = False
+      return (notes, False, True)
     elif is_private_ip(class_c):
       notes.append("Hidden due to internal IP.")
-      submission.hidden = True
+      return (notes, False, True)
+    return (notes, listed, False)
+
+  def insert_data(self, submission_key, class_c, data, ns_map, cached_index_hosts, hidden=None,
+                  excess_listings=None, payload=None):
+    """Process data uploaded by namebench.
+
+    The whole entity group is built in memory against pre-allocated keys and
+    written with as few batched puts as possible. If the Submission already
+    exists, an earlier attempt of this upload has committed and nothing is
+    written again. A queued payload is deleted in the same transaction.
+    """
+    
+    existing = models.Submission.get(submission_key)
+    if existing:
+      if payload:
+        db.delete(payload)
+      return self._submission_response(existing, ["Already received this upload."])
+
+    notes, listed, is_hidden = self._listing_checks(class_c, data, hidden)
+    if excess_listings:
+      notes.append("You have already submitted a listed entry within %s" % dedup.MIN_LISTING_DELTA)
       listed = False
-    else:
-      submission.hidden = False
+
+    # client_id and submit_id are no longer stored with the submission; they
+    # only live in the dedup records, which expire after dedup.MIN_LISTING_DELTA.
+    submission = models.Submission(key=submission_key)
+    submission.class_c = class_c
+    submission.hidden = is_hidden
     submission.listed = listed
 
     if 'geodata' in data and data['geodata']:
@@ -189,10 +330,10 @@ class SubmitHandler(webapp.RequestHandler):
         submission.region = data['geodata'].get('region_name', None)
         submission.country = data['geodata'].get('country_name', None)    
         submission.country_code = data['geodata'].get('country_code', None)    
-    submission.put()
+    entities = [submission]
     
     # Dump configuration for later reference.
-    config = models.SubmissionConfig(parent=submission)
+    config = models.SubmissionConfig(parent=submission_key)
     config.submission = submission
     save_variables = [
       'query_count',
@@ -208,13 +349,22 @@ class SubmitHandler(webapp.RequestHandler):
     for var in save_variables:
       if data['config'].get(var) != None:
         setattr(config, var, data['config'][var])
+    entities.append(config)
 
-    config.put()
-    
-    for nsdata in data['nameservers']:
-      # TODO(tstromberg): Look into caching this from our previous results.
+    # Child rows reference the SubmissionNameServer entities, so they need keys
+    # before anything has been written.
+    ns_keys = []
+    if data['nameservers']:
+      first_id, last_id = db.allocate_ids(
+          db.Key.from_path('SubmissionNameServer', 1, parent=submission_key),
+          len(data['nameservers']))
+      ns_keys = [db.Key.from_path('SubmissionNameServer', x, parent=submission_key)
+                 for x in range(first_id, last_id + 1)]
+
+    ns_subs = []
+    for nsdata, ns_key in zip(data['nameservers'], ns_keys):
       ns_record = ns_map[nsdata['ip']]
-      ns_sub = models.SubmissionNameServer(parent=submission)
+      ns_sub = models.SubmissionNameServer(key=ns_key)
       ns_sub.submission = submission
       ns_sub.nameserver = ns_record
       
@@ -244,39 +394,37 @@ class SubmitHandler(webapp.RequestHandler):
           else:
             setattr(ns_sub, var, nsdata[var])
         
-      if nsdata['sys_position'] == 0:
-        submission.primary_nameserver = ns_record
       if nsdata.get('notes'):
         # Only include the text information, not the URL.
         ns_sub.notes = [x['text'] for x in nsdata['notes']]
-      ns_sub_instance = ns_sub.put()
-
-      # The fastest ns wins a special award.
-      if ns_sub.position == 0:
-        submission.best_nameserver = ns_record
-        if not ns_sub.sys_position == 0 and ns_sub.diff:
-          submission.best_improvement = ns_sub.diff
-
-      if nsdata.get('durations'):
-        result_list = []
-        for idx, run in enumerate(nsdata['durations']):
-          run_results = models.RunResult(parent=submission)
-          run_results.submission_nameserver = ns_sub
-          run_results.run_number = idx
-          run_results.durations = list(run)
-          result_list.append(run_results)
-        db.put(result_list)
+      entities.append(ns_sub)
+      ns_subs.append(ns_sub)
+
+      if nsdata.get('packed_durations'):
+        ns_sub.packed_durations = nsdata['packed_durations']
+        ns_sub.packed_histogram = nsdata['packed_histogram']
 
       if nsdata.get('index'):
-        self._process_index_submission(nsdata['index'], submission, ns_sub_instance,
-                                       cached_index_hosts)
+        entities.extend(self._process_index_submission(nsdata['index'], submission_key, ns_sub,
+                                                       cached_index_hosts))
+
+    for name, value in submission_fields(ns_subs).items():
+      setattr(submission, name, value)
+
+    for i in range(0, len(entities), MAX_PUT_BATCH):
+      db.put(entities[i:i + MAX_PUT_BATCH])
+    if payload:
+      db.delete(payload)
 
-    # Final update with the primary_nameserver / best_nameserver data.
-    submission.put()
     if listed:
+      countries.queue_fold(submission_key.id())
+      recent.queue_add(submission_key.id())
+    return self._submission_response(submission, notes)
+
+  def _submission_response(self, submission, notes):
+    """Describe to the namebench client where its results ended up."""
+    if submission.listed:
       state = 'public'
-      # invalidate the data for the frontpage
-      memcache.delete('submissions')
     elif submission.hidden:
       state = 'hidden'
     else:
@@ -286,4 +434,4 @@ class SubmitHandler(webapp.RequestHandler):
         'url': '/id/%s' % submission.key().id(),
         'notes': notes
     }
-    self.response.out.write(simplejson.dumps(response))
+    return response
@@ -14,38 +14,174 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import calendar
 import cgi
 import datetime
+import logging
 import os
+import time
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
 from google.appengine.ext import db
 from google.appengine.ext import webapp
-from google.appengine.ext.webapp import template
 from google.appengine.ext.webapp import util
 from django.utils import simplejson
 
+import cache
+import counters
+import countries
+import dedup
+import frontpage
 import models
-
-# The minimum amount of time between submissions that we list.
-# TODO(tstromberg): Fix duplication in submit.py
-MIN_LISTING_DELTA = datetime.timedelta(hours=6)
+import recent
+import recompute
+import reports
+import rollups
+import submit
 
 
 class ClearDuplicateIdHandler(webapp.RequestHandler):
-  """Provide an easy way to clear the duplicate check id from the submissions table.
+  """Clear the dedup.py records older than dedup.MIN_LISTING_DELTA.
+
+  The cron job starts a run with a GET. Each request clears records for
+  BATCH_DEADLINE seconds with dedup.clear_expired(), then queues a POST to
+  carry on from its stage and cursor, so a run takes as many requests as
+  there are expired records to clear. Tasks are named after the run and
+  batch number, so a retried request does not fork the run.
+  """
+  BATCH_DEADLINE = 20
+
+  def get(self):
+    expired_before = datetime.datetime.now() - dedup.MIN_LISTING_DELTA
+    self._RunBatch(calendar.timegm(expired_before.timetuple()), int(time.time()), 0, 0, None, 0)
+
+  def post(self):
+    self._RunBatch(int(self.request.get('expired_before')), int(self.request.get('run')),
+                   int(self.request.get('batch')), int(self.request.get('stage')),
+                   self.request.get('cursor') or None, int(self.request.get('cleared')))
+
+  def _RunBatch(self, expired_before, run, batch, stage, cursor, cleared):
+    started = time.time()
+    stage, cursor, batch_cleared, finished = dedup.clear_expired(
+        datetime.datetime.utcfromtimestamp(expired_before), stage, cursor, self.BATCH_DEADLINE)
+    elapsed = time.time() - started
+    cleared += batch_cleared
+    message = ("Batch %d cleared %d records in %.1fs (%.0f/s); %d in %ds since the run started." %
+               (batch, batch_cleared, elapsed, batch_cleared / max(elapsed, 0.001), cleared,
+                time.time() - run))
+    logging.info(message)
+    self.response.out.write(message)
+    if finished:
+      logging.info("Cleared %d dedup records older than %s." %
+                   (cleared, datetime.datetime.utcfromtimestamp(expired_before)))
+      return
+
+    params = {'expired_before': expired_before, 'run': run, 'batch': batch + 1,
+              'stage': stage, 'cursor': cursor or '', 'cleared': cleared}
+    try:
+      taskqueue.add(url='/tasks/clear_dupes', params=params,
+                    name='clear-dupes-%d-%d' % (run, batch + 1))
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+      logging.info("Batch %d of run %d was already queued." % (batch + 1, run))
+
+
+class IngestSubmissionHandler(submit.SubmitHandler):
+  """Task queue worker that writes uploads stored by SubmitHandler.
+
+  Errors propagate so that the queue retries the task. Once the submission has
+  been written its payload is gone, so later deliveries are no-ops.
+  """
+
+  def post(self):
+    payload = models.SubmissionPayload.get(self.request.get('key'))
+    if not payload:
+      logging.info("Payload %s already ingested." % self.request.get('key'))
+      return
+    submission_key = payload.key().parent()
+    response = self.ingest_payload(payload)
+    # Nobody is waiting on us, so build the report before the first view needs it.
+    submission = models.Submission.get(submission_key)
+    if submission:
+      reports.save_report(submission)
+    self.response.out.write(simplejson.dumps(response))
+
 
-  Designed to be run as a cronjob.
+class AddRecentHandler(webapp.RequestHandler):
+  """Task queue worker adding a listed submission to the front page summary."""
+
+  def post(self):
+    submission = models.Submission.get_by_id(int(self.request.get('id')))
+    if not submission or not submission.listed:
+      logging.info("Submission %s is not listed, not added." % self.request.get('id'))
+      return
+    recent.add_submission(submission)
+
+
+class FoldCountryHandler(webapp.RequestHandler):
+  """Task queue worker adding a listed submission to the statistics.
+
+  That is its CountryAggregate, rollups and counters.
+  """
+
+  def post(self):
+    submission_id = int(self.request.get('id'))
+    submission, ns_subs = countries.load_submission(submission_id)
+    if not submission:
+      logging.info("Submission %s is not listed, not folded." % submission_id)
+      return
+    counters.increment_once(submission.key(), countries.counter_increments(submission, ns_subs))
+    if not submission.country_code:
+      return
+
+    rows = countries.submission_rows(ns_subs)
+    if not countries.fold_submission(submission, rows):
+      logging.info("Submission %s already folded." % submission_id)
+    # Rollups keep track of their own submissions, so a retry that failed
+    # half way through fills in the rest.
+    rollups.record_submission(submission, rows)
+
+
+class FinishRecomputeHandler(webapp.RequestHandler):
+  """Write the results of a recompute job, the done_callback of its mapreduce.
+
+  Each request runs recompute.finish() for BATCH_DEADLINE seconds, then
+  queues a request to carry on from its stage and part, named after the job
+  and batch number like ClearDuplicateIdHandler does.
   """
+  BATCH_DEADLINE = 20
+
+  def post(self):
+    mapreduce_id = self.request.headers.get('Mapreduce-Id') or self.request.get('mapreduce_id')
+    batch = int(self.request.get('batch') or 0)
+    started = time.time()
+    stage, start, handled, finished = recompute.finish(
+        mapreduce_id, int(self.request.get('stage') or 0), self.request.get('start') or None,
+        self.BATCH_DEADLINE)
+    elapsed = time.time() - started
+    message = ("Batch %d of job %s handled %d entities in %.1fs (%.0f/s)." %
+               (batch, mapreduce_id, handled, elapsed, handled / max(elapsed, 0.001)))
+    logging.info(message)
+    self.response.out.write(message)
+    if finished:
+      logging.info("Recompute job %s is finished." % mapreduce_id)
+      return
+
+    params = {'mapreduce_id': mapreduce_id, 'batch': batch + 1, 'stage': stage,
+              'start': start or ''}
+    try:
+      taskqueue.add(url='/tasks/finish_recompute', params=params,
+                    name='finish-recompute-%s-%d' % (mapreduce_id, batch + 1))
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+      logging.info("Batch %d of job %s was already queued." % (batch + 1, mapreduce_id))
+
+
+class CompactRollupsHandler(webapp.RequestHandler):
+  """Compact hourly rollups into daily ones. Designed to be run as a cronjob."""
 
   def get(self):
-    check_ts = datetime.datetime.now() - MIN_LISTING_DELTA
-    cleared = []
-    for record in models.Submission.all().filter('client_id != ', None): 
-      if record.timestamp < check_ts:
-        record.client_id = None
-        record.submit_id = None
-        cleared.append(record)
-    db.put(cleared)
-    self.response.out.write("%s submissions older than %s cleared." % (len(cleared), check_ts))
+    compacted, expired, finished = rollups.compact()
+    self.response.out.write("%s hourly rollups compacted, %s daily rollups expired%s." %
+                            (compacted, expired, (not finished and ", more left") or ""))
 
 
 class ImportIndexHostsHandler(webapp.RequestHandler):
@@ -64,3 +200,5 @@ class ImportIndexHostsHandler(webapp.RequestHandler):
       key = '/'.join([h_type, h_name])
       entry = models.IndexHost.get_or_insert(key, record_type=h_type, record_name=h_name, listed=True)
       self.response.out.write(entry.record_name)
+    cache.delete('index_hosts', 'listed')
+    memcache.delete(frontpage.INDEX_HOSTS_VERSION_KEY)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Precompile templates/jinja2 into compiled_templates.py.
+
+Run from the tools directory whenever a template changes, and deploy the
+result along with the templates:
+
+  ./compile_templates.py [--sdk /usr/local/google_appengine]
+
+Templates left out of date are still rendered, just compiled at runtime.
+"""
+
+import optparse
+import os
+import sys
+
+HEADER = '''# Generated by tools/compile_templates.py from templates/jinja2; do not edit.
+#
+# Template name -> (source checksum, Python source from jinja2's compiler).
+
+TEMPLATES = {}
+'''
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--sdk', default='/usr/local/google_appengine',
+                    help='App Engine SDK directory')
+  parser.add_option('--output', default='../compiled_templates.py',
+                    help='module to write')
+  (options, args) = parser.parse_args()
+
+  sys.path.append(options.sdk)
+  sys.path.append('..')
+  import rendering
+
+  env = rendering.create_environment()
+  output = open(options.output, 'w')
+  output.write(HEADER)
+  for name in sorted(os.listdir(rendering.TEMPLATE_DIR)):
+    if not name.endswith('.html'):
+      continue
+    source, filename, uptodate = env.loader.get_source(env, name)
+    code = env.compile(source, name, filename, raw=True)
+    output.write('\nTEMPLATES[%r] = (%r, %r)\n' % (name, rendering.source_checksum(source), code))
+    print "%-20s %6d bytes of template, %6d bytes of Python" % (name, len(source), len(code))
+  output.close()
+
+
+if __name__ == '__main__':
+  main()
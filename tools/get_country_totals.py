@@ -1,4 +1,3 @@
-#!/usr/bin/python
 #!/usr/bin/env python
 #
 # Copyright 2010 Google Inc.
@@ -15,128 +14,143 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Get the total number of submissions per country."""
+"""Get the number of recent submissions per country, nameserver and input source.
+
+Counts through remote_api with analytics.count_submissions, one submission
+per class C network. For very long windows, the "Count listed submissions"
+mapreduce job does the same grouping on the server; --job shows its totals
+instead, and --delete-job deletes them once they are no longer needed.
+
+  ./get_country_totals.py [--days 7] [--group-by country,best_nameserver] app_id [host]
+  ./get_country_totals.py --job <mapreduce id> [--delete-job] app_id [host]
+"""
 
-import code
 import datetime
 import getpass
-import operator
+import optparse
 import re
-import pygeoip
 import sys
+import threading
+import time
+
+# Nameservers shown per nameserver group_by.
+TOP_NAMESERVERS = 150
+
+
+class _Progress(object):
+  """Prints pages read and throughput, at most once a second."""
+
+  def __init__(self):
+    self.counts = {}
+    self.started = time.time()
+    self.printed = 0
+    self.lock = threading.Lock()
 
-base_path = "/usr/local/google_appengine"
-sys.path.append(base_path)
-sys.path.append('..')
-sys.path.append('/Users/tstromberg/namebench-appengine')
-
-sys.path.append(base_path + "/lib/yaml/lib")
-sys.path.append(base_path + "/lib/webob")
-sys.path.append(base_path + "/lib/django")
-
-
-from google.appengine.ext.remote_api import remote_api_stub
-from google.appengine.ext import db
-import models
-
-def auth_func():
-    return raw_input('Username:'), getpass.getpass('Password:')
-
-if len(sys.argv) < 2:
-    print "Usage: %s app_id [host]" % (sys.argv[0],)
-app_id = sys.argv[1]
-host = '%s.appspot.com' % app_id
-
-if len(sys.argv) > 2:
-  days = int(sys.argv[2])
-else:
-  days = 7
-
-remote_api_stub.ConfigureRemoteDatastore(app_id, '/remote_api', auth_func, host)
-since = datetime.datetime.now() - datetime.timedelta(days=days)
-print "Gathering totals since %s" % since
-country_total = {}
-best_ns_total = {}
-current_ns_total = {}
-source_total = {}
-grand_total = 0
-seen_subs = []
-seen_nets = []
-NS_CACHE = {}
-entities = models.Submission.all().filter('listed = ', True).filter('timestamp > ', since).order('-timestamp').fetch(100)
-while entities:
-  print len(entities)
-  for entity in entities:
-    if entity.class_c in seen_nets:
-      print "(ignoring submission, already seen %s)" % entity.class_c
-      continue
-    if entity.key() in seen_subs:
-      print "duplicate key: %s" % entity.key()
-      break
-      
-    seen_subs.append(entity.key())
-    seen_nets.append(entity.class_c)
-    country_total[entity.country] = country_total.setdefault(entity.country, 0) + 1
-    current_ns_total[entity._primary_nameserver] = current_ns_total.setdefault(entity._primary_nameserver, 0) + 1
-    best_ns_total[entity._best_nameserver] = best_ns_total.setdefault(entity._best_nameserver, 0) + 1
-    grand_total += 1
-
-  # bad assumption, may miss two submissions sent at the exact same time.    
-  entities = models.Submission.all().filter('timestamp <', entity.timestamp).filter('listed =', True).filter('timestamp > ', since).order('-timestamp').fetch(100)
-
-#entities = models.SubmissionConfig.all().fetch(100)
-#while entities:
-#  for entity in entities:
-#    if entity._submission in seen_subs:
-#      source_total[entity.input_source] = source_total.setdefault(entity.input_source, 0) + 1
-#    
-#  entities = models.SubmissionConfig.all().filter('__key__ >', entities[-1].key()).fetch(100)
-
-print "COUNTRY: %s" % grand_total
-print "-" * 70
-for key in country_total:
-  count = country_total[key]
-  print "%s\t%s (%.1f%%)" % (count, key, (count / float(grand_total)) * 100)
-
-#print "SOURCE: %s" % grand_total
-#print "-" * 70
-#for key in source_total:
-#  count = source_total[key]
-#  print "%s\t%s (%.1f%%)" % (count, key, (count / float(grand_total)) * 100)
-
-def _GetCachedNsName(key):
-  if key not in NS_CACHE:
+  def __call__(self, kind, count):
+    self.lock.acquire()
     try:
-      ns = models.NameServer.get(key)
-      NS_CACHE[key] = ns.name or ns.ip
-    except:
-      NS_CACHE[key] = 'ERR-%s' % key
-  return NS_CACHE[key]
-  
-def _ShowNameServersByCount(data, count=150):
-  top_by_name = {}
-  top_ns_items = sorted(data.items(), key=operator.itemgetter(1))
-  top_ns_items.reverse()
-  for key, count in top_ns_items[:count]:
-    name = _GetCachedNsName(key)
-    name = re.sub('-\d+$', '', name)
-    name = re.sub('-\d+ ', ' ', name)
-    name = re.sub(' \d+ ', ' ', name)
-    if name.startswith('Internal') or name.endswith('.x'):
-      name = 'Internal IP'
-    top_by_name[name] = top_by_name.setdefault(name, 0) + count
-
-  top_names = sorted(top_by_name.items(), key=operator.itemgetter(1))
-  top_names.reverse()
-  for name, count in top_names:
-    print "%s\t%s (%.1f%%)" % (count, name, (count / float(grand_total)) * 100)
-
-print
-print "Best Top 150: %s" % grand_total
-print "-" * 70
-_ShowNameServersByCount(best_ns_total)
-
-print
-print "Current Top 150: %s" % grand_total
-print "-" * 70
-_ShowNameServersByCount(current_ns_total)
+      self.counts[kind] = self.counts.get(kind, 0) + count
+      if time.time() - self.printed >= 1:
+        self.printed = time.time()
+        elapsed = time.time() - self.started
+        print "%6.1fs  %s" % (elapsed, '  '.join(['%s: %d (%.0f/s)' % (x, y, y / elapsed)
+                                                  for (x, y) in sorted(self.counts.items())]))
+    finally:
+      self.lock.release()
+
+
+def _ShortName(name):
+  """Fold numbered names such as "SYS-1.2.3.4" or "Internal 12" into one."""
+  name = re.sub('-\d+$', '', name)
+  name = re.sub('-\d+ ', ' ', name)
+  name = re.sub(' \d+ ', ' ', name)
+  if name.startswith('Internal') or name.endswith('.x'):
+    name = 'Internal IP'
+  return name
+
+
+def _ShowCounts(title, items, total):
+  print
+  print "%s: %s" % (title, total)
+  print "-" * 70
+  for (name, count) in items:
+    print "%s\t%s (%.1f%%)" % (count, name, (count / float(total)) * 100)
+
+
+def _ShowNameServers(title, items, names, total):
+  by_name = {}
+  for (key_name, count) in items[:TOP_NAMESERVERS]:
+    name = _ShortName(names.get(key_name) or 'ERR-%s' % key_name)
+    by_name[name] = by_name.get(name, 0) + count
+  _ShowCounts(title, sorted(by_name.items(), key=lambda x: x[1], reverse=True), total)
+
+
+def main():
+  parser = optparse.OptionParser(usage='%prog [options] app_id [host]')
+  parser.add_option('--sdk', default='/usr/local/google_appengine',
+                    help='App Engine SDK directory')
+  parser.add_option('--days', type='int', default=7, help='days to count submissions from')
+  parser.add_option('--group-by', default='country,best_nameserver,primary_nameserver',
+                    help='comma separated: country, best_nameserver, primary_nameserver, '
+                    'input_source')
+  parser.add_option('--shards', type='int', default=8, help='parallel queries')
+  parser.add_option('--job', help='show the totals of a "Count listed submissions" job')
+  parser.add_option('--delete-job', action='store_true',
+                    help='delete the totals of --job after showing them')
+  (options, args) = parser.parse_args()
+  if not args:
+    parser.error('app_id is required')
+
+  sys.path.append(options.sdk)
+  for lib in ('lib/yaml/lib', 'lib/webob', 'lib/django'):
+    sys.path.append('%s/%s' % (options.sdk, lib))
+  sys.path.append('..')
+  from google.appengine.ext.remote_api import remote_api_stub
+  import analytics
+  import recompute
+
+  group_bys = [x.strip() for x in options.group_by.split(',')]
+  for group_by in group_bys:
+    if group_by not in analytics.GROUP_BYS:
+      parser.error('unknown group_by: %s' % group_by)
+  if options.delete_job and not options.job:
+    parser.error('--delete-job needs --job')
+
+  app_id = args[0]
+  host = (len(args) > 1 and args[1]) or '%s.appspot.com' % app_id
+  auth_func = lambda: (raw_input('Username:'), getpass.getpass('Password:'))
+  remote_api_stub.ConfigureRemoteDatastore(app_id, '/remote_api', auth_func, host)
+
+  if options.job:
+    print "Reading the totals of job %s" % options.job
+    totals = recompute.group_totals(options.job)
+    group_bys = [x for x in group_bys if x in totals.counts]
+  else:
+    since = datetime.datetime.now() - datetime.timedelta(days=options.days)
+    print "Gathering totals since %s" % since
+    totals = analytics.count_submissions(since, group_bys=group_bys, shards=options.shards,
+                                         progress=_Progress())
+
+  ns_keys = []
+  for group_by in ('best_nameserver', 'primary_nameserver'):
+    if group_by in group_bys:
+      ns_keys.extend([x[0] for x in totals.top(group_by, TOP_NAMESERVERS)])
+  names = analytics.nameserver_names(ns_keys)
+
+  titles = {'country': 'COUNTRY', 'input_source': 'SOURCE',
+            'best_nameserver': 'Best Top %d' % TOP_NAMESERVERS,
+            'primary_nameserver': 'Current Top %d' % TOP_NAMESERVERS}
+  for group_by in group_bys:
+    if group_by.endswith('_nameserver'):
+      _ShowNameServers(titles[group_by], totals.top(group_by), names, totals.total)
+    else:
+      _ShowCounts(titles[group_by], totals.top(group_by), totals.total)
+
+  if options.delete_job:
+    recompute.delete_parts(options.job)
+    print
+    print "Deleted the totals of job %s" % options.job
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Report how long a cold instance spends importing modules.
+
+Imports main.py, then loads the handler of each route in main.URL_MAPPING
+the way its first request would, and prints the time spent per route and
+per module. Routes are loaded in order, so a route's time only covers the
+modules that earlier routes had not imported already. Module times include the modules they import ("total") and
+leave them out ("self"). Run from the tools directory:
+
+  ./import_profile.py [--sdk /usr/local/google_appengine] [--top 30]
+"""
+
+import __builtin__
+import optparse
+import sys
+import time
+
+# module name -> [total seconds, self seconds]
+timings = {}
+_stack = []
+_original_import = __builtin__.__import__
+
+
+def _TimedImport(name, *args, **kwargs):
+  if name in sys.modules:
+    return _original_import(name, *args, **kwargs)
+  started = time.time()
+  _stack.append(0.0)
+  try:
+    return _original_import(name, *args, **kwargs)
+  finally:
+    elapsed = time.time() - started
+    children = _stack.pop()
+    if _stack:
+      _stack[-1] += elapsed
+    timing = timings.setdefault(name, [0.0, 0.0])
+    timing[0] += elapsed
+    timing[1] += elapsed - children
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--sdk', default='/usr/local/google_appengine',
+                    help='App Engine SDK directory')
+  parser.add_option('--top', type='int', default=30, help='modules to list')
+  (options, args) = parser.parse_args()
+
+  sys.path.append(options.sdk)
+  for lib in ('lib/yaml/lib', 'lib/webob', 'lib/django'):
+    sys.path.append('%s/%s' % (options.sdk, lib))
+  sys.path.append('..')
+
+  __builtin__.__import__ = _TimedImport
+  started = time.time()
+  import main as app_main
+  print "%-28s %8.1fms" % ('main', (time.time() - started) * 1000)
+
+  for (pattern, path) in app_main.URL_MAPPING:
+    before = len(sys.modules)
+    started = time.time()
+    module_name, name = path.rsplit('.', 1)
+    getattr(__import__(module_name, {}, {}, [name]), name)
+    print "%-28s %8.1fms  %3d new modules  (%s)" % (
+        pattern, (time.time() - started) * 1000, len(sys.modules) - before, path)
+  __builtin__.__import__ = _original_import
+
+  print
+  print "%-40s %10s %10s" % ('module', 'total', 'self')
+  ranked = sorted(timings.items(), key=lambda x: x[1][0], reverse=True)
+  for (name, (total, own)) in ranked[:options.top]:
+    print "%-40s %8.1fms %8.1fms" % (name, total * 1000, own * 1000)
+
+
+if __name__ == '__main__':
+  main()
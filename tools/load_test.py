@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fetch pages from many threads at once, to check concurrent request handling.
+
+Each thread fetches the given paths round robin until --requests have been
+made in total. Prints throughput, latency percentiles per path, and any
+errors; a page that renders differently between requests (other than a few
+bytes, such as ages) is reported too, as that usually means state leaking
+between concurrent requests. Run against the dev server or a deployed
+version:
+
+  ./load_test.py [--host http://localhost:8080] [--threads 20] [--requests 1000] \\
+      [/ /index_hosts /country/US /ns/8.8.8.8 /id/12345]
+"""
+
+import optparse
+import threading
+import time
+import urllib2
+
+DEFAULT_PATHS = ['/', '/index_hosts', '/country/US', '/ns/8.8.8.8']
+# Allowed difference in length between two renders of the same page.
+LENGTH_SLACK = 64
+
+
+class LoadTest(object):
+
+  def __init__(self, host, paths, total):
+    self.host = host
+    self.paths = paths
+    self.total = total
+    self.issued = 0
+    self.lock = threading.Lock()
+    # path -> list of seconds
+    self.timings = dict([(x, []) for x in paths])
+    # path -> length of the first response
+    self.lengths = {}
+    self.errors = []
+
+  def _NextPath(self):
+    self.lock.acquire()
+    try:
+      if self.issued >= self.total:
+        return None
+      self.issued += 1
+      return self.paths[self.issued % len(self.paths)]
+    finally:
+      self.lock.release()
+
+  def _Record(self, path, elapsed, body, error):
+    self.lock.acquire()
+    try:
+      if error:
+        self.errors.append((path, error))
+        return
+      self.timings[path].append(elapsed)
+      expected = self.lengths.setdefault(path, len(body))
+      if abs(len(body) - expected) > LENGTH_SLACK:
+        self.errors.append((path, 'length %d, first response was %d' % (len(body), expected)))
+    finally:
+      self.lock.release()
+
+  def Worker(self):
+    path = self._NextPath()
+    while path:
+      started = time.time()
+      body = None
+      error = None
+      try:
+        body = urllib2.urlopen(self.host + path).read()
+      except urllib2.HTTPError, e:
+        error = 'HTTP %s' % e.code
+      except Exception, e:
+        error = str(e)
+      self._Record(path, time.time() - started, body, error)
+      path = self._NextPath()
+
+
+def _Percentile(values, percent):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def main():
+  parser = optparse.OptionParser(usage='%prog [options] [path ...]')
+  parser.add_option('--host', default='http://localhost:8080', help='server to test')
+  parser.add_option('--threads', type='int', default=20, help='concurrent clients')
+  parser.add_option('--requests', type='int', default=1000, help='requests in total')
+  (options, args) = parser.parse_args()
+
+  test = LoadTest(options.host.rstrip('/'), args or DEFAULT_PATHS, options.requests)
+  threads = [threading.Thread(target=test.Worker) for x in range(options.threads)]
+  started = time.time()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed = time.time() - started
+
+  print "%d requests from %d threads in %.1fs: %.1f requests/s" % (
+      options.requests, options.threads, elapsed, options.requests / elapsed)
+  print
+  print "%-24s %6s %9s %9s %9s" % ('path', 'ok', 'median', '90%', 'max')
+  for path in test.paths:
+    timings = test.timings[path]
+    if timings:
+      print "%-24s %6d %7.0fms %7.0fms %7.0fms" % (
+          path, len(timings), _Percentile(timings, 50) * 1000,
+          _Percentile(timings, 90) * 1000, max(timings) * 1000)
+  if test.errors:
+    counts = {}
+    for error in test.errors:
+      counts[error] = counts.get(error, 0) + 1
+    print
+    print "%d errors:" % len(test.errors)
+    for ((path, error), count) in sorted(counts.items()):
+      print "  %-22s %5dx %s" % (path, count, error)
+
+
+if __name__ == '__main__':
+  main()
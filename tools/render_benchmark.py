@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare Django (webapp.template) and Jinja2 (rendering.py) page rendering.
+
+Renders each page from made up data the size of the real pages: 150
+recent.py rows on the front page, a country with 300 nameservers, a report
+with 40 tested nameservers. For each engine it prints the first render, which
+includes loading the template (from compiled_templates.py for "jinja2", from
+the template file for "jinja2-source"), and the mean of the later ones. It
+also checks that both engines produce the same page, ignoring whitespace.
+Run from the tools directory:
+
+  ./render_benchmark.py [--sdk /usr/local/google_appengine] [--runs 50]
+"""
+
+import datetime
+import optparse
+import os
+import random
+import re
+import sys
+import time
+
+
+class _Key(object):
+  def __init__(self, id):
+    self._id = id
+
+  def id(self):
+    return self._id
+
+
+class _Entity(object):
+  """Stands in for a datastore entity: attributes, plus key()."""
+
+  def __init__(self, id=None, **fields):
+    self.__dict__.update(fields)
+    self._key = _Key(id)
+
+  def key(self):
+    return self._key
+
+
+def _Ip():
+  return '%d.%d.%d.%d' % tuple([random.randint(1, 254) for x in range(4)])
+
+
+def _NameServer():
+  return _Entity(ip=_Ip(), name=random.choice(['', 'Google Public DNS', 'OpenDNS', 'SYS-%s' % _Ip()]),
+                 hostname='resolver%d.example.net' % random.randint(1, 99))
+
+
+def _Submissions(count):
+  now = datetime.datetime.now()
+  submissions = []
+  for i in range(count):
+    submissions.append(_Entity(
+        id=random.randint(1, 10 ** 6), hidden=False, listed=random.random() > 0.2,
+        region=random.choice(['', 'California', 'Bavaria']), country='Germany', country_code='DE',
+        class_c='%d.%d.%d' % (random.randint(1, 254), random.randint(0, 254), random.randint(0, 254)),
+        best_nameserver=_NameServer(), primary_nameserver=_NameServer(),
+        best_improvement=random.choice([None, random.uniform(0, 200)]),
+        coordinates='%.4f,%.4f' % (random.uniform(-90, 90), random.uniform(-180, 180)),
+        timestamp=now - datetime.timedelta(seconds=random.randint(0, 86400 * 40))))
+  return submissions
+
+
+def _IndexValues():
+  submissions = []
+  for x in _Submissions(150):
+    submissions.append({
+      'id': x.key().id(), 'timestamp': x.timestamp, 'region': x.region, 'country': x.country,
+      'country_code': x.country_code, 'class_c': x.class_c,
+      'best_name': x.best_nameserver.name or x.best_nameserver.ip,
+      'primary_name': x.primary_nameserver.name or x.primary_nameserver.ip,
+      'primary_ip': x.primary_nameserver.ip, 'best_improvement': x.best_improvement,
+      'coordinates': x.coordinates
+    })
+  return {
+    'submission_count': 123456,
+    'recent_submissions': submissions[0:15],
+    'submissions': submissions,
+    'maps_api_key': 'key'
+  }
+
+
+def _CountryValues():
+  submissions = _Submissions(150)
+  nsdata = {}
+  for i in range(300):
+    ns = _NameServer()
+    nsdata[ns.ip] = {'name': ns.name, 'ip': ns.ip, 'hostname': ns.hostname,
+                     'count': random.randint(1, 500),
+                     'overall_average': random.uniform(20, 400),
+                     'overall_position': random.choice([-1, random.uniform(1, 15)])}
+  return {
+    'country_code': 'DE',
+    'count': 4321,
+    'popular_nameservers': [(x['name'] or x['ip'], x['count']) for x in nsdata.values()[:10]],
+    'trends': [{'ip': x['ip'], 'name': x['name'] or x['ip'],
+                'windows': [(7, random.randint(0, 50), random.choice([None, random.uniform(20, 400)])),
+                            (30, random.randint(50, 200), random.uniform(20, 400))]}
+               for x in nsdata.values()[:8]],
+    'trend_days': (7, 30),
+    'nsdata': nsdata.values(),
+    'nsdata_raw': nsdata,
+    'country': 'Germany',
+    'maps_api_key': 'key',
+    'submissions': submissions,
+    'recent_submissions': submissions[0:15],
+    'last_update': submissions[0].timestamp,
+    'distribution_url': 'http://chart.apis.google.com/chart?x',
+    'distribution_url_global': 'http://chart.apis.google.com/chart?y'
+  }
+
+
+def _LookupValues():
+  nsdata = []
+  for i in range(40):
+    ns = _NameServer()
+    nsdata.append({
+      'ip': ns.ip, 'name': ns.name, 'hostname': ns.hostname, 'version': random.choice(['', 'BIND 9']),
+      'node_ids': random.choice([[], ['node-a', 'node-b']]), 'sys_position': i,
+      'is_disabled': random.random() < 0.1, 'is_error_prone': random.random() < 0.1,
+      'overall_average': random.uniform(20, 400), 'check_average': random.uniform(20, 400),
+      'diff': random.uniform(-50, 200), 'duration_min': random.uniform(1, 50),
+      'duration_max': random.uniform(400, 3500), 'timeout_count': random.randint(0, 3),
+      'nx_count': random.choice([None, 0, 2]),
+      'notes': [{'text': 'Replies with bogus NXDOMAIN', 'url': random.choice(['', 'http://x/'])}]
+    })
+  submission = _Entity(id=42, primary_nameserver=_NameServer(), country='Germany', region='Bavaria',
+                       city='Munich', class_c='10.1.2')
+  return {
+    'id': 42, 'version': '1.3', 'submission': submission,
+    'best_nameserver': nsdata[0], 'best_improvement': 42.5, 'reference': nsdata[1],
+    'recommended': nsdata[0:3], 'nsdata': nsdata, 'fastest_data': [],
+    'goog_index_data': '', 'wiki_index_data': '',
+    'config': [('benchmark_thread_count', 2), ('query_count', 250), ('version', '1.3')],
+    'mean_duration_url': 'x', 'min_duration_url': 'y', 'distribution_url_250': 'z'
+  }
+
+
+def _NameServerValues():
+  return {'ip': '8.8.8.8', 'nameserver': _Entity(ip='8.8.8.8', name='Google Public DNS',
+                                                 timestamp=datetime.datetime.now())}
+
+
+PAGES = (
+  ('index.html', _IndexValues),
+  ('country.html', _CountryValues),
+  ('lookup.html', _LookupValues),
+  ('nameserver.html', _NameServerValues)
+)
+
+
+def _Time(function, runs):
+  """Return (seconds for the first call, mean seconds for the others, first result)."""
+  started = time.time()
+  result = function()
+  first = time.time() - started
+  started = time.time()
+  for i in range(runs):
+    function()
+  return (first, (time.time() - started) / runs, result)
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--sdk', default='/usr/local/google_appengine',
+                    help='App Engine SDK directory')
+  parser.add_option('--runs', type='int', default=50, help='renders per page and engine')
+  (options, args) = parser.parse_args()
+
+  sys.path.append(options.sdk)
+  for lib in ('lib/webob', 'lib/django'):
+    sys.path.append('%s/%s' % (options.sdk, lib))
+  sys.path.append('..')
+  from google.appengine.ext.webapp import template
+  import rendering
+
+  random.seed(1)
+  django_dir = os.path.join(os.path.dirname(rendering.__file__), 'templates')
+  source_env = rendering.create_environment()
+  engines = (
+    ('django', lambda name, values: template.render(os.path.join(django_dir, name), values)),
+    ('jinja2', rendering.render),
+    ('jinja2-source', lambda name, values: source_env.get_template(name).render(values).encode('utf-8'))
+  )
+
+  print "%-16s %-14s %10s %10s %8s" % ('page', 'engine', 'first', 'mean', 'bytes')
+  for (name, make_values) in PAGES:
+    values = make_values()
+    pages = {}
+    for (engine, render) in engines:
+      first, mean, pages[engine] = _Time(lambda: render(name, values), options.runs)
+      print "%-16s %-14s %8.2fms %8.2fms %8d" % (name, engine, first * 1000, mean * 1000,
+                                                  len(pages[engine]))
+    if re.sub('\s+', '', pages['django']) != re.sub('\s+', '', pages['jinja2']):
+      print "%-16s WARNING: django and jinja2 output differ" % name
+
+
+if __name__ == '__main__':
+  main()
@@ -1,4 +1,3 @@
-#!/usr/bin/python
 #!/usr/bin/env python
 #
 # Copyright 2010 Google Inc.
@@ -15,120 +14,316 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""A simple tool to sync nsdata from namebench.cfg into App Eninge."""
+"""Sync the nameservers of namebench.cfg into App Engine.
+
+By default only servers that are not listed yet are looked at; --all looks at
+every server, and only writes those whose synced fields changed. Hostnames
+and locations are looked up from a pool of threads, and changed records are
+written with batched puts from another pool.
+
+  ./sync_nameservers.py [--all] [--dry-run] app_id [host]
+
+--stub runs everything against a local stub resolver and an in-memory
+datastore instead, to try out the tool without touching DNS or App Engine.
+"""
 
-import code
 import getpass
-import pygeoip
+import hashlib
+import optparse
+import Queue
+import random
 import sys
+import threading
+import time
+
+SYNCED_FIELDS = ('ip', 'name', 'hostname', 'is_global', 'is_regional', 'is_custom', 'listed',
+                 'city', 'region', 'country', 'country_code', 'coordinates')
+PUT_BATCH_SIZE = 100
+
+
+class Progress(object):
+  """Prints how far a step has got, at most once a second, and its throughput."""
+
+  def __init__(self, label, total):
+    self.label = label
+    self.total = total
+    self.done = 0
+    self.started = time.time()
+    self.printed = 0
+    self.lock = threading.Lock()
+
+  def Tick(self, count=1):
+    self.lock.acquire()
+    try:
+      self.done += count
+      if time.time() - self.printed >= 1 or self.done == self.total:
+        self.printed = time.time()
+        self._Print()
+    finally:
+      self.lock.release()
+
+  def _Print(self):
+    elapsed = max(time.time() - self.started, 0.001)
+    print "%-10s %5d/%-5d %6.1f/s %6.1fs" % (self.label, self.done, self.total,
+                                            self.done / elapsed, elapsed)
+
+
+def parallel_map(function, items, threads, label=None):
+  """Return [function(x) for x in items], computed by a pool of threads.
+
+  With a label, progress is printed as items complete.
+  """
+  results = [None] * len(items)
+  queue = Queue.Queue()
+  for item in enumerate(items):
+    queue.put(item)
+  progress = label and Progress(label, len(items))
+
+  def Worker():
+    while True:
+      try:
+        i, item = queue.get_nowait()
+      except Queue.Empty:
+        return
+      results[i] = function(item)
+      if progress:
+        progress.Tick()
+
+  pool = [threading.Thread(target=Worker) for x in range(min(threads, len(items)))]
+  for thread in pool:
+    thread.start()
+  for thread in pool:
+    thread.join()
+  return results
+
+
+def field_hash(fields):
+  """Digest of a dict of field values, comparable between entities and config."""
+  values = [(name, unicode(value)) for (name, value) in sorted(fields.items())]
+  return hashlib.md5(repr(values)).hexdigest()
+
+
+class Resolver(object):
+  """Looks up hostnames with namebench, and locations in a GeoLiteCity file."""
+
+  def __init__(self, geoip_path):
+    import pygeoip
+    from libnamebench import addr_util
+    from libnamebench import nameserver
+    self.addr_util = addr_util
+    self.nameserver = nameserver
+    self.geo_city = pygeoip.GeoIP(geoip_path)
+    # GeoIP reads share a file handle.
+    self.geo_lock = threading.Lock()
+
+  def is_private(self, ip):
+    return self.addr_util.IsPrivateIP(ip)
+
+  def hostname(self, ip, name):
+    return self.nameserver.NameServer(ip, name).hostname
+
+  def location(self, ip):
+    self.geo_lock.acquire()
+    try:
+      return self.geo_city.record_by_addr(ip) or {}
+    finally:
+      self.geo_lock.release()
+
+
+class StubResolver(object):
+  """Resolver stand-in with made up answers and a little latency."""
+
+  def is_private(self, ip):
+    return ip.startswith('10.') or ip.startswith('192.168.')
+
+  def hostname(self, ip, name):
+    time.sleep(random.uniform(0.01, 0.05))
+    return 'resolver-%s.example.net' % ip.replace(':', '-').replace('.', '-')
+
+  def location(self, ip):
+    return {'city': 'Springfield', 'region_name': 'Oregon', 'country_name': 'United States',
+            'country_code': 'US', 'latitude': 44.05, 'longitude': -123.02}
+
+
+class Datastore(object):
+  """NameServer entities in the App Engine datastore, through remote_api."""
+
+  def __init__(self):
+    from google.appengine.ext import db
+    import models
+    self.db = db
+    self.models = models
 
-base_path = "/usr/local/google_appengine"
-sys.path.append(base_path)
-sys.path.append('..')
-sys.path.append('/Users/tstromberg/namebench')
-sys.path.append('/Users/tstromberg/namebench-appengine')
-from libnamebench import nameserver
-from libnamebench import config
-from libnamebench import addr_util
-
-sys.path.append(base_path + "/lib/yaml/lib")
-sys.path.append(base_path + "/lib/webob")
-sys.path.append(base_path + "/lib/django")
-
-from google.appengine.ext.remote_api import remote_api_stub
-from google.appengine.ext import db
-import models
-
-def auth_func():
-    return raw_input('Username:'), getpass.getpass('Password:')
-
-if len(sys.argv) < 2:
-    print "Usage: %s app_id [host]" % (sys.argv[0],)
-app_id = sys.argv[1]
-if len(sys.argv) > 2:
-    host = sys.argv[2]
-else:
-    host = '%s.appspot.com' % app_id
-
-
-(options, supplied_ns, global_ns, regional_ns) = config.GetConfiguration()
-servers = []
-for ip, name in global_ns:
-  servers.append((ip.replace('_', ':'), name, True))
-for ip, name in regional_ns:
-  servers.append((ip.replace('_', ':'), name, False))
-
-remote_api_stub.ConfigureRemoteDatastore(app_id, '/remote_api', auth_func, host)
-geo_city = pygeoip.GeoIP('/usr/local/share/GeoLiteCity.dat')
-
-print "Gathering listed IPs"
-listed_ips = []
-entities = models.NameServer.all().fetch(100)
-while entities:
-  for entity in entities:
-    if entity.listed and entity.ip:
-      listed_ips.append(entity.ip)
-  entities = models.NameServer.all().filter('__key__ >', entities[-1].key()).fetch(250)
-
-print "%s previously listed ips found" % len(listed_ips)
-batch = []
-for ip, name, is_global in servers:
-  # If you would like to update all records, comment this out.
-  if ip in listed_ips:
-    continue
-  ns = nameserver.NameServer(ip, name)
-  remote_ns = models.NameServer.get_or_insert(ip)
-  remote_ns.ip = ip
-  remote_ns.name = name.decode('latin-1')
-  if addr_util.IsPrivateIP(ip):
-    remote_ns.hostname = 'internal.ip'
+  def listed_ips(self):
+    ips = set()
+    query = self.models.NameServer.all(keys_only=True).filter('listed =', True)
+    keys = query.fetch(1000)
+    while keys:
+      ips.update([x.name() for x in keys])
+      keys = query.with_cursor(query.cursor()).fetch(1000)
+    return ips
+
+  def get(self, ips):
+    """Return a NameServer for each IP; new ones for IPs that have none yet."""
+    entities = self.models.NameServer.get_by_key_name(ips)
+    return [x or self.models.NameServer(key_name=ip) for (ip, x) in zip(ips, entities)]
+
+  def put(self, entities):
+    self.db.put(entities)
+
+
+class _StubEntity(object):
+  def __init__(self):
+    for name in SYNCED_FIELDS:
+      setattr(self, name, None)
+
+
+class MemoryStore(object):
+  """Datastore stand-in keeping entities in a dict."""
+
+  def __init__(self):
+    self.entities = {}
+    self.lock = threading.Lock()
+
+  def listed_ips(self):
+    return set([ip for (ip, x) in self.entities.items() if x.listed])
+
+  def get(self, ips):
+    return [self.entities.get(x) or _StubEntity() for x in ips]
+
+  def put(self, entities):
+    self.lock.acquire()
+    try:
+      for entity in entities:
+        self.entities[entity.ip] = entity
+    finally:
+      self.lock.release()
+
+
+def _Decode(value):
+  if value:
+    return value.decode('latin-1')
+  return value
+
+
+def desired_fields(resolver, ip, name, is_global):
+  """Look up what the NameServer of a namebench.cfg server should contain."""
+  fields = {'ip': ip, 'name': name.decode('latin-1'), 'is_global': is_global,
+            'is_regional': not is_global, 'is_custom': False, 'listed': True}
+  if resolver.is_private(ip):
+    fields['hostname'] = 'internal.ip'
   else:
-    remote_ns.hostname = ns.hostname
-  print "%-4s - %s: %s / %s (%s)" % (len(batch), ip, name, ns.hostname, is_global)
-  remote_ns.is_global = is_global
-  remote_ns.is_custom = False
-  remote_ns.listed = True
-  if not is_global:
-    remote_ns.is_regional = True
-  
+    fields['hostname'] = resolver.hostname(ip, name)
+
+  details = {}
   if not is_global and ':' not in ip:
-    details = geo_city.record_by_addr(ns.ip)
-  else:
-    details = {}
-  
+    details = resolver.location(ip)
   # For a local IP, for instance.
   if details:
-    city = details.get('city', None)
-    if city:
-      remote_ns.city = city.decode('latin-1')
+    fields['city'] = _Decode(details.get('city'))
+    fields['region'] = _Decode(details.get('region_name'))
+    fields['country'] = _Decode(details.get('country_name'))
+    fields['country_code'] = details.get('country_code')
+    if 'latitude' in details:
+      fields['coordinates'] = '%s,%s' % (float(details['latitude']), float(details['longitude']))
+  return fields
 
-    country = details.get('country_name', None)
-    if country:
-      remote_ns.country = country.decode('latin-1')
 
-    remote_ns.country_code = details.get('country_code', None)
+def sync(servers, resolver, store, update_all=False, dry_run=False, threads=16, put_threads=4):
+  """Sync (ip, name, is_global) tuples into the store.
 
-    region = details.get('region_name', None)
-    if region:
-      remote_ns.region = region.decode('latin-1')
-    else:
-      remote_ns.region = None
+  Returns:
+    (servers looked up, entities written)
+  """
+  if update_all:
+    todo = servers
+  else:
+    listed = store.listed_ips()
+    print "%d servers are listed already" % len(listed)
+    todo = [x for x in servers if x[0] not in listed]
+  if not todo:
+    return (0, 0)
 
-    if 'latitude' in details:
-      remote_ns.coordinates = ','.join((str(details['latitude']), str(details['longitude'])))
-
-    print "\t%s, %s in %s (%s)" % (remote_ns.city, remote_ns.region, remote_ns.country, remote_ns.country_code)
-    print "\t%s" % details
-
-  batch.append(remote_ns)
-  if len(batch) == 100:
-    print "*** Updating batch ***"
-    db.put(batch)
-    batch = []
-    
-print "* Final batch update"
-db.put(batch)
-
-#entities = models.NameServer.all().fetch(100)
-#for entity in entities:
-#  print entity.name
+  wanted = parallel_map(lambda x: desired_fields(resolver, *x), todo, threads, 'resolved')
+  entities = []
+  for i in range(0, len(todo), PUT_BATCH_SIZE):
+    entities.extend(store.get([x[0] for x in todo[i:i + PUT_BATCH_SIZE]]))
+
+  changed = []
+  for fields, entity in zip(wanted, entities):
+    current = dict([(x, getattr(entity, x, None)) for x in fields])
+    if field_hash(current) == field_hash(fields):
+      continue
+    changed.append(entity)
+    if dry_run:
+      # Leave the entity alone: a store may hand out the ones it keeps.
+      print ("%-40s %-30s %s" % (fields['ip'], fields['hostname'], fields['name'])).encode('utf-8')
+      continue
+    for name, value in fields.items():
+      setattr(entity, name, value)
+  print "%d of %d servers changed" % (len(changed), len(todo))
+
+  if changed and not dry_run:
+    batches = [changed[i:i + PUT_BATCH_SIZE] for i in range(0, len(changed), PUT_BATCH_SIZE)]
+    progress = Progress('written', len(changed))
+    parallel_map(lambda x: (store.put(x), progress.Tick(len(x))), batches, put_threads)
+  return (len(todo), len(changed))
+
+
+def main():
+  parser = optparse.OptionParser(usage='%prog [options] app_id [host]')
+  parser.add_option('--sdk', default='/usr/local/google_appengine',
+                    help='App Engine SDK directory')
+  parser.add_option('--namebench', default='../../namebench',
+                    help='namebench checkout, for namebench.cfg and libnamebench')
+  parser.add_option('--geoip', default='/usr/local/share/GeoLiteCity.dat',
+                    help='GeoLiteCity database')
+  parser.add_option('--all', action='store_true', dest='update_all',
+                    help='update every server, not just unlisted ones')
+  parser.add_option('--dry-run', action='store_true', help='show changes without writing them')
+  parser.add_option('--stub', action='store_true',
+                    help='use a stub resolver and an in-memory datastore')
+  parser.add_option('--threads', type='int', default=16, help='lookup threads')
+  parser.add_option('--put-threads', type='int', default=4, help='threads writing batches')
+  (options, args) = parser.parse_args()
+  if not args and not options.stub:
+    parser.error('app_id is required')
+
+  sys.path.append(options.sdk)
+  for lib in ('lib/yaml/lib', 'lib/webob', 'lib/django'):
+    sys.path.append('%s/%s' % (options.sdk, lib))
+  sys.path.append('..')
+  sys.path.append(options.namebench)
+  from libnamebench import config
+
+  (unused_options, unused_supplied_ns, global_ns, regional_ns) = config.GetConfiguration()
+  servers = []
+  for ip, name in global_ns:
+    servers.append((ip.replace('_', ':'), name, True))
+  for ip, name in regional_ns:
+    servers.append((ip.replace('_', ':'), name, False))
+
+  if options.stub:
+    resolver = StubResolver()
+    store = MemoryStore()
+  else:
+    from google.appengine.ext.remote_api import remote_api_stub
+    app_id = args[0]
+    host = (len(args) > 1 and args[1]) or '%s.appspot.com' % app_id
+    auth_func = lambda: (raw_input('Username:'), getpass.getpass('Password:'))
+    remote_api_stub.ConfigureRemoteDatastore(app_id, '/remote_api', auth_func, host)
+    resolver = Resolver(options.geoip)
+    store = Datastore()
+
+  started = time.time()
+  looked_up, written = sync(servers, resolver, store, update_all=options.update_all,
+                            dry_run=options.dry_run, threads=options.threads,
+                            put_threads=options.put_threads)
+  elapsed = time.time() - started
+  print "%d of %d servers looked up, %d %s in %.1fs (%.1f servers/s)" % (
+      looked_up, len(servers), written, (options.dry_run and "would be written") or "written",
+      elapsed, looked_up / max(elapsed, 0.001))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for sync_nameservers.sync, against the stub resolver and store."""
+
+import StringIO
+import sys
+import threading
+import unittest
+
+import sync_nameservers
+
+
+class CountingResolver(sync_nameservers.StubResolver):
+  """StubResolver without the latency, remembering which IPs it resolved."""
+
+  def __init__(self):
+    self.resolved = []
+    self.lock = threading.Lock()
+
+  def hostname(self, ip, name):
+    self.lock.acquire()
+    try:
+      self.resolved.append(ip)
+    finally:
+      self.lock.release()
+    return 'resolver-%s.example.net' % ip.replace('.', '-')
+
+
+class CountingStore(sync_nameservers.MemoryStore):
+  """MemoryStore remembering the size of each put."""
+
+  def __init__(self):
+    sync_nameservers.MemoryStore.__init__(self)
+    self.puts = []
+
+  def put(self, entities):
+    sync_nameservers.MemoryStore.put(self, entities)
+    self.lock.acquire()
+    try:
+      self.puts.append(len(entities))
+    finally:
+      self.lock.release()
+
+
+def _Servers(count, first=1):
+  return [('8.8.%d.%d' % (i / 256, i % 256), 'Server %d' % i, i % 2 == 0)
+          for i in range(first, first + count)]
+
+
+class SyncTest(unittest.TestCase):
+
+  def setUp(self):
+    self.stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    self.resolver = CountingResolver()
+    self.store = CountingStore()
+
+  def tearDown(self):
+    sys.stdout = self.stdout
+
+  def testOnlyUnlistedServersAreResolved(self):
+    listed = _Servers(5)
+    sync_nameservers.sync(listed, self.resolver, self.store)
+    self.resolver.resolved = []
+    unlisted = _Servers(3, first=10)
+    looked_up, written = sync_nameservers.sync(listed + unlisted, self.resolver, self.store)
+    self.assertEqual((3, 3), (looked_up, written))
+    self.assertEqual(sorted([x[0] for x in unlisted]), sorted(self.resolver.resolved))
+
+  def testUnchangedServersAreNotWritten(self):
+    servers = _Servers(20)
+    self.assertEqual((20, 20), sync_nameservers.sync(servers, self.resolver, self.store))
+    self.store.puts = []
+    self.assertEqual((20, 0), sync_nameservers.sync(servers, self.resolver, self.store,
+                                                    update_all=True))
+    self.assertEqual([], self.store.puts)
+
+    renamed = list(servers)
+    renamed[4] = (renamed[4][0], 'Renamed', renamed[4][2])
+    self.assertEqual((20, 1), sync_nameservers.sync(renamed, self.resolver, self.store,
+                                                    update_all=True))
+    self.assertEqual([1], self.store.puts)
+    self.assertEqual(u'Renamed', self.store.entities[renamed[4][0]].name)
+
+  def testDryRunWritesNothing(self):
+    looked_up, written = sync_nameservers.sync(_Servers(10), self.resolver, self.store,
+                                               dry_run=True)
+    self.assertEqual((10, 10), (looked_up, written))
+    self.assertEqual([], self.store.puts)
+    self.assertEqual({}, self.store.entities)
+
+  def testDryRunLeavesStoredEntitiesAlone(self):
+    servers = _Servers(5)
+    sync_nameservers.sync(servers, self.resolver, self.store)
+    renamed = [(ip, 'Renamed', is_global) for (ip, name, is_global) in servers]
+    self.store.puts = []
+    self.assertEqual((5, 5), sync_nameservers.sync(renamed, self.resolver, self.store,
+                                                   update_all=True, dry_run=True))
+    self.assertEqual([], self.store.puts)
+    self.assertEqual(['Server %d' % i for i in range(1, 6)],
+                     sorted([x.name for x in self.store.entities.values()]))
+
+  def testPutsAreBatched(self):
+    count = sync_nameservers.PUT_BATCH_SIZE * 2 + 7
+    sync_nameservers.sync(_Servers(count), self.resolver, self.store, put_threads=3)
+    self.assertEqual([7, sync_nameservers.PUT_BATCH_SIZE, sync_nameservers.PUT_BATCH_SIZE],
+                     sorted(self.store.puts))
+    self.assertEqual(count, len(self.store.entities))
+
+
+if __name__ == '__main__':
+  unittest.main()
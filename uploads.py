@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+#
+# Copyright 2010 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Incremental decoding of namebench uploads.
+
+An upload is a JSON object whose 'nameservers' array holds most of the data.
+parse() decodes it a chunk at a time and hands every nameserver record to a
+callback as soon as it is complete, so the records can be compacted before
+the rest of the document has even been decompressed.
+
+Compressed uploads are cut off at MAX_DECOMPRESSED_SIZE, so that a small
+body cannot inflate into more than the instance can hold.
+"""
+import codecs
+import re
+import zlib
+
+from django.utils import simplejson
+
+CHUNK_SIZE = 65536
+# App Engine refuses request bodies past this, which bounded uploads before
+# they could be compressed.
+MAX_BODY_SIZE = 32 * 1024 * 1024
+MAX_DECOMPRESSED_SIZE = 3 * MAX_BODY_SIZE
+STREAMED_KEY = 'nameservers'
+
+_WHITESPACE = re.compile(r'\s*')
+# Accept both gzip and zlib headers.
+_AUTO_DETECT_WBITS = 32 + zlib.MAX_WBITS
+
+
+class UploadTooLarge(Exception):
+  """A compressed upload decompresses to more than allowed."""
+
+
+def iter_chunks(data, chunk_size=CHUNK_SIZE):
+  """Yield unicode chunks of an uncompressed UTF-8 string."""
+  decoder = codecs.getincrementaldecoder('utf-8')()
+  for start in range(0, len(data), chunk_size):
+    yield decoder.decode(data[start:start + chunk_size])
+  yield decoder.decode('', True)
+
+
+def iter_decompressed(data, chunk_size=CHUNK_SIZE, max_size=MAX_DECOMPRESSED_SIZE):
+  """Yield unicode chunks of a gzip or zlib compressed UTF-8 string.
+
+  Chunks are at most chunk_size bytes before decoding, however well the data
+  compresses.
+
+  Raises:
+    UploadTooLarge: once more than max_size bytes have been decompressed.
+  """
+  inflater = zlib.decompressobj(_AUTO_DETECT_WBITS)
+  decoder = codecs.getincrementaldecoder('utf-8')()
+  size = 0
+  for start in range(0, len(data), chunk_size):
+    pending = data[start:start + chunk_size]
+    while pending:
+      output = inflater.decompress(pending, chunk_size)
+      pending = inflater.unconsumed_tail
+      size += len(output)
+      if size > max_size:
+        raise UploadTooLarge('Upload decompresses to more than %d bytes' % max_size)
+      yield decoder.decode(output)
+  output = inflater.flush()
+  if size + len(output) > max_size:
+    raise UploadTooLarge('Upload decompresses to more than %d bytes' % max_size)
+  yield decoder.decode(output, True)
+
+
+class _Reader(object):
+  """A buffer over an iterator of text chunks, holding only unparsed text."""
+
+  def __init__(self, chunks):
+    self.chunks = iter(chunks)
+    self.buffer = u''
+    self.eof = False
+    self.decoder = simplejson.JSONDecoder()
+
+  def _fill(self):
+    for chunk in self.chunks:
+      if chunk:
+        self.buffer += chunk
+        return True
+    self.eof = True
+    return False
+
+  def peek(self):
+    """Return the next non-whitespace character, without consuming it."""
+    while True:
+      self.buffer = self.buffer[_WHITESPACE.match(self.buffer).end():]
+      if self.buffer:
+        return self.buffer[0]
+      if not self._fill():
+        raise ValueError('Unexpected end of upload')
+
+  def expect(self, chars):
+    char = self.peek()
+    if char not in chars:
+      raise ValueError('Expected one of %r in upload, found %r' % (chars, char))
+    self.buffer = self.buffer[1:]
+    return char
+
+  def value(self):
+    """Decode and consume the next JSON value."""
+    self.peek()
+    while True:
+      try:
+        value, end = self.decoder.raw_decode(self.buffer)
+      except ValueError:
+        if self._fill():
+          continue
+        raise
+      # A number at the end of the buffer may continue in the next chunk.
+      if end == len(self.buffer) and not self.eof and self._fill():
+        continue
+      self.buffer = self.buffer[end:]
+      return value
+
+
+def parse(chunks, transform=None):
+  """Decode an upload from an iterator of text chunks.
+
+  Args:
+    chunks: iterator of unicode strings, see iter_chunks and iter_decompressed.
+    transform: called with every nameserver record as soon as it is decoded;
+      its return value is stored instead of the record.
+
+  Returns:
+    The decoded upload, as a dict.
+  """
+  reader = _Reader(chunks)
+  data = {}
+  reader.expect('{')
+  if reader.peek() == '}':
+    reader.expect('}')
+    return data
+
+  while True:
+    key = reader.value()
+    reader.expect(':')
+    if key == STREAMED_KEY and reader.peek() == '[':
+      reader.expect('[')
+      records = []
+      if reader.peek() == ']':
+        reader.expect(']')
+      else:
+        while True:
+          record = reader.value()
+          if transform:
+            record = transform(record)
+          records.append(record)
+          if reader.expect(',]') == ']':
+            break
+      data[key] = records
+    else:
+      data[key] = reader.value()
+    if reader.expect(',}') == '}':
+      return data